@@ -7,5 +7,26 @@ class AbstractDump(ABC):
         pass
         
     @abstractmethod
-    def dump_strings(self, entries):
-        pass
\ No newline at end of file
+    def dump_strings(self, entries, package=None, version_code=None, version_name=None):
+        pass
+
+    def when_written(self, callback):
+        """
+        Calls callback once the entries dumped so far are written, e.g. to remove the apk they come from; right
+        away, unless the dump keeps entries in memory
+
+        :param callback: function without arguments; it may be called by another thread
+        """
+        callback()
+
+    def flush(self):
+        """
+        Writes the entries still kept in memory, if any
+        """
+        pass
+
+    def close(self):
+        """
+        Flushes the entries and releases the resources of the dump
+        """
+        self.flush()
@@ -1,10 +1,19 @@
 import datetime
 import glob
+import hashlib
 import itertools
+import json
 import logging
+import multiprocessing
 import os
 import subprocess
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import wait
+from concurrent.futures.process import BrokenProcessPool
 
+import api_key_detector
 import numpy as np
 from api_key_detector import string_classifier
 from api_key_detector.classifier_singleton import classifier
@@ -15,13 +24,47 @@ from api_key_detector.strings_filter_singleton import s_filter
 import config
 from my_model.lib_string import LibString
 from my_model.resource_string import ResourceString
+from my_tools.apk_results_cache import ApkResultsCache
+from my_tools.apk_trimmer import extract_native_libs, get_native_abis, write_trimmed_apk
+from my_tools.apktool_server import ApktoolServerError, ApktoolServerPool, java_command
 from my_tools.apktool_yml_parser import ApktoolYmlParser
+from my_tools.batch_predictor import BatchPredictor
+from my_tools.dex_parser import get_dex_strings
+from my_tools.elf_symbols import strings_with_symbols
+from my_tools.file_hash import file_sha256
+from my_tools.lib_frequency import LibFrequencyTable, export_blacklist
+from my_tools.lib_strings_cache import LibStringsCache
 from my_tools.manifest_parser import AndroidManifestXmlParser
-from my_tools.smali_parser import SmaliParser
+from my_tools.memoized import LRUCache
+from my_tools.smali_parser import iter_strings_from_files
 from my_tools.strings_tool import strings
 from my_tools.strings_xml_parser import AndroidStringsXmlParser
+from my_tools.unit_store import KIND_NATIVE, KIND_SMALI, KIND_STRINGS_XML, UnitStore
 
 LOCK_PREFIX = ".lock"
+# only the native libraries of the first architecture found in this list are analyzed, unless native_scan.all_abis
+ARC_PRIORITY_LIST = ["armeabi", "armeabi-v7a", "arm64-v8a", "x86", "x86_64", "mips", "mips64"]
+# type of the features given to the classifier
+FEATURES_DTYPE = np.float32
+# bumped whenever a change in the analysis changes its results, so that the stored results are not used anymore
+RESULTS_VERSION = 2
+# the configuration options (section, key) the results of an analysis depend on
+RESULTS_CONFIG = [("code_parser",), ("shared_object_sections",),
+                  ("native_scan", "all_abis"), ("native_scan", "symbols"),
+                  ("lib_auto_blacklist", "enabled"), ("lib_auto_blacklist", "threshold"),
+                  ("string_dedup", "enabled"), ("string_dedup", "keep")]
+# positions of the verdicts given to a string value, see get_verdict
+VERDICT_PRE_FILTER = 0
+VERDICT_PREDICTION = 1
+VERDICT_POST_FILTER = 2
+# starts the processes of the pools of workers: forking this process, while other threads (pipeline stages, batch
+# predictor, readers of the apktool servers) may be holding locks, could leave those locks held forever in the child
+PROCESS_CONTEXT = multiprocessing.get_context(
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn")
+# added to the sections in the key of the lib_strings_cache entries that include the symbols
+SYMBOLS_CACHE_KEY = "+symbols"
+# added to the sections in the key of the lib_strings_cache entries, followed by the fingerprint of api_key_detector
+DETECTOR_CACHE_KEY = "+detector "
 logging.getLogger("flufl.lock").setLevel(logging.CRITICAL)  # disable logging for lock module
 
 lib_blacklist = None
@@ -40,11 +83,12 @@ class ApkAnalysisError(Exception):
         return repr(self.value)
 
 
-def get_next_apk(apks_dir):
+def get_next_apk(apks_dir, exclude=None):
     """
     Gets the first available (not-locked) apk files and locks it
 
     :param apks_dir: directory to scan
+    :param exclude: paths of apks that should not be considered, e.g. because they are already being analyzed
     :return: a tuple containing the apk's path and the locked lock
     :rtype: (str, lockfile.LockFile)
     """
@@ -57,6 +101,8 @@ def get_next_apk(apks_dir):
         if not f.endswith(".apk"):
             continue
         f = os.path.join(apks_dir, f)
+        if exclude and f in exclude:
+            continue
         try:
             # lock file should not exist
             filename = f + LOCK_PREFIX
@@ -76,26 +122,151 @@ def get_next_apk(apks_dir):
 
 def analyze_strings(mystrings):
     """
-    A list of mystrings gets  classified and only the predicted API keys are returned
+    A list of mystrings gets  classified and only the predicted API keys are returned; with string_verdicts
+    enabled, the values already classified (in this or other apks) are not classified again
 
     :param mystrings: a list of mystrings to be analyzed
     :return: a list of valid api keys
     :rtype: list
     """
-    # for performance it's better to create a new list instead of removing elements from list
-    smali_strings_filtered = []
-    strings_features = []
-    for string in mystrings:
+    verdicts = get_string_verdicts()
+    if verdicts is None:
+        return list(itertools.compress(mystrings, predict_strings(mystrings)))
+    string_verdicts = [get_verdict(verdicts, mystring.value) for mystring in mystrings]
+    unknown = [i for i, verdict in enumerate(string_verdicts) if verdict[VERDICT_PREDICTION] is None]
+    for i, prediction in zip(unknown, predict_strings([mystrings[i] for i in unknown])):
+        string_verdicts[i][VERDICT_PREDICTION] = prediction
+    return [mystring for mystring, verdict in zip(mystrings, string_verdicts) if verdict[VERDICT_PREDICTION]]
+
+
+def predict_strings(mystrings):
+    """
+    :param mystrings: a list of mystrings
+    :return: for each string, whether it is predicted as an API key; the strings without features are not
+    :rtype: list of bool
+    """
+    features, mask = calculate_features_matrix(mystrings)
+    predictions = [False] * len(mystrings)
+    if features is None:
+        return predictions
+    predictor = get_batch_predictor()
+    if predictor is not None:
+        prediction = predictor.predict(features)
+    else:
+        prediction = classifier.predict(features)
+    for i, value in zip(np.flatnonzero(mask).tolist(), prediction):
+        predictions[i] = bool(value)
+    return predictions
+
+
+string_verdicts = None
+string_verdicts_lock = threading.Lock()
+
+
+def get_string_verdicts():
+    """
+    Gets the cache of the verdicts (pre filter, prediction, post filter) given to the string values, creating it on
+    first use
+
+    :return: the cache, or None if string_verdicts.enabled is false
+    :rtype: LRUCache
+    """
+    global string_verdicts
+    settings = config.string_verdicts
+    if not settings["enabled"]:
+        return None
+    with string_verdicts_lock:
+        if string_verdicts is None:
+            string_verdicts = LRUCache(settings["max_size"])
+        return string_verdicts
+
+
+def get_verdict(verdicts, value):
+    """
+    :param verdicts: the cache of the verdicts
+    :param value: value of a string
+    :return: the verdicts given to the value (see VERDICT_PRE_FILTER, VERDICT_PREDICTION, VERDICT_POST_FILTER),
+             None for the ones not given yet; the list is shared by all the strings with this value
+    :rtype: list
+    """
+    verdict = verdicts.get(value)
+    if verdict is None:
+        verdict = [None, None, None]
+        verdicts.put(value, verdict)
+    return verdict
+
+
+def pre_filter(mystring):
+    """
+    Same as s_filter.pre_filter_mystring, remembering the result for the value if string_verdicts is enabled
+    """
+    verdicts = get_string_verdicts()
+    if verdicts is None:
+        return s_filter.pre_filter_mystring(mystring)
+    verdict = get_verdict(verdicts, mystring.value)
+    if verdict[VERDICT_PRE_FILTER] is None:
+        verdict[VERDICT_PRE_FILTER] = s_filter.pre_filter_mystring(mystring)
+    return verdict[VERDICT_PRE_FILTER]
+
+
+def post_filter(mystring):
+    """
+    Same as s_filter.post_filter_mystring, remembering the result for the value if string_verdicts is enabled
+    """
+    verdicts = get_string_verdicts()
+    if verdicts is None:
+        return s_filter.post_filter_mystring(mystring)
+    verdict = get_verdict(verdicts, mystring.value)
+    if verdict[VERDICT_POST_FILTER] is None:
+        verdict[VERDICT_POST_FILTER] = s_filter.post_filter_mystring(mystring)
+    return verdict[VERDICT_POST_FILTER]
+
+
+def calculate_features_matrix(mystrings):
+    """
+    Calculates the features of the strings, writing them directly into a preallocated matrix
+
+    :param mystrings: a list of mystrings
+    :return: the matrix, with a row for each string that has features (None if no string has them), and a mask
+             telling which strings have features
+    :rtype: tuple
+    """
+    mask = np.zeros(len(mystrings), dtype=bool)
+    matrix = None
+    rows = 0
+    for i, string in enumerate(mystrings):
         features = string_classifier.calculate_all_features(string.value)
-        if features:
-            features_list = list(features)
-            smali_strings_filtered.append(string)
-            strings_features.append(features_list)
-    if len(strings_features) > 0:
-        prediction = classifier.predict(np.array(strings_features))
-        api_keys_strings = itertools.compress(smali_strings_filtered, prediction)  # basically a bitmask
-        return api_keys_strings
-    return []
+        if not features:
+            continue
+        if matrix is None:
+            matrix = np.empty((len(mystrings) - i, len(features)), dtype=FEATURES_DTYPE)
+        matrix[rows] = features
+        rows += 1
+        mask[i] = True
+    if matrix is None:
+        return None, mask
+    return matrix[:rows], mask
+
+
+batch_predictor = None
+batch_predictor_lock = threading.Lock()
+
+
+def get_batch_predictor():
+    """
+    Gets the predictor that classifies the strings of different apks together, starting it on first use
+
+    :return: the predictor, or None if batch_classifier.enabled is false
+    :rtype: BatchPredictor
+    """
+    global batch_predictor
+    settings = config.batch_classifier
+    if not settings["enabled"]:
+        return None
+    with batch_predictor_lock:
+        if batch_predictor is None:
+            batch_predictor = BatchPredictor(classifier.predict, settings["max_batch_size"], settings["max_wait"])
+        return batch_predictor
 
 
 def extract_metadata_resource(manifest_parser):
@@ -107,11 +278,12 @@ def extract_metadata_resource(manifest_parser):
     return metadata_resources
 
 
-def extract_strings_resource(decoded_apk_folder):
+def extract_strings_resource(decoded_apk_folder, package=None):
     """
     Extracts all Android's string resources from a decoded apk
 
     :param decoded_apk_folder: folder that contains the decoded apk
+    :param package: name of the app (e.g. com.example.myapp); needed by the incremental mode
     :return: a list of resource strings
     :rtype: list of ResourceString
     """
@@ -119,18 +291,38 @@ def extract_strings_resource(decoded_apk_folder):
     if not os.path.exists(strings_path):
         logging.error("Strings resource file not found in {0}".format(decoded_apk_folder))
         return []
+    store = get_unit_store() if package else None
+    if store is not None:
+        digest = file_sha256(strings_path)
+        stored = store.get_units(get_unit_store_key(package), KIND_STRINGS_XML, [digest])
+        if digest in stored:
+            logging.debug("strings.xml of {0} already analyzed in a previous version".format(package))
+            return stored[digest]
+    resources_filtered = parse_strings_resource(strings_path)
+    if store is not None:
+        store.put_units(get_unit_store_key(package), KIND_STRINGS_XML, {digest: resources_filtered})
+    return resources_filtered
+
+
+def parse_strings_resource(strings_path):
+    """
+    :param strings_path: path of a strings.xml file
+    :return: the resource strings that pass the pre filter
+    :rtype: list of ResourceString
+    """
     strings_parser = AndroidStringsXmlParser(strings_path)
-    resource_strings = strings_parser.get_string_resources(s_filter.pre_filter_mystring)
+    resource_strings = strings_parser.get_string_resources(pre_filter)
     resources_filtered = []
     for resource in resource_strings:
-        if s_filter.pre_filter_mystring(resource):
+        if pre_filter(resource):
             resources_filtered.append(resource)
     return resources_filtered
 
 
 def extract_smali_strings(decoded_apk_folder, package, manifest_parser):
     """
-    Extracts the strings contained in the smali files from a decoded apk
+    Extracts the strings contained in the smali files from a decoded apk; if code_parser is "dex" and apktool
+    left the dex files undecoded, the strings are read directly from the dex files instead
 
     :param decoded_apk_folder: folder that contains the decoded apk
     :param package: name of the app (e.g. com.example.myapp)
@@ -144,6 +336,8 @@ def extract_smali_strings(decoded_apk_folder, package, manifest_parser):
         main_activity = package
     package_pieces = main_activity.split(".")[:-1]
     package_pieces = package_pieces[:2]
+    if config.code_parser == "dex" and glob.glob(os.path.join(decoded_apk_folder, "classes*.dex")):
+        return extract_dex_strings(decoded_apk_folder, package, package_pieces)
     # if, for example, we have a package named 'com.team.example', to avoid looking in countless library files,
     # we must search for smali files in paths like:
     #
@@ -168,64 +362,597 @@ def extract_smali_strings(decoded_apk_folder, package, manifest_parser):
     source_path = os.path.join(source_path, '**')
     source_path = os.path.join(source_path, '*.smali')
 
-    smali_strings = []
-    source_identified = False
-    for filename in glob.iglob(source_path, recursive=True):
-        source_identified = True
-        parser = SmaliParser(filename)
-        smalis = parser.get_strings()
-        smalis_filtered = []
-        for smali_string in smalis:
-            if s_filter.pre_filter_mystring(smali_string):
-                smalis_filtered.append(smali_string)
-        smali_strings += smalis_filtered
-    if not source_identified:
+    # sorted, so that the strings always come out in the same order
+    filenames = sorted(glob.iglob(source_path, recursive=True))
+    if not filenames:
         logging.error("Unable to determine source folder in {0}".format(package))
         return []
+    store = get_unit_store()
+    if store is not None:
+        smali_strings, skipped = parse_smali_files_incremental(store, package, filenames)
+    else:
+        smali_strings = []
+        skipped = 0
+        for smalis, chunk_skipped in parse_smali_files(filenames):
+            smali_strings += smalis
+            skipped += chunk_skipped
+    if skipped:
+        logging.info("{0} of {1} smali files in {2} skipped, no strings in them".format(skipped, len(filenames),
+                                                                                       package))
     return smali_strings
 
 
-def extract_native_strings(decoded_apk_folder):
+smali_executor = None
+smali_executor_lock = threading.Lock()
+
+
+def get_smali_executor():
+    """
+    Gets the pool of smali parsing processes of this process, creating it on first use
+
+    :rtype: ProcessPoolExecutor
+    """
+    global smali_executor
+    with smali_executor_lock:
+        if smali_executor is None:
+            smali_executor = ProcessPoolExecutor(config.smali_parser["workers"], mp_context=PROCESS_CONTEXT)
+        return smali_executor
+
+
+def get_pre_filtered_strings(smali_files):
+    """
+    Parses smali files (e.g. a chunk of files given to a worker process), keeping only the strings that pass
+    the pre filter; the strings are filtered as they are found, without listing all of them first
+
+    :param smali_files: paths of the smali files
+    :return: the strings that passed the pre filter, in the same order as the files, and the number of files
+             skipped by the prescan (see smali_parser.prescan)
+    :rtype: tuple
+    """
+    skipped_files = []
+    smali_strings = [smali_string for smali_string in
+                     iter_strings_from_files(smali_files, config.smali_parser["prescan"], skipped_files)
+                     if pre_filter(smali_string)]
+    return smali_strings, len(skipped_files)
+
+
+def get_pre_filtered_strings_by_file(smali_files):
     """
-    Extract the strings contained in the native libraries found in a decoded apk
+    Same as get_pre_filtered_strings, but the strings of each file are listed apart
+
+    :param smali_files: paths of the smali files
+    :return: for each file, the strings that passed the pre filter, and the number of files skipped by the prescan
+    :rtype: tuple
+    """
+    skipped_files = []
+    by_file = []
+    for smali_file in smali_files:
+        by_file.append([smali_string for smali_string in
+                        iter_strings_from_files([smali_file], config.smali_parser["prescan"], skipped_files)
+                        if pre_filter(smali_string)])
+    return by_file, len(skipped_files)
+
+
+def parse_smali_files(filenames, parse=get_pre_filtered_strings):
+    """
+    Parses smali files; if smali_parser.workers is greater than 1, chunks of smali_parser.chunk_size files are
+    parsed in parallel by a pool of processes
+
+    :param filenames: paths of the smali files
+    :param parse: function parsing a chunk of files, get_pre_filtered_strings or get_pre_filtered_strings_by_file
+    :return: for each chunk of files, in the same order as the files, the result of parse
+    :rtype: list of tuple
+    """
+    global smali_executor
+    settings = config.smali_parser
+    chunk_size = max(1, settings["chunk_size"])
+    chunks = [filenames[i:i + chunk_size] for i in range(0, len(filenames), chunk_size)]
+    if settings["workers"] > 1 and len(chunks) > 1:
+        try:
+            # map returns the results in the order of the chunks, whatever the order they are parsed in
+            return list(get_smali_executor().map(parse, chunks))
+        except BrokenProcessPool as e:
+            logging.error("Smali parsing process died, parsing the files in this process; {0}".format(e))
+            with smali_executor_lock:
+                smali_executor = None
+    return [parse(chunk) for chunk in chunks]
+
+
+def parse_smali_files_incremental(store, package, filenames):
+    """
+    Parses only the smali files not found in the previous versions of the package, taking the strings of the
+    others from the unit store
+
+    :param store: UnitStore
+    :param package: name of the app (e.g. com.example.myapp)
+    :param filenames: paths of the smali files
+    :return: the strings that passed the pre filter, in the same order as the files, and the number of files
+             skipped by the prescan
+    :rtype: tuple
+    """
+    key = get_unit_store_key(package)
+    digests = [file_sha256(filename) for filename in filenames]
+    stored = store.get_units(key, KIND_SMALI, digests)
+    missing = [(filename, digest) for filename, digest in zip(filenames, digests) if digest not in stored]
+    logging.info("{0} of {1} smali files in {2} already analyzed in previous versions".format(
+        len(filenames) - len(missing), len(filenames), package))
+    skipped = 0
+    if missing:
+        by_file = []
+        for file_strings, chunk_skipped in parse_smali_files([filename for filename, _ in missing],
+                                                             get_pre_filtered_strings_by_file):
+            by_file += file_strings
+            skipped += chunk_skipped
+        parsed = dict(zip((digest for _, digest in missing), by_file))
+        store.put_units(key, KIND_SMALI, parsed)
+        stored.update(parsed)
+    smali_strings = []
+    for digest in digests:
+        smali_strings += stored[digest]
+    return smali_strings, skipped
+
+
+def extract_dex_strings(decoded_apk_folder, package, package_pieces):
+    """
+    Extracts the strings contained in the dex files of an apk decoded without sources (apktool d -s)
+
+    :param decoded_apk_folder: folder that contains the decoded apk
+    :param package: name of the app (e.g. com.example.myapp)
+    :param package_pieces: only the classes in this package (and sub packages) are analyzed, as for smali files
+    :return: a list of strings
+    :rtype: list of SmaliString
+    """
+    class_prefix = "L" + "".join(piece + "/" for piece in package_pieces)
+    dex_strings, source_identified = get_dex_strings(decoded_apk_folder, class_prefix)
+    if not source_identified:
+        logging.error("Unable to determine source classes in {0}".format(package))
+        return []
+    dex_strings_filtered = []
+    for dex_string in dex_strings:
+        if pre_filter(dex_string):
+            dex_strings_filtered.append(dex_string)
+    return dex_strings_filtered
+
+
+def extract_native_strings(decoded_apk_folder, package=None):
+    """
+    Extract the strings contained in the native libraries found in a decoded apk; if native_scan.all_abis is true,
+    the libraries of all the architectures are searched and each value is returned once, along with all the
+    libraries it was found in
 
     :param decoded_apk_folder: folder that contains the decoded apk
+    :param package: name of the app (e.g. com.example.myapp); needed by lib_auto_blacklist
     :return: a list of strings
     :rtype: list of LibString
     """
-    lib_strings = set()
     lib_path = os.path.join(decoded_apk_folder, "lib")
-    if os.path.exists(lib_path):
-        path_to_be_inspected = None
-        arc_priority_list = ["armeabi", "armeabi-v7a", "arm64-v8a", "x86", "x86_64", "mips", "mips64"]
-        for arc in arc_priority_list:
-            if os.path.exists(os.path.join(lib_path, arc)):
-                path_to_be_inspected = os.path.join(lib_path, arc)
-                break
-        if path_to_be_inspected:
-            for filename in glob.iglob(path_to_be_inspected + '/**/*.so', recursive=True):
-                logging.debug("Found shared object lib: {0}".format(filename))
-                base_filename = os.path.basename(filename)
-                if base_filename in lib_blacklist:
-                    # if the library is a generic one, we can safely ignore it
-                    # since it would probably not contain any interesting information
+    if not os.path.exists(lib_path):
+        return []
+    abis = [arc for arc in ARC_PRIORITY_LIST if os.path.exists(os.path.join(lib_path, arc))]
+    all_abis = config.native_scan["all_abis"]
+    if not all_abis:
+        abis = abis[:1]
+    # (abi/library, library name, path, digest) of the libraries to be searched
+    libs = []
+    for abi in abis:
+        # sorted, so that the strings always come out in the same order
+        for filename in sorted(glob.iglob(os.path.join(lib_path, abi) + '/**/*.so', recursive=True)):
+            logging.debug("Found shared object lib: {0}".format(filename))
+            base_filename = os.path.basename(filename)
+            if base_filename in lib_blacklist:
+                # if the library is a generic one, we can safely ignore it
+                # since it would probably not contain any interesting information
+                continue
+            digest = None
+            if package and config.lib_auto_blacklist["enabled"]:
+                digest = file_sha256(filename)
+                packages = get_lib_frequency_table().record(digest, package, base_filename)
+                if packages >= config.lib_auto_blacklist["threshold"]:
+                    logging.debug("Skipping {0}, found in {1} packages".format(filename, packages))
                     continue
-                try:
-                    for string in strings(filename, config.shared_object_sections, 4):
-                        lib_string = LibString(base_filename, string)
-                        if s_filter.pre_filter_mystring(lib_string):
-                            lib_strings.add(lib_string)
-                except (ELFError, ValueError) as e:
-                    logging.error(str(e))
+            libs.append(("{0}/{1}".format(abi, base_filename), base_filename, filename, digest))
+    store = get_unit_store() if package else None
+    if store is not None:
+        results = scan_native_libs_incremental(store, package, [(filename, digest) for _, _, filename, digest in libs])
+    else:
+        results = scan_native_libs([(filename, digest) for _, _, filename, digest in libs])
+    symbols = config.native_scan["symbols"]
+    lib_strings = []
+    # when searching all the architectures, the strings already found, by value
+    found = {}
+    for (location, base_filename, _, _), values in zip(libs, results):
+        for value, symbol in values or []:
+            if not all_abis:
+                lib_string = LibString(base_filename, value)
+                if symbols:
+                    # null for the strings not held by any symbol, but always there
+                    lib_string.symbol = symbol
+                lib_strings.append(lib_string)
+                continue
+            lib_string = found.get(value)
+            if lib_string is None:
+                lib_string = found[value] = LibString(base_filename, value, [location])
+                if symbols:
+                    lib_string.symbol = symbol
+                lib_strings.append(lib_string)
+            else:
+                if location not in lib_string.locations:
+                    lib_string.locations.append(location)
+                if symbols and lib_string.symbol is None:
+                    lib_string.symbol = symbol
     return lib_strings
 
 
-def analyze_decoded_apk(decoded_apk_folder):
+native_executor = None
+native_executor_lock = threading.Lock()
+
+
+def get_native_executor():
     """
-    Given a decoded apk (e.g. decoded using apktool), analyzes its content to extract API keys
+    Gets the pool of threads (or processes, see native_scan.executor) searching native libraries, creating it on
+    first use
+
+    :rtype: Executor
+    """
+    global native_executor
+    with native_executor_lock:
+        if native_executor is None:
+            if config.native_scan["executor"] == "process":
+                native_executor = ProcessPoolExecutor(config.native_scan["workers"], mp_context=PROCESS_CONTEXT)
+            else:
+                native_executor = ThreadPoolExecutor(config.native_scan["workers"])
+        return native_executor
+
+
+def discard_native_executor(executor, terminate=False):
+    """
+    Drops a pool returned by get_native_executor, so that the next libraries are searched by a new one
+
+    :param executor: the pool; if another thread has already replaced it, the new pool is kept
+    :param terminate: if True, the workers of a pool of processes are killed, along with the searches they are
+                      running; threads can't be, they are left to complete their search
+    """
+    global native_executor
+    with native_executor_lock:
+        if native_executor is executor:
+            native_executor = None
+    # noinspection PyProtectedMember
+    processes = list((getattr(executor, "_processes", None) or {}).values()) if terminate else []
+    executor.shutdown(wait=False)
+    for process in processes:
+        if process.is_alive():
+            process.terminate()
+
+
+def try_get_lib_strings(filename, digest=None):
+    """
+    Same as get_lib_strings, but logs the errors of malformed libraries instead of raising them
+
+    :return: (value, symbol name or None) tuples, or None if the library couldn't be searched
+    :rtype: list of tuple
+    """
+    try:
+        return get_lib_strings(filename, digest)
+    except (ELFError, ValueError) as e:
+        logging.error("{0}: {1}".format(filename, e))
+        return None
+
+
+def scan_native_libs(libs):
+    """
+    Searches native libraries, in parallel if native_scan.workers is greater than 1. If native_scan.timeout is
+    set, the libraries are searched by the pool of workers even when there is one worker, and the ones not searched
+    within native_scan.timeout seconds from when they were submitted are given up; the pool is then replaced, so
+    that the stuck searches can't hold up the next libraries
+
+    :param libs: (path, digest or None) tuples
+    :return: for each library, in the same order, the result of try_get_lib_strings
+    :rtype: list
+    """
+    settings = config.native_scan
+    timeout = settings["timeout"] or None
+    if libs and (timeout is not None or (settings["workers"] > 1 and len(libs) > 1)):
+        executor, futures = submit_lib_searches(libs)
+        if futures is not None:
+            try:
+                _, not_done = wait(futures, timeout)
+                results = []
+                for future, (filename, _) in zip(futures, libs):
+                    if future in not_done:
+                        logging.error("{0} not searched in {1} seconds, skipped".format(filename, timeout))
+                        future.cancel()
+                        results.append(None)
+                    else:
+                        results.append(future.result())
+                if not_done:
+                    discard_native_executor(executor, terminate=True)
+                return results
+            except BrokenProcessPool as e:
+                logging.error("Native library process died, searching the libraries in this process; {0}".format(e))
+                discard_native_executor(executor)
+    return [try_get_lib_strings(filename, digest) for filename, digest in libs]
+
+
+def submit_lib_searches(libs):
+    """
+    :param libs: (path, digest or None) tuples
+    :return: the pool of workers and a future of try_get_lib_strings for each library; no futures if the
+             libraries can't be submitted
+    :rtype: tuple
+    """
+    executor = None
+    for _ in range(2):
+        executor = get_native_executor()
+        try:
+            return executor, [executor.submit(try_get_lib_strings, filename, digest) for filename, digest in libs]
+        except RuntimeError as e:
+            # the pool is broken, or has just been shut down by another thread: try again with a new one
+            logging.error("Unable to submit the native libraries; {0}".format(e))
+            discard_native_executor(executor)
+    return executor, None
+
+
+def scan_native_libs_incremental(store, package, libs):
+    """
+    Searches only the native libraries not found in the previous versions of the package, taking the strings of
+    the others from the unit store
+
+    :param store: UnitStore
+    :param package: name of the app (e.g. com.example.myapp)
+    :param libs: (path, digest or None) tuples
+    :return: for each library, in the same order, the result of try_get_lib_strings
+    :rtype: list
+    """
+    key = get_unit_store_key(package)
+    libs = [(filename, digest or file_sha256(filename)) for filename, digest in libs]
+    stored = store.get_units(key, KIND_NATIVE, [digest for _, digest in libs])
+    missing = [(filename, digest) for filename, digest in libs if digest not in stored]
+    logging.info("{0} of {1} native libraries in {2} already analyzed in previous versions".format(
+        len(libs) - len(missing), len(libs), package))
+    # the libraries that couldn't be searched are not stored, they are tried again with the next version
+    scanned = dict((digest, values) for (_, digest), values in zip(missing, scan_native_libs(missing))
+                   if values is not None)
+    store.put_units(key, KIND_NATIVE, scanned)
+    stored.update(scanned)
+    return [stored.get(digest) for _, digest in libs]
+
+
+lib_strings_cache = None
+lib_strings_cache_lock = threading.Lock()
+
+
+def get_lib_strings_cache():
+    """
+    Gets the persistent cache of the strings of native libraries, opening it on first use
+
+    :return: the cache, or None if lib_strings_cache.enabled is false
+    :rtype: LibStringsCache
+    """
+    global lib_strings_cache
+    settings = config.lib_strings_cache
+    if not settings["enabled"]:
+        return None
+    with lib_strings_cache_lock:
+        if lib_strings_cache is None:
+            lib_strings_cache = LibStringsCache(settings["path"], int(settings["max_size_mb"] * 1024 * 1024))
+        return lib_strings_cache
+
+
+lib_frequency_table = None
+lib_frequency_table_lock = threading.Lock()
+
+
+def get_lib_frequency_table():
+    """
+    Gets the table that counts the packages each native library was found in, opening it on first use
+
+    :rtype: LibFrequencyTable
+    """
+    global lib_frequency_table
+    with lib_frequency_table_lock:
+        if lib_frequency_table is None:
+            lib_frequency_table = LibFrequencyTable(config.lib_auto_blacklist["path"])
+        return lib_frequency_table
+
+
+def export_lib_blacklist(blacklist_file):
+    """
+    Writes the native libraries found in at least lib_auto_blacklist.threshold different packages to a blacklist
+    file (see lib_blacklists)
+
+    :param blacklist_file: path of the file to be written
+    :return: the number of libraries written
+    :rtype: int
+    """
+    return export_blacklist(get_lib_frequency_table(), config.lib_auto_blacklist["threshold"], blacklist_file)
+
+
+apk_results_cache = None
+results_fingerprint = None
+apk_results_cache_lock = threading.Lock()
+
+
+def get_apk_results_cache():
+    """
+    Gets the persistent store of the results of whole apks, opening it on first use
+
+    :return: the store, or None if apk_results_cache.enabled is false
+    :rtype: ApkResultsCache
+    """
+    global apk_results_cache
+    settings = config.apk_results_cache
+    if not settings["enabled"]:
+        return None
+    with apk_results_cache_lock:
+        if apk_results_cache is None:
+            max_age = settings["max_age_days"] * 24 * 60 * 60 if settings["max_age_days"] else None
+            apk_results_cache = ApkResultsCache(settings["path"], int(settings["max_size_mb"] * 1024 * 1024),
+                                                max_age)
+        return apk_results_cache
+
+
+def get_results_fingerprint():
+    """
+    Fingerprint of everything, apart from the apk, the results of an analysis depend on: the api_key_detector
+    package (classifier model and filters), the contents of the lib_blacklists and the configuration options that
+    change the results (RESULTS_CONFIG); computed once for each process
+
+    :rtype: str
+    """
+    global results_fingerprint
+    with apk_results_cache_lock:
+        if results_fingerprint is None:
+            digest = hashlib.sha256()
+            digest.update("version {0}\n".format(RESULTS_VERSION).encode())
+            for option in RESULTS_CONFIG:
+                value = getattr(config, option[0])
+                for key in option[1:]:
+                    value = value[key]
+                digest.update("{0} {1}\n".format(".".join(option), json.dumps(value)).encode())
+            for txt in config.lib_blacklists or []:
+                digest.update("blacklist {0}\n".format(file_sha256(txt)).encode())
+            _hash_detector_package(digest)
+            results_fingerprint = digest.hexdigest()
+        return results_fingerprint
+
+
+def _hash_detector_package(digest):
+    """
+    Adds the files of the api_key_detector package (classifier model and filters) to a hash
+    """
+    package_folder = os.path.dirname(api_key_detector.__file__)
+    for folder, folders, files in os.walk(package_folder):
+        folders[:] = sorted(f for f in folders if f != "__pycache__")
+        for name in sorted(files):
+            path = os.path.join(folder, name)
+            digest.update("{0} {1}\n".format(os.path.relpath(path, package_folder), file_sha256(path)).encode())
+
+
+detector_fingerprint = None
+detector_fingerprint_lock = threading.Lock()
+
+
+def get_detector_fingerprint():
+    """
+    Fingerprint of the api_key_detector package, whose filters decide which strings are kept; computed once for
+    each process
+
+    :rtype: str
+    """
+    global detector_fingerprint
+    with detector_fingerprint_lock:
+        if detector_fingerprint is None:
+            digest = hashlib.sha256()
+            _hash_detector_package(digest)
+            detector_fingerprint = digest.hexdigest()
+        return detector_fingerprint
+
+
+def get_stored_results(apk_path):
+    """
+    Looks for the results of an identical apk in the apk results cache
+
+    :param apk_path: path of the apk
+    :return: the SHA-256 of the apk (None if the cache is disabled) and the stored results of analyze_apk (None if
+             not found)
+    :rtype: tuple
+    """
+    cache = get_apk_results_cache()
+    if cache is None:
+        return None, None
+    digest = file_sha256(apk_path)
+    return digest, cache.get(digest, get_results_fingerprint())
+
+
+def store_results(digest, results):
+    """
+    Stores the results of analyze_apk in the apk results cache
+
+    :param digest: SHA-256 of the apk, as returned by get_stored_results; if None, nothing is stored
+    :param results: the results of analyze_apk
+    """
+    cache = get_apk_results_cache()
+    if cache is not None and digest is not None and results is not None:
+        cache.put(digest, get_results_fingerprint(), results)
+
+
+unit_store = None
+unit_store_lock = threading.Lock()
+
+
+def get_unit_store():
+    """
+    Gets the store of the units (smali files, strings.xml, native libraries) of the previous versions of the
+    packages, opening it on first use; the units not used for incremental.max_age_days are pruned when opened
+
+    :return: the store, or None if incremental.enabled is false
+    :rtype: UnitStore
+    """
+    global unit_store
+    settings = config.incremental
+    if not settings["enabled"]:
+        return None
+    with unit_store_lock:
+        if unit_store is None:
+            unit_store = UnitStore(settings["path"])
+            if settings["max_age_days"]:
+                units, verdicts = unit_store.prune(settings["max_age_days"] * 24 * 60 * 60)
+                logging.debug("Pruned {0} units and {1} verdicts from the unit store".format(units, verdicts))
+        return unit_store
+
+
+def get_unit_store_key(package):
+    """
+    :param package: name of the app (e.g. com.example.myapp)
+    :return: the key of the units and verdicts of the package in the unit store; units and verdicts stored with
+             another classifier or configuration (see get_results_fingerprint) are not used
+    :rtype: str
+    """
+    return "{0} {1}".format(package, get_results_fingerprint())
+
+
+def get_lib_strings(filename, digest=None):
+    """
+    Finds the strings in the sections (see shared_object_sections) of a native library that pass the pre filter,
+    along with the symbol that holds each of them if native_scan.symbols is true; if lib_strings_cache.enabled is
+    true, identical libraries are searched only once
+
+    :param filename: path of the native library
+    :param digest: SHA-256 of the library, if already known
+    :return: (value, symbol name or None) tuples
+    :rtype: list of tuple
+    """
+    symbols = config.native_scan["symbols"]
+    sections = config.shared_object_sections
+    cache = get_lib_strings_cache()
+    if cache:
+        # the strings found with their symbols are cached apart from the plain ones; the strings kept depend on the
+        # pre filter, so another api_key_detector doesn't use them
+        cache_key = (sections or []) + ([SYMBOLS_CACHE_KEY] if symbols else []) + [
+            DETECTOR_CACHE_KEY + get_detector_fingerprint()]
+        digest = digest or file_sha256(filename)
+        values = cache.get(digest, cache_key)
+        if values is not None:
+            logging.debug("Strings of {0} found in cache".format(filename))
+            return [tuple(value) for value in values] if symbols else [(value, None) for value in values]
+    name = os.path.basename(filename)
+    if symbols:
+        found = strings_with_symbols(filename, sections, 4)
+    else:
+        found = ((string, None) for string in strings(filename, sections, 4))
+    values = [(string, symbol) for string, symbol in found if pre_filter(LibString(name, string))]
+    if cache:
+        cache.put(digest, cache_key, values if symbols else [value for value, _ in values])
+    return values
+
+
+def extract_decoded_apk(decoded_apk_folder):
+    """
+    Given a decoded apk (e.g. decoded using apktool), extracts all the strings that could be API keys
 
     :param decoded_apk_folder: folder that contains the decoded apk
-    :return: a list of api keys found, the name of the package, the version code and the version name
+    :return: the extracted strings, the name of the package, the version code and the version name;
+             None if the folder doesn't contain a valid decoded apk
     """
     manifest = os.path.join(decoded_apk_folder, "AndroidManifest.xml")
     if not os.path.exists(manifest):
@@ -249,26 +976,130 @@ def analyze_decoded_apk(decoded_apk_folder):
         except (IOError, ValueError) as e:
             logging.error("Unable to parse apktool.yml; {0}".format(e))
     extracted = extract_metadata_resource(manifest_parser)
-    extracted += extract_strings_resource(decoded_apk_folder)
+    extracted += extract_strings_resource(decoded_apk_folder, package)
     extracted += extract_smali_strings(decoded_apk_folder, package, manifest_parser)
-    extracted += extract_native_strings(decoded_apk_folder)
-    apikey_strings = analyze_strings(extracted)
+    extracted += extract_native_strings(decoded_apk_folder, package)
+    if config.string_dedup["enabled"] and config.string_dedup["keep"] == "first":
+        extracted = dedup_strings(extracted)
+    return extracted, package, version_code, version_name
+
+
+def find_apikeys(extracted, package=None):
+    """
+    Classifies the extracted strings and post-filters the ones predicted as API keys; if string_dedup.enabled is
+    true, each value is classified once and the verdict is given to all the strings with that value. In incremental
+    mode, the values already classified in the previous versions of the package are not classified again
+
+    :param extracted: a list of mystrings, as returned by extract_decoded_apk
+    :param package: name of the app (e.g. com.example.myapp); needed by the incremental mode
+    :return: a list of api keys
+    :rtype: list
+    """
+    store = get_unit_store() if package else None
+    if config.string_dedup["enabled"] or store is not None:
+        unique = dedup_strings(extracted)
+        known = {}
+        if store is not None:
+            known = store.get_verdicts(get_unit_store_key(package), [mystring.value for mystring in unique])
+            unique = [mystring for mystring in unique if mystring.value not in known]
+        apikey_values = set(mystring.value for mystring in analyze_strings(unique))
+        if store is not None:
+            store.put_verdicts(get_unit_store_key(package),
+                               dict((mystring.value, mystring.value in apikey_values) for mystring in unique))
+            apikey_values.update(value for value, prediction in known.items() if prediction)
+        apikey_strings = [mystring for mystring in extracted if mystring.value in apikey_values]
+    else:
+        apikey_strings = analyze_strings(extracted)
     apikey_postfiltered = []
     for mystring in apikey_strings:
-        if s_filter.post_filter_mystring(mystring):
+        if post_filter(mystring):
             apikey_postfiltered.append(mystring)
-    return apikey_postfiltered, extracted, package, version_code, version_name
+    verdicts = get_string_verdicts()
+    if verdicts is not None:
+        logging.debug("String verdicts: {0} hits, {1} misses, {2} values".format(*verdicts.get_stats()))
+    return apikey_postfiltered
 
 
-def decode_apk(apk_path, output_path, apktool_path):
+def dedup_strings(mystrings):
+    """
+    :param mystrings: a list of mystrings
+    :return: the first string with each value, in the same order
+    :rtype: list
+    """
+    values = set()
+    unique = []
+    for mystring in mystrings:
+        if mystring.value not in values:
+            values.add(mystring.value)
+            unique.append(mystring)
+    return unique
+
+
+def analyze_decoded_apk(decoded_apk_folder):
+    """
+    Given a decoded apk (e.g. decoded using apktool), analyzes its content to extract API keys
+
+    :param decoded_apk_folder: folder that contains the decoded apk
+    :return: a list of api keys found, the name of the package, the version code and the version name
     """
-    Decodes an apk using the external apktool tool
+    result = extract_decoded_apk(decoded_apk_folder)
+    if not result:
+        return
+    extracted, package, version_code, version_name = result
+    return find_apikeys(extracted, package), extracted, package, version_code, version_name
+
+
+apktool_servers = None
+apktool_servers_unavailable = False
+apktool_servers_lock = threading.Lock()
+
+
+def get_apktool_servers(apktool_path):
+    """
+    Gets the pool of apktool servers of this process, creating it on first use
+
+    :param apktool_path: where apktool.jar resides
+    :return: the pool, or None if the servers can't be used
+    :rtype: ApktoolServerPool
+    """
+    global apktool_servers, apktool_servers_unavailable
+    with apktool_servers_lock:
+        if apktool_servers is None and not apktool_servers_unavailable:
+            settings = config.apktool_server
+            try:
+                apktool_servers = ApktoolServerPool(java_command(apktool_path), settings["instances"],
+                                                    request_timeout=settings["decode_timeout"])
+            except ApktoolServerError as e:
+                logging.error("Unable to use apktool server; {0}".format(e))
+                apktool_servers_unavailable = True
+    if apktool_servers is None or apktool_servers.broken:
+        return None
+    return apktool_servers
+
+
+def run_apktool(apk_path, output_path, apktool_path, options=()):
+    """
+    Decodes an apk using the external apktool tool; if enabled, one of the long-lived apktool servers is used,
+    otherwise (or if the server fails) a new apktool process is started
 
     :param apk_path: path of the apk to be decoded
     :param output_path: decoded apk folder
     :param apktool_path: where apktool.jar resides
+    :param options: additional apktool decode options
     """
-    completed_process = subprocess.run(["java", "-jar", apktool_path, "d", apk_path, "-o", output_path, "-f"],
+    if config.apktool_server["enabled"]:
+        servers = get_apktool_servers(apktool_path)
+        if servers is not None:
+            try:
+                output = servers.decode(apk_path, output_path, options)
+                if output:
+                    logging.info('Apktool: \n{0}'.format(output))
+                return
+            except ApktoolServerError as e:
+                logging.error("Apktool server failed to decode {0}, retrying with a new apktool process; {1}".format(
+                    apk_path, e))
+    completed_process = subprocess.run(["java", "-jar", apktool_path, "d", apk_path, "-o", output_path, "-f"] +
+                                       list(options),
                                        stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
     if completed_process.stdout:
         logging.info('Apktool: \n{0}'.format(completed_process.stdout))
@@ -277,20 +1108,87 @@ def decode_apk(apk_path, output_path, apktool_path):
     completed_process.check_returncode()
 
 
-def analyze_apk(apk_path, decoded_apk_output_path, apktool_path):
+def apktool_decode_options():
     """
-    Given an apk, decodes it and analyzes its content to extract API keys
+    :return: the apktool decode options needed by the configured code_parser
+    :rtype: tuple
+    """
+    if config.code_parser == "dex":
+        # the dex files are copied as they are and parsed by dex_parser, no need for baksmali
+        return ("-s",)
+    return ()
 
-    :param apk_path: path of the apk to be analyzed
+
+def decode_apk_targeted(apk_path, output_path, apktool_path):
+    """
+    Decodes only the parts of an apk that are later analyzed: manifest, resources and code are decoded by apktool
+    from a trimmed copy of the apk, while the native libraries of the analyzed architecture are extracted directly
+
+    :param apk_path: path of the apk to be decoded
+    :param output_path: decoded apk folder
+    :param apktool_path: where apktool.jar resides
+    """
+    trimmed_apk_path = output_path + ".trimmed.apk"
+    os.makedirs(os.path.dirname(trimmed_apk_path), exist_ok=True)
+    try:
+        write_trimmed_apk(apk_path, trimmed_apk_path)
+        run_apktool(trimmed_apk_path, output_path, apktool_path, apktool_decode_options())
+    finally:
+        if os.path.exists(trimmed_apk_path):
+            os.remove(trimmed_apk_path)
+    apk_abis = get_native_abis(apk_path)
+    abis = [arc for arc in ARC_PRIORITY_LIST if arc in apk_abis]
+    if abis:
+        extract_native_libs(apk_path, output_path, abis if config.native_scan["all_abis"] else abis[:1])
+
+
+def decode_apk(apk_path, output_path, apktool_path):
+    """
+    Decodes an apk, either entirely or, if decode_mode is "targeted", just the parts that are later analyzed
+
+    :param apk_path: path of the apk to be decoded
+    :param output_path: decoded apk folder
+    :param apktool_path: where apktool.jar resides
+    """
+    if config.decode_mode == "targeted":
+        try:
+            decode_apk_targeted(apk_path, output_path, apktool_path)
+            return
+        except (subprocess.CalledProcessError, zipfile.BadZipFile, OSError) as e:
+            logging.error("Targeted decode of {0} failed, decoding the whole apk; {1}".format(apk_path, e))
+    run_apktool(apk_path, output_path, apktool_path, apktool_decode_options())
+
+
+def decode(apk_path, decoded_apk_output_path, apktool_path, decode_slots=None):
+    """
+    Decodes an apk, turning apktool failures into ApkAnalysisError
+
+    :param apk_path: path of the apk to be decoded
     :param decoded_apk_output_path: where the decoded apk should be placed
-    :param apktool_path: where apktool.jar resides, used for apk decode
+    :param apktool_path: where apktool.jar resides
+    :param decode_slots: if not None, a context manager held while apktool runs (limits concurrent decodes)
     """
     try:
-        decode_apk(apk_path, decoded_apk_output_path, apktool_path)
-        if os.path.exists(decoded_apk_output_path):
-            return analyze_decoded_apk(decoded_apk_output_path)
+        if decode_slots is not None:
+            with decode_slots:
+                decode_apk(apk_path, decoded_apk_output_path, apktool_path)
         else:
-            raise ApkAnalysisError("Unable to find decoded folder for {0}".format(apk_path))
+            decode_apk(apk_path, decoded_apk_output_path, apktool_path)
     except subprocess.CalledProcessError as err:
         logging.error("Error in " + str(err.cmd))
         raise ApkAnalysisError(err.stderr)
+    if not os.path.exists(decoded_apk_output_path):
+        raise ApkAnalysisError("Unable to find decoded folder for {0}".format(apk_path))
+
+
+def analyze_apk(apk_path, decoded_apk_output_path, apktool_path, decode_slots=None):
+    """
+    Given an apk, decodes it and analyzes its content to extract API keys
+
+    :param apk_path: path of the apk to be analyzed
+    :param decoded_apk_output_path: where the decoded apk should be placed
+    :param apktool_path: where apktool.jar resides, used for apk decode
+    :param decode_slots: if not None, a context manager held while apktool runs (limits concurrent decodes)
+    """
+    decode(apk_path, decoded_apk_output_path, apktool_path, decode_slots)
+    return analyze_decoded_apk(decoded_apk_output_path)
@@ -0,0 +1,122 @@
+import java.io.BufferedReader;
+import java.io.FileDescriptor;
+import java.io.FileOutputStream;
+import java.io.InputStreamReader;
+import java.io.PrintStream;
+import java.lang.reflect.InvocationTargetException;
+import java.lang.reflect.Method;
+import java.nio.charset.StandardCharsets;
+import java.security.Permission;
+import java.util.ArrayList;
+import java.util.Arrays;
+import java.util.List;
+
+/**
+ * Keeps a JVM with apktool loaded and decodes apks on request, so that JVM startup and JIT warm-up
+ * are paid once instead of once for each apk.
+ *
+ * Requests are read from stdin and responses written to stdout, one per line, fields separated by tabs:
+ *
+ *     PING                                              -> PONG
+ *     DECODE apk_path output_path [apktool options...]  -> OK | ERROR message
+ *     QUIT                                              -> the server exits
+ *
+ * READY is written once apktool has been loaded. Everything apktool prints is redirected to stderr.
+ * apktool is loaded through reflection, so this class can be compiled without apktool on the classpath.
+ *
+ * apktool's command line calls System.exit on several decode errors (e.g. a missing apk). While decoding, a
+ * SecurityManager turns those calls into an ERROR response, so that the JVM survives; Java 18 to 23 allow it only
+ * when started with -Djava.security.manager=allow, later versions not at all. Where the exit can't be trapped, an
+ * ERROR response is still written before the JVM exits.
+ */
+@SuppressWarnings("removal")
+public class ApktoolServer {
+
+    /** Thrown instead of exiting the JVM when apktool calls System.exit while decoding */
+    static class ExitTrappedException extends SecurityException {
+        final int status;
+
+        ExitTrappedException(int status) {
+            super("apktool exited with status " + status);
+            this.status = status;
+        }
+    }
+
+    private static volatile boolean decoding = false;
+
+    public static void main(String[] args) throws Exception {
+        final PrintStream protocol = new PrintStream(new FileOutputStream(FileDescriptor.out), true, "UTF-8");
+        System.setOut(System.err);
+        if (!trapExit()) {
+            Runtime.getRuntime().addShutdownHook(new Thread() {
+                public void run() {
+                    if (decoding) {
+                        protocol.println("ERROR\tapktool exited the JVM");
+                    }
+                }
+            });
+        }
+        Method apktoolMain = Class.forName("brut.apktool.Main").getMethod("main", String[].class);
+        BufferedReader in = new BufferedReader(new InputStreamReader(System.in, StandardCharsets.UTF_8));
+        protocol.println("READY");
+        String line;
+        while ((line = in.readLine()) != null) {
+            String[] fields = line.split("\t");
+            if (fields[0].equals("PING")) {
+                protocol.println("PONG");
+            } else if (fields[0].equals("QUIT")) {
+                break;
+            } else if (fields[0].equals("DECODE") && fields.length >= 3) {
+                List<String> apktoolArgs = new ArrayList<String>(Arrays.asList("d", fields[1], "-o", fields[2], "-f"));
+                apktoolArgs.addAll(Arrays.asList(fields).subList(3, fields.length));
+                decoding = true;
+                try {
+                    apktoolMain.invoke(null, (Object) apktoolArgs.toArray(new String[0]));
+                    protocol.println("OK");
+                } catch (InvocationTargetException e) {
+                    Throwable cause = e.getCause();
+                    if (cause instanceof ExitTrappedException && ((ExitTrappedException) cause).status == 0) {
+                        protocol.println("OK");
+                    } else {
+                        protocol.println("ERROR\t" + oneLine(cause));
+                    }
+                } finally {
+                    decoding = false;
+                }
+            } else {
+                protocol.println("ERROR\tUnknown request: " + oneLine(line));
+            }
+        }
+    }
+
+    /**
+     * @return true if the calls to System.exit made while decoding throw ExitTrappedException from now on
+     */
+    private static boolean trapExit() {
+        try {
+            System.setSecurityManager(new SecurityManager() {
+                @Override
+                public void checkExit(int status) {
+                    if (decoding) {
+                        throw new ExitTrappedException(status);
+                    }
+                }
+
+                @Override
+                public void checkPermission(Permission perm) {
+                }
+
+                @Override
+                public void checkPermission(Permission perm, Object context) {
+                }
+            });
+            return true;
+        } catch (UnsupportedOperationException | SecurityException e) {
+            return false;
+        }
+    }
+
+    private static String oneLine(Object o) {
+        return String.valueOf(o).replace('\n', ' ').replace('\r', ' ').replace('\t', ' ');
+    }
+}
@@ -0,0 +1,55 @@
+"""
+Compares the regex and the numpy engines of strings_tool on real ELF files, checking that they find the same
+strings.
+
+Usage: python benchmarks/strings_tool_benchmark.py [path/to/lib.so ...]
+(by default, the shared libraries in /usr/lib/x86_64-linux-gnu are used)
+"""
+import glob
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+import my_tools.strings_tool as strings_tool  # noqa: E402
+
+SECTIONS = [".rodata", ".text"]
+REPETITIONS = 3
+
+
+def is_elf(file_name):
+    with open(file_name, 'rb') as f:
+        return f.read(4) == b"\x7fELF"
+
+
+def run(engine, files):
+    strings_tool.scan = engine
+    best = None
+    found = []
+    for _ in range(REPETITIONS):
+        start = time.perf_counter()
+        found = [list(strings_tool.strings_with_offsets(file_name, SECTIONS)) for file_name in files]
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, found
+
+
+def main(argv):
+    files = argv[1:] or sorted(glob.glob("/usr/lib/x86_64-linux-gnu/*.so*"))
+    files = [f for f in files if os.path.isfile(f) and not os.path.islink(f) and is_elf(f)]
+    if not files:
+        print("No ELF file found")
+        return
+    size = sum(os.path.getsize(f) for f in files)
+    regex_time, regex_strings = run(strings_tool.scan_regex, files)
+    numpy_time, numpy_strings = run(strings_tool.scan_numpy, files)
+    print("{0} files, {1:.1f} MB, {2} strings".format(len(files), size / 1024 / 1024,
+                                                      sum(len(s) for s in regex_strings)))
+    print("regex: best of {0} {1:.3f}s".format(REPETITIONS, regex_time))
+    print("numpy: best of {0} {1:.3f}s ({2:.1f}x)".format(REPETITIONS, numpy_time, regex_time / numpy_time))
+    print("same output: {0}".format(regex_strings == numpy_strings))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
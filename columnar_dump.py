@@ -0,0 +1,76 @@
+import functools
+import logging
+
+from abstract_dump import AbstractDump
+from my_tools import columnar_writer
+from my_tools.columnar_writer import ColumnarWriter, TYPE_STRING, TYPE_INT, TYPE_BOOL, TYPE_STRING_LIST
+
+import config
+
+# name, type and whether the column is dictionary encoded (i.e. has many repeated values)
+COLUMNS = [
+    ("package", TYPE_STRING, True),
+    ("versionCode", TYPE_INT, True),
+    ("versionName", TYPE_STRING, True),
+    ("source", TYPE_STRING, True),
+    ("name", TYPE_STRING, True),
+    ("value", TYPE_STRING, False),
+    ("class_name", TYPE_STRING, True),
+    ("method_name", TYPE_STRING, True),
+    ("in_array", TYPE_BOOL, False),
+    ("parameter_of", TYPE_STRING, True),
+    ("symbol", TYPE_STRING, True),
+    ("locations", TYPE_STRING_LIST, False),
+]
+
+
+class ColumnarDump(AbstractDump):
+    """
+    Writes the entries into columnar files (Parquet, or gzipped json columns if pyarrow isn't installed), one row
+    group every columnar.row_group_size entries, or when the oldest entry has been waiting for
+    columnar.flush_interval seconds and there are no apks to analyze; close must be called before exiting. The
+    entries can be read only once their file is complete, every columnar.file_max_age seconds.
+    """
+
+    def __init__(self):
+        file_format = config.columnar["format"]
+        if file_format == "parquet" and columnar_writer.pyarrow is None:
+            logging.warning("pyarrow is not installed, the columns are written as gzipped json instead of parquet")
+            file_format = "json"
+        self.flush_interval = config.columnar["flush_interval"]
+        self._apikeys = ColumnarWriter(config.columnar["apikeys_folder"], "apikeys", COLUMNS, file_format,
+                                       config.columnar["row_group_size"], config.columnar["file_max_age"])
+        self._strings = ColumnarWriter(config.columnar["strings_folder"], "strings", COLUMNS, file_format,
+                                       config.columnar["row_group_size"], config.columnar["file_max_age"])
+
+    def dump_apikeys(self, entries, package, version_code, version_name):
+        rows = []
+        for entry in entries:
+            row = dict(entry.__dict__)
+            row['package'] = package
+            row['versionCode'] = version_code
+            row['versionName'] = version_name
+            rows.append(row)
+        self._apikeys.write(rows)
+
+    def dump_strings(self, entries, package=None, version_code=None, version_name=None):
+        rows = []
+        for entry in entries:
+            row = dict(entry.__dict__)
+            row['package'] = package
+            row['versionCode'] = version_code
+            row['versionName'] = version_name
+            rows.append(row)
+        self._strings.write(rows)
+
+    def when_written(self, callback):
+        self._apikeys.when_complete(functools.partial(self._strings.when_complete, callback))
+
+    def flush(self):
+        # called often, when there are no apks to analyze; writing every time would make lots of tiny row groups
+        self._apikeys.flush(self.flush_interval)
+        self._strings.flush(self.flush_interval)
+
+    def close(self):
+        self._apikeys.close()
+        self._strings.close()
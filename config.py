@@ -6,9 +6,98 @@ import yaml
 
 __location__ = os.path.realpath(os.path.join(os.getcwd(), os.path.dirname(__file__)))
 
-CONFIG_PATH = "config.yml"
+# another configuration file can be given through this environment variable, e.g. by the tests
+CONFIG_PATH = os.environ.get("APK_API_KEY_EXTRACTOR_CONFIG", "config.yml")
+
+# Optional settings; config files written for older versions may not contain them.
+# Sections (dicts) are merged key by key, so a config file can override just part of a section.
+DEFAULTS = {
+    "max_apktool_processes": 0,
+    "decode_mode": "full",
+    "code_parser": "smali",
+    "apktool_server": {
+        "enabled": False,
+        "instances": 1,
+        "decode_timeout": 600,
+    },
+    "smali_parser": {
+        "workers": 1,
+        "chunk_size": 500,
+        "prescan": True,
+    },
+    "native_scan": {
+        "all_abis": False,
+        "symbols": False,
+        "workers": 1,
+        "executor": "thread",
+        "timeout": 300,
+    },
+    "lib_strings_cache": {
+        "enabled": False,
+        "path": "lib_strings_cache.sqlite",
+        "max_size_mb": 512,
+    },
+    "lib_auto_blacklist": {
+        "enabled": False,
+        "path": "lib_frequency.sqlite",
+        "threshold": 20,
+    },
+    "apk_results_cache": {
+        "enabled": False,
+        "path": "apk_results_cache.sqlite",
+        "max_size_mb": 1024,
+        "max_age_days": 30,
+    },
+    "incremental": {
+        "enabled": False,
+        "path": "incremental.sqlite",
+        "max_age_days": 180,
+    },
+    "string_dedup": {
+        "enabled": False,
+        "keep": "all",
+    },
+    "string_verdicts": {
+        "enabled": False,
+        "max_size": 1000000,
+    },
+    "batch_classifier": {
+        "enabled": False,
+        "max_batch_size": 8192,
+        "max_wait": 0.02,
+    },
+    "jsonlines": {
+        "buffer_size": 1024 * 1024,
+        "flush_interval": 60,
+        "strings_format": "jsonlines",
+        "compression": "gzip",
+        "segment_size_mb": 256,
+        "segment_max_age": 3600,
+    },
+    "columnar": {
+        "apikeys_folder": "apikeys_columnar",
+        "strings_folder": "strings_columnar",
+        "format": "parquet",
+        "row_group_size": 65536,
+        "flush_interval": 60,
+        "file_max_age": 600,
+    },
+    "pipeline": {
+        "enabled": False,
+        "decode_workers": 1,
+        "extract_workers": 1,
+        "classify_workers": 1,
+        "queue_size": 1,
+    },
+}
 
 with open(os.path.join(__location__, CONFIG_PATH), 'r') as ymlfile:
     cfg = yaml.safe_load(ymlfile)
+    for key, default in DEFAULTS.items():
+        value = cfg.get(key)
+        if value is None:
+            cfg[key] = default
+        elif isinstance(default, dict) and isinstance(value, dict):
+            cfg[key] = dict(default, **value)
     # Load the yaml content into this module global variables
     globals().update(cfg)
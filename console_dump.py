@@ -19,7 +19,7 @@ class ConsoleDump(AbstractDump):
             entry_dict['versionName'] = version_name
             print(entry_dict)
 
-    def dump_strings(self, entries):
+    def dump_strings(self, entries, package=None, version_code=None, version_name=None):
         for entry in entries:
             entry_dict = entry.__dict__
             print(entry_dict)
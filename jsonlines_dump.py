@@ -1,74 +1,164 @@
 import datetime
+import functools
 import json
 import logging
 import os
+import random
+import threading
+import time
 
 from flufl.lock import Lock, AlreadyLockedError, TimeOutError
 
 from abstract_dump import AbstractDump
+from my_tools.segment_writer import SegmentWriter
 
 import config
 
 LOCK_PREFIX = ".lock"
+# how long a single attempt to take the lock of a file lasts
+LOCK_ATTEMPT = datetime.timedelta(milliseconds=350)
+# bounds of the (randomized, exponential) pause between two attempts
+LOCK_BACKOFF_MIN = 0.05
+LOCK_BACKOFF_MAX = 5
+
+# one lock for each file, shared by all the instances in this process
+_file_locks = {}
+_file_locks_lock = threading.Lock()
+
+
+class _BufferedFile(object):
+    """
+    The records waiting to be appended to a jsonlines file, and the lock that guards the file
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = Lock(path + LOCK_PREFIX, lifetime=datetime.timedelta(seconds=6000))  # expires in 100 minutes
+        self.records = []
+        self.size = 0
+        self.first_record_time = None
 
 
 class JsonlinesDump(AbstractDump):
+    """
+    Appends the entries to jsonlines files shared by several processes. Entries are kept in memory and written in
+    batches, when jsonlines.buffer_size bytes are waiting or jsonlines.flush_interval seconds have passed since the
+    oldest one, taking the lock of the files once for each batch; flush (or close) must be called before exiting.
+    Whenever a batch is due, the entries of all the files are written.
+    """
 
     def __init__(self):
         self.dest = os.path.abspath(config.jsonlines["dump_file"])
         self.strings_dest = os.path.abspath(config.jsonlines["strings_file"])
+        self.buffer_size = config.jsonlines["buffer_size"]
+        self.flush_interval = config.jsonlines["flush_interval"]
+        self._files = {self.dest: _BufferedFile(self.dest), self.strings_dest: _BufferedFile(self.strings_dest)}
+        self._buffers_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        # called at the end of the next flush, see when_written
+        self._callbacks = []
+        self._segments = None
+        if config.jsonlines["strings_format"] == "segments":
+            # strings_file is then the folder of the segments, whose names start with the name of the folder
+            self._segments = SegmentWriter(self.strings_dest, os.path.basename(self.strings_dest),
+                                           config.jsonlines["compression"],
+                                           int(config.jsonlines["segment_size_mb"] * 1024 * 1024),
+                                           config.jsonlines["segment_max_age"])
 
     def dump_apikeys(self, entries, package, version_code, version_name):
-        lock_acquired = False
-        while not lock_acquired:
+        records = []
+        for entry in entries:
+            entry_dict = entry.__dict__
+            entry_dict['package'] = package
+            entry_dict['versionCode'] = version_code
+            entry_dict['versionName'] = version_name
+            records.append(json.dumps(entry_dict))
+        self._add(self.dest, records)
+
+    def dump_strings(self, entries, package=None, version_code=None, version_name=None):
+        records = [json.dumps(entry.__dict__) for entry in entries]
+        if self._segments is not None:
+            self._segments.write(package, records)
+        else:
+            self._add(self.strings_dest, records)
+
+    def when_written(self, callback):
+        if self._segments is not None:
+            # the strings are written as soon as they are dumped, but can be read only once their segment is
+            # complete
+            callback = functools.partial(self._segments.when_complete, callback)
+        with self._buffers_lock:
+            # a flush in progress may have taken the records but not written them yet
+            if self._flush_lock.locked() or any(buffered.records for buffered in self._files.values()):
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def flush(self):
+        with self._flush_lock:
+            with self._buffers_lock:
+                callbacks = self._callbacks
+                self._callbacks = []
+            for path in self._files:
+                self._flush(path)
+            if self._segments is not None:
+                self._segments.flush()
+        for callback in callbacks:
+            callback()
+
+    def close(self):
+        self.flush()
+        if self._segments is not None:
+            self._segments.close()
+
+    def _add(self, path, records):
+        buffered = self._files[path]
+        with self._buffers_lock:
+            if records and not buffered.records:
+                buffered.first_record_time = time.monotonic()
+            buffered.records += records
+            buffered.size += sum(len(record) + 1 for record in records)
+            full = buffered.size >= self.buffer_size
+        if full or self._is_due(buffered):
+            self.flush()
+
+    def _is_due(self, buffered):
+        first_record_time = buffered.first_record_time
+        return first_record_time is not None and time.monotonic() - first_record_time >= self.flush_interval
+
+    def _flush(self, path):
+        buffered = self._files[path]
+        with _file_locks_lock:
+            file_lock = _file_locks.setdefault(path, threading.Lock())
+        # the threads of this process write one at a time, in the order they take the records
+        with file_lock:
+            with self._buffers_lock:
+                records = buffered.records
+                buffered.records = []
+                buffered.size = 0
+                buffered.first_record_time = None
+            if not records:
+                return
+            self._lock_file(buffered.lock)
             try:
-                filename = self.dest + LOCK_PREFIX
-                lock = Lock(filename, lifetime=datetime.timedelta(seconds=6000))  # expires in 10 minutes
-                if not lock.is_locked:
-                    lock.lock(timeout=datetime.timedelta(milliseconds=350))
-                    lock_acquired = True
-                    with open(self.dest, 'a') as f:
-                        first = True
-                        if os.path.exists(self.dest) and os.path.getsize(self.dest) > 0:
-                            first = False
-                        for entry in entries:
-                            entry_dict = entry.__dict__
-                            entry_dict['package'] = package
-                            entry_dict['versionCode'] = version_code
-                            entry_dict['versionName'] = version_name
-                            if first:
-                                first = False
-                            else:
-                                f.write("\n")
-                            json.dump(entry_dict, f)
-                    if lock.is_locked:
-                        lock.unlock()
-            except (AlreadyLockedError, TimeOutError):
-                # some other process is analyzing the file; go ahead and look for another file
-                pass
+                with open(path, 'a') as f:
+                    # records are separated by a newline, with none after the last one
+                    prefix = "\n" if os.path.getsize(path) > 0 else ""
+                    f.write(prefix + "\n".join(records))
+            finally:
+                if buffered.lock.is_locked:
+                    buffered.lock.unlock()
 
-    def dump_strings(self, entries):
-        lock_acquired = False
-        while not lock_acquired:
+    @staticmethod
+    def _lock_file(lock):
+        backoff = LOCK_BACKOFF_MIN
+        while True:
             try:
-                filename = self.strings_dest + LOCK_PREFIX
-                lock = Lock(filename, lifetime=datetime.timedelta(seconds=6000))  # expires in 10 minutes
-                if not lock.is_locked:
-                    lock.lock(timeout=datetime.timedelta(milliseconds=350))
-                    lock_acquired = True
-                    with open(self.strings_dest, 'a') as f:
-                        first = True
-                        if os.path.exists(self.strings_dest) and os.path.getsize(self.strings_dest) > 0:
-                            first = False
-                        for entry in entries:
-                            entry_dict = entry.__dict__
-                            if first:
-                                first = False
-                            else:
-                                f.write("\n")
-                            json.dump(entry_dict, f)
-                    if lock.is_locked:
-                        lock.unlock()
+                lock.lock(timeout=LOCK_ATTEMPT)
+                return
             except (AlreadyLockedError, TimeOutError):
-                # some other process is analyzing the file; go ahead and look for another file
-                pass
+                # some other process is writing the file; wait a bit longer at each attempt
+                logging.debug("Waiting for the lock of {0}".format(lock.lockfile))
+                time.sleep(backoff * random.uniform(0.5, 1))
+                backoff = min(backoff * 2, LOCK_BACKOFF_MAX)
+
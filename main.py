@@ -5,14 +5,18 @@ import logging.config
 import os
 import shutil
 import sys
+import threading
 import time
 import json
 
 from console_dump import ConsoleDump
 from mongodb_dump import MongoDBDump
 from jsonlines_dump import JsonlinesDump
+from columnar_dump import ColumnarDump
 
 import config
+from pipeline import Pipeline, Stage
+from worker_pool import WorkerPool
 
 LOG_CONFIG_PATH = "log_config.json"
 __location__ = os.path.realpath(os.path.join(os.getcwd(), os.path.dirname(__file__)))
@@ -29,23 +33,26 @@ def clean_resources(apk_path, lock, decoded_apk_output_path, apks_analyzed_dir,
     """
     Clean the resources allocated to analyze a string
 
-    :param apk_path: path of the apk that has been
+    :param apk_path: path of the apk that has been analyzed; None if only the decoded apk should be removed
     :param lock: a lock that is locking the aforementioned apk
-    :param decoded_apk_output_path: where the decoded apk where placed
+    :param decoded_apk_output_path: where the decoded apk where placed; None if the apk wasn't decoded
     :param apks_analyzed_dir: where the apk should be moved after analysis; None if it should not be moved
     :param remove_apk: True if the apk should be deleted; ignored if apks_analyzed_dir is not None
     """
-    apk = os.path.basename(apk_path)
     try:
-        if os.path.exists(decoded_apk_output_path):
-            shutil.rmtree(decoded_apk_output_path)
-        else:
-            logging.error("Unable to find decoded folder for {0}".format(apk_path))
-        if apks_analyzed_dir:
+        # None if the apk wasn't decoded, e.g. because its results were already stored
+        if decoded_apk_output_path is not None:
+            if os.path.exists(decoded_apk_output_path):
+                shutil.rmtree(decoded_apk_output_path)
+            else:
+                logging.error("Unable to find decoded folder for {0}".format(apk_path))
+        if apk_path is None:
+            pass
+        elif apks_analyzed_dir:
             if not os.path.exists(apks_analyzed_dir):
                 os.mkdir(apks_analyzed_dir)
             # either way, move the apk out of apk dir
-            shutil.move(apk_path, os.path.join(apks_analyzed_dir, apk))
+            shutil.move(apk_path, os.path.join(apks_analyzed_dir, os.path.basename(apk_path)))
         elif remove_apk:
             os.remove(apk_path)
     finally:
@@ -59,46 +66,224 @@ def clean_resources(apk_path, lock, decoded_apk_output_path, apks_analyzed_dir,
                 os.remove(lockfile)
 
 
-def analyze_apk(apk_path, apks_decoded_dir, apks_analyzed_dir, apktool_path, lock=None):
-    apk = os.path.basename(apk_path)
-    decoded_output_path = os.path.join(apks_decoded_dir, apk)
-    try:
-        apikeys, all_strings, package, version_code, version_name = apk_analyzer.analyze_apk(apk_path,
-                                                                                             decoded_output_path,
-                                                                                             apktool_path)
-        if apikeys:
-            dump = None
+dump = None
+dump_lock = threading.Lock()
+
+
+def get_dump():
+    """
+    Gets the dump configured by dump_location, creating it on first use; it lives as long as the process, so
+    that it can keep the entries of different apks in memory and write them together
+
+    :rtype: AbstractDump
+    """
+    global dump
+    with dump_lock:
+        if dump is None:
             if config.dump_location == "console":
                 dump = ConsoleDump()
             elif config.dump_location == "jsonlines":
                 dump = JsonlinesDump()
+            elif config.dump_location == "columnar":
+                dump = ColumnarDump()
             elif config.dump_location == "mongodb":
                 dump = MongoDBDump()
             else:
                 print("Unrecognized dump location: {0}".format(config.dump_location))
                 exit(1)
-            dump.dump_apikeys(apikeys, package, version_code, version_name)
-            if config.dump_all_strings:
-                dump.dump_strings(all_strings)
+        return dump
+
+
+def close_dump():
+    """
+    Writes the entries still kept in memory by the dump, and closes it
+    """
+    global dump
+    with dump_lock:
+        if dump is not None:
+            dump.close()
+            dump = None
+
+
+def finish_apk(apk_path, lock, decoded_apk_output_path, apks_analyzed_dir, in_flight=None):
+    """
+    Cleans the resources allocated to analyze an apk. The decoded apk is removed right away, while the apk is
+    moved (or removed) and unlocked only once the dump has written its results: the dump may keep them in memory
+    for a while, and if the process dies in the meantime the apk must still be in the apks folder, to be analyzed
+    again
+
+    :param in_flight: set of the apk paths being analyzed, which get_next_apk skips; the apk stays in it until
+                      it is moved
+    """
+    if decoded_apk_output_path is not None:
+        clean_resources(None, None, decoded_apk_output_path, None)
+    if in_flight is not None:
+        in_flight.add(apk_path)
+
+    def release():
+        try:
+            clean_resources(apk_path, lock, None, apks_analyzed_dir, not config.save_analyzed_apks)
+        except Exception:
+            logging.exception("Unable to clean the resources of {0}".format(apk_path))
+        finally:
+            if in_flight is not None:
+                in_flight.discard(apk_path)
+
+    with dump_lock:
+        results_dump = dump
+    if results_dump is None:
+        # nothing dumped yet, so nothing to wait for
+        release()
+    else:
+        results_dump.when_written(release)
+
+
+def dump_results(apikeys, all_strings, package, version_code, version_name):
+    if apikeys:
+        results_dump = get_dump()
+        results_dump.dump_apikeys(apikeys, package, version_code, version_name)
+        if config.dump_all_strings:
+            results_dump.dump_strings(all_strings, package, version_code, version_name)
+
+
+def analyze_apk(apk_path, apks_decoded_dir, apks_analyzed_dir, apktool_path, lock=None, decode_slots=None,
+                in_flight=None):
+    apk = os.path.basename(apk_path)
+    decoded_output_path = os.path.join(apks_decoded_dir, apk)
+    digest, results = apk_analyzer.get_stored_results(apk_path)
+    if results is not None:
+        logging.info("Results of {0} found in the apk results cache, not analyzed again".format(apk_path))
+        dump_results(*results)
+        finish_apk(apk_path, lock, None, apks_analyzed_dir, in_flight)
+        return
+    try:
+        results = apk_analyzer.analyze_apk(apk_path, decoded_output_path, apktool_path, decode_slots)
+        # stored before dumping, the dumps modify the strings
+        apk_analyzer.store_results(digest, results)
+        dump_results(*results)
     except apk_analyzer.ApkAnalysisError as e:
         logging.error(str(e))
-    clean_resources(apk_path, lock, decoded_output_path, apks_analyzed_dir, not config.save_analyzed_apks)
+    finish_apk(apk_path, lock, decoded_output_path, apks_analyzed_dir, in_flight)
+
+
+class ApkJob(object):
+    """
+    An apk going through the analysis pipeline
+    """
+
+    def __init__(self, apk_path, lock, decoded_output_path):
+        self.apk_path = apk_path
+        self.lock = lock
+        self.decoded_output_path = decoded_output_path
+        self.digest = None
+        self.extracted = None
+        self.package = None
+        self.version_code = None
+        self.version_name = None
+
 
+def create_pipeline(apks_analyzed_dir, apktool_path, in_flight, decode_slots=None):
+    """
+    Creates a pipeline that decodes, extracts and classifies different apks at the same time
+
+    :param apks_analyzed_dir: where the apks should be moved after analysis; None if they should not be moved
+    :param apktool_path: where apktool.jar resides
+    :param in_flight: set of the apk paths currently in the pipeline; apks are removed from it once analyzed
+    :param decode_slots: if not None, a context manager that must be held while apktool is running
+    :return: a Pipeline accepting ApkJob items
+    :rtype: Pipeline
+    """
 
-def monitor_apks_folder(apks_dir, apks_decoded_dir, apks_analyzed_dir, apktool_path):
+    def finish(job, decoded=True):
+        # the apk leaves in_flight once its results are written
+        finish_apk(job.apk_path, job.lock, job.decoded_output_path if decoded else None, apks_analyzed_dir,
+                   in_flight)
+        logging.info("{0} analyzed".format(job.apk_path))
+
+    def decode(job):
+        job.digest, results = apk_analyzer.get_stored_results(job.apk_path)
+        if results is not None:
+            logging.info("Results of {0} found in the apk results cache, not analyzed again".format(job.apk_path))
+            dump_results(*results)
+            finish(job, decoded=False)
+            return None
+        try:
+            apk_analyzer.decode(job.apk_path, job.decoded_output_path, apktool_path, decode_slots)
+        except apk_analyzer.ApkAnalysisError as e:
+            logging.error(str(e))
+            finish(job)
+            return None
+        return job
+
+    def extract(job):
+        result = apk_analyzer.extract_decoded_apk(job.decoded_output_path)
+        if not result:
+            finish(job)
+            return None
+        job.extracted, job.package, job.version_code, job.version_name = result
+        return job
+
+    def classify(job):
+        apikeys = apk_analyzer.find_apikeys(job.extracted, job.package)
+        # stored before dumping, the dumps modify the strings
+        apk_analyzer.store_results(job.digest, (apikeys, job.extracted, job.package, job.version_code,
+                                                job.version_name))
+        dump_results(apikeys, job.extracted, job.package, job.version_code, job.version_name)
+        finish(job)
+
+    def on_error(stage, job, e):
+        finish(job)
+
+    settings = config.pipeline
+    return Pipeline([Stage("decode", decode, settings["decode_workers"]),
+                     Stage("extract", extract, settings["extract_workers"]),
+                     Stage("classify", classify, settings["classify_workers"])],
+                    settings["queue_size"], on_error)
+
+
+def monitor_apks_folder(apks_dir, apks_decoded_dir, apks_analyzed_dir, apktool_path, stop_event=None,
+                        decode_slots=None):
+    """
+    Analyzes the apks found in apks_dir until interrupted; one at a time, or through the analysis pipeline
+    if it is enabled in the configuration
+
+    :param stop_event: if not None, monitoring stops as soon as the event is set and the current apks are analyzed
+    :param decode_slots: if not None, a context manager that must be held while apktool is running
+    """
     logging.info("Monitoring {0} for apks...".format(apks_dir))
+    pipeline = None
+    in_flight = set()
+    if config.pipeline["enabled"]:
+        pipeline = create_pipeline(apks_analyzed_dir, apktool_path, in_flight, decode_slots)
     try:
-        while True:
-            apk_path, lock = apk_analyzer.get_next_apk(apks_dir)
+        while stop_event is None or not stop_event.is_set():
+            apk_path, lock = apk_analyzer.get_next_apk(apks_dir, in_flight)
             if lock is not None:
                 logging.info("Detected {0}".format(apk_path))
-                analyze_apk(apk_path, apks_decoded_dir, apks_analyzed_dir, apktool_path, lock)
-                logging.info("{0} analyzed".format(apk_path))
+                if pipeline is not None:
+                    in_flight.add(apk_path)
+                    decoded_output_path = os.path.join(apks_decoded_dir, os.path.basename(apk_path))
+                    pipeline.put(ApkJob(apk_path, lock, decoded_output_path))
+                else:
+                    analyze_apk(apk_path, apks_decoded_dir, apks_analyzed_dir, apktool_path, lock, decode_slots,
+                                in_flight)
+                    logging.info("{0} analyzed".format(apk_path))
             else:
-                time.sleep(1)
+                if dump is not None:
+                    # nothing to analyze: a good time to write what the dump is keeping in memory
+                    dump.flush()
+                if stop_event is not None:
+                    stop_event.wait(1)
+                else:
+                    time.sleep(1)
 
     except KeyboardInterrupt:
         print('\nInterrupted!')
+    finally:
+        if pipeline is not None:
+            # let the apks already in the pipeline complete their analysis
+            pipeline.close()
+        close_dump()
 
 
 def main():
@@ -112,6 +297,11 @@ def main():
     parser.add_argument('--monitor-apks-folder', action="store_true", dest='boolean_monitor',
                         default=False, help='Monitors the configured apks folder for new apks. '
                                             'When a new apk is detected, the file is locked and analysis starts.')
+    parser.add_argument('--workers', action='store', dest='workers', type=int, default=1,
+                        help='Number of worker processes used with --monitor-apks-folder (default: 1)')
+    parser.add_argument('--export-lib-blacklist', action='store', dest='lib_blacklist_path',
+                        help='Writes the native libraries found in at least lib_auto_blacklist.threshold different '
+                             'packages to a blacklist file, in the same format as lib_blacklist.txt')
 
     results = parser.parse_args()
 
@@ -119,16 +309,27 @@ def main():
 
     if results.boolean_debug:
         logging.basicConfig(level=logging.DEBUG)
+    elif results.lib_blacklist_path:
+        count = apk_analyzer.export_lib_blacklist(results.lib_blacklist_path)
+        print("{0} libraries written to {1}".format(count, results.lib_blacklist_path))
+        return
     elif results.apk_path:
-        analyze_apk(results.apk_path, os.path.abspath(config.apks_decoded_dir),
-                    None, os.path.abspath(config.apktool))
+        try:
+            analyze_apk(results.apk_path, os.path.abspath(config.apks_decoded_dir),
+                        None, os.path.abspath(config.apktool))
+        finally:
+            close_dump()
         return
     elif results.boolean_monitor:
         apks_analyzed_dir = None
         if config.save_analyzed_apks:
             apks_analyzed_dir = os.path.abspath(config.apks_analyzed_dir)
-        monitor_apks_folder(os.path.abspath(config.apks_dir), os.path.abspath(config.apks_decoded_dir),
-                            apks_analyzed_dir, os.path.abspath(config.apktool))
+        monitor_args = (os.path.abspath(config.apks_dir), os.path.abspath(config.apks_decoded_dir),
+                        apks_analyzed_dir, os.path.abspath(config.apktool))
+        if results.workers > 1:
+            WorkerPool(results.workers, monitor_apks_folder, monitor_args, config.max_apktool_processes).run()
+        else:
+            monitor_apks_folder(*monitor_args)
         return
     parser.print_help()
 
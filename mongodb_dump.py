@@ -38,7 +38,7 @@ class MongoDBDump(AbstractDump):
             self.collection.insert_many(entries_dicts, False)
 
     @retry(pymongo.errors.AutoReconnect, tries=5, timeout_secs=1)
-    def dump_strings(self, entries):
+    def dump_strings(self, entries, package=None, version_code=None, version_name=None):
         operations = []
         for entry in entries:
             operations.append(pymongo.UpdateOne({'_id': entry.value}, {'$inc': {'count': 1}}, upsert=True))
@@ -53,6 +53,9 @@ class MongoDBDump(AbstractDump):
                 if len(list(filtered_errors)) > 0:
                     raise
 
+    def close(self):
+        self.client.close()
+
     @retry(pymongo.errors.AutoReconnect, tries=5, timeout_secs=1)
     def get_apikey_unverified(self):
         document = self.collection.find_one({"verified": None})
@@ -7,11 +7,24 @@ class LibString(MyString):
     """
     TYPE_LIB = "TYPE_LIB_STRING"
 
-    def __init__(self, name, value):
+    def __init__(self, name, value, locations=None, symbol=None):
         super().__init__(name, value, LibString.TYPE_LIB)
+        # the attributes below are set only when asked for (native_scan.all_abis, native_scan.symbols), so that
+        # the dumped strings don't get new keys otherwise
+        if locations is not None:
+            # the libraries the string was found in, as abi/library
+            self.locations = locations
+        if symbol is not None:
+            # the symbol (e.g. a global const char[]) that holds the string
+            self.symbol = symbol
 
     def __str__(self):
-        return super(LibString, self).__str__()
+        s = super(LibString, self).__str__()
+        if getattr(self, "symbol", None):
+            s += " Symbol: {0}".format(self.symbol)
+        if getattr(self, "locations", None):
+            s += " In: {0}".format(", ".join(self.locations))
+        return s
 
     def __repr__(self):
         return self.__str__()
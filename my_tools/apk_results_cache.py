@@ -0,0 +1,130 @@
+"""
+Persistent store of the results of the analysis of whole apks, so that an apk received again (e.g. the same file
+downloaded from another mirror) is not decoded and analyzed a second time.
+
+The results are kept in a SQLite database that several processes can share; they are keyed by the SHA-256 of the
+apk and by a fingerprint of everything else the results depend on (classifier, blacklists, configuration), and
+are evicted when too old or, least recently used first, when the store grows over its maximum size.
+"""
+import logging
+import pickle
+import sqlite3
+import sys
+import time
+from contextlib import closing
+
+# seconds a process waits for another one holding the lock of the database
+LOCK_TIMEOUT = 60
+# when evicting, the store is shrunk to this fraction of its maximum size, so that it isn't done at every insert
+EVICTION_TARGET = 0.9
+
+
+class ApkResultsCache(object):
+    def __init__(self, path, max_size, max_age=None):
+        """
+        :param path: path of the SQLite database; created if it doesn't exist
+        :param max_size: maximum size (in bytes) of the stored results
+        :param max_age: seconds after which stored results are discarded; None means no limit
+        """
+        self._path = path
+        self._max_size = max_size
+        self._max_age = max_age
+        with closing(self._connect()) as db:
+            # WAL lets processes read while another one is writing
+            db.execute("PRAGMA journal_mode=WAL")
+            with db:
+                db.execute("CREATE TABLE IF NOT EXISTS apk_results ("
+                           "digest TEXT NOT NULL, "
+                           "fingerprint TEXT NOT NULL, "
+                           "results BLOB NOT NULL, "
+                           "size INTEGER NOT NULL, "
+                           "created REAL NOT NULL, "
+                           "last_used REAL NOT NULL, "
+                           "PRIMARY KEY (digest, fingerprint))")
+                db.execute("CREATE INDEX IF NOT EXISTS apk_results_last_used ON apk_results (last_used)")
+                db.execute("CREATE INDEX IF NOT EXISTS apk_results_created ON apk_results (created)")
+
+    def _connect(self):
+        # a new connection for each operation: connections can't be shared by threads, nor survive a fork
+        return sqlite3.connect(self._path, timeout=LOCK_TIMEOUT)
+
+    def get(self, digest, fingerprint):
+        """
+        :param digest: SHA-256 of the apk (see file_hash.file_sha256)
+        :param fingerprint: fingerprint of the classifier, blacklists and configuration used
+        :return: the stored results, or None if the apk isn't in the store (or its results are too old)
+        """
+        key = (digest, fingerprint)
+        with closing(self._connect()) as db:
+            row = db.execute("SELECT results, created FROM apk_results WHERE digest = ? AND fingerprint = ?",
+                             key).fetchone()
+            if row is None:
+                return None
+            now = time.time()
+            if self._max_age is not None and row[1] < now - self._max_age:
+                return None
+            with db:
+                db.execute("UPDATE apk_results SET last_used = ? WHERE digest = ? AND fingerprint = ?", (now,) + key)
+        return pickle.loads(row[0])
+
+    def put(self, digest, fingerprint, results):
+        """
+        Stores the results of an apk, evicting the old and least recently used ones if needed
+
+        :param digest: SHA-256 of the apk (see file_hash.file_sha256)
+        :param fingerprint: fingerprint of the classifier, blacklists and configuration used
+        :param results: any picklable object
+        """
+        data = pickle.dumps(results, pickle.HIGHEST_PROTOCOL)
+        if len(data) > self._max_size:
+            logging.debug("Results of apk {0} too big to be stored".format(digest))
+            return
+        now = time.time()
+        with closing(self._connect()) as db:
+            with db:
+                db.execute("INSERT OR REPLACE INTO apk_results "
+                           "(digest, fingerprint, results, size, created, last_used) VALUES (?, ?, ?, ?, ?, ?)",
+                           (digest, fingerprint, sqlite3.Binary(data), len(data), now, now))
+                self._evict(db, now)
+
+    def _evict(self, db, now):
+        if self._max_age is not None:
+            db.execute("DELETE FROM apk_results WHERE created < ?", (now - self._max_age,))
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM apk_results").fetchone()[0]
+        if total <= self._max_size:
+            return
+        target = self._max_size * EVICTION_TARGET
+        evicted = []
+        for digest, fingerprint, size in db.execute(
+                "SELECT digest, fingerprint, size FROM apk_results ORDER BY last_used").fetchall():
+            if total <= target:
+                break
+            evicted.append((digest, fingerprint))
+            total -= size
+        db.executemany("DELETE FROM apk_results WHERE digest = ? AND fingerprint = ?", evicted)
+        logging.debug("Evicted the results of {0} apks".format(len(evicted)))
+
+    def get_stats(self):
+        """
+        :return: the number of apks in the store and the size of their results
+        :rtype: tuple
+        """
+        with closing(self._connect()) as db:
+            return db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM apk_results").fetchone()
+
+    def clear(self):
+        with closing(self._connect()) as db:
+            with db:
+                db.execute("DELETE FROM apk_results")
+
+
+def main(argv):
+    if len(argv) != 2:
+        print("Usage: python {0} path/to/apk_results.sqlite".format(argv[0]))
+        return
+    count, size = ApkResultsCache(argv[1], sys.maxsize).get_stats()
+    print("{0} apks, {1} bytes of results".format(count, size))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
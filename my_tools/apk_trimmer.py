@@ -0,0 +1,64 @@
+"""
+Utilities to read just the needed parts of an apk, without fully decoding it
+"""
+import os
+import re
+import shutil
+import zipfile
+
+DEX_PATTERN = re.compile(r"^classes\d*\.dex$")
+
+
+def write_trimmed_apk(apk_path, trimmed_apk_path, keep_dex=True):
+    """
+    Writes a copy of the apk containing only what is needed to decode the manifest, the string resources
+    and (optionally) the code, so that apktool doesn't spend time on assets, native libraries and big resources.
+    Resource files that are neither xml nor 9-patch images (e.g. images, audio) are kept as empty files:
+    apktool complains about every resource file it can't find, but doesn't look into raw ones.
+
+    :param apk_path: path of the original apk
+    :param trimmed_apk_path: where the trimmed apk should be written
+    :param keep_dex: if False, dex files are left out as well
+    """
+    with zipfile.ZipFile(apk_path) as apk, zipfile.ZipFile(trimmed_apk_path, "w", zipfile.ZIP_STORED) as trimmed:
+        for info in apk.infolist():
+            name = info.filename
+            if name in ("AndroidManifest.xml", "resources.arsc") or (keep_dex and DEX_PATTERN.match(name)):
+                trimmed.writestr(name, apk.read(info))
+            elif name.startswith("res/") and not name.endswith("/"):
+                if name.endswith((".xml", ".9.png")):
+                    trimmed.writestr(name, apk.read(info))
+                else:
+                    trimmed.writestr(name, b"")
+
+
+def get_native_abis(apk_path):
+    """
+    :param apk_path: path of the apk
+    :return: the set of architectures (ABIs) for which the apk contains native libraries
+    :rtype: set
+    """
+    with zipfile.ZipFile(apk_path) as apk:
+        return set(name.split("/")[1] for name in apk.namelist() if name.startswith("lib/") and name.count("/") >= 2)
+
+
+def extract_native_libs(apk_path, output_path, abis):
+    """
+    Extracts the native libraries of the given architectures, as apktool would
+
+    :param apk_path: path of the apk
+    :param output_path: decoded apk folder; libraries end up in output_path/lib/<abi>/
+    :param abis: architectures whose libraries should be extracted
+    """
+    prefixes = tuple("lib/{0}/".format(abi) for abi in abis)
+    with zipfile.ZipFile(apk_path) as apk:
+        for info in apk.infolist():
+            if info.filename.endswith("/") or not info.filename.startswith(prefixes):
+                continue
+            destination = os.path.join(output_path, *info.filename.split("/"))
+            if not os.path.realpath(destination).startswith(os.path.realpath(output_path) + os.sep):
+                # malicious or broken entry name (e.g. containing ..)
+                continue
+            os.makedirs(os.path.dirname(destination), exist_ok=True)
+            with apk.open(info) as source, open(destination, "wb") as target:
+                shutil.copyfileobj(source, target)
@@ -0,0 +1,262 @@
+"""
+Long-lived apktool JVMs that decode apks on request (see apktool_server/ApktoolServer.java for the protocol)
+"""
+import logging
+import os
+import queue
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+
+SERVER_CLASS = "ApktoolServer"
+SERVER_SOURCE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "apktool_server")
+
+
+class ApktoolServerError(Exception):
+    def __init__(self, value):
+        self.value = value
+
+    def __str__(self):
+        return repr(self.value)
+
+
+def compile_server(source_dir=SERVER_SOURCE_DIR):
+    """
+    Compiles ApktoolServer.java, unless the class file is already up to date. Several processes may do it at the
+    same time: each one compiles into a folder of its own and moves the class files into place, the main class
+    last, so that no process ever loads a half-written class
+
+    :param source_dir: folder containing ApktoolServer.java; the class files are written in the same folder
+    :return: the folder that should be added to the classpath
+    :rtype: str
+    """
+    source = os.path.join(source_dir, SERVER_CLASS + ".java")
+    compiled = os.path.join(source_dir, SERVER_CLASS + ".class")
+    if os.path.exists(compiled) and os.path.getmtime(compiled) >= os.path.getmtime(source):
+        return source_dir
+    output_dir = tempfile.mkdtemp(prefix=".javac-", dir=source_dir)
+    try:
+        try:
+            completed_process = subprocess.run(["javac", "-d", output_dir, source], stdout=subprocess.PIPE,
+                                               stderr=subprocess.PIPE, universal_newlines=True)
+        except OSError as e:
+            raise ApktoolServerError("Unable to run javac: {0}".format(e))
+        if completed_process.returncode != 0:
+            raise ApktoolServerError("Unable to compile {0}: {1}".format(source, completed_process.stderr))
+        # the inner classes (ApktoolServer$...) first
+        for name in sorted(os.listdir(output_dir), key=lambda n: n == SERVER_CLASS + ".class"):
+            os.replace(os.path.join(output_dir, name), os.path.join(source_dir, name))
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+    return source_dir
+
+
+def java_version():
+    """
+    :return: the major version of the installed java (e.g. 8, 17), or None if it can't be determined
+    :rtype: int
+    """
+    try:
+        completed_process = subprocess.run(["java", "-version"], stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                           universal_newlines=True)
+    except OSError:
+        return None
+    # e.g. java version "1.8.0_292", openjdk version "17.0.2" 2022-01-18
+    match = re.search(r'version "(?:1\.)?(\d+)', completed_process.stderr)
+    return int(match.group(1)) if match else None
+
+
+def java_command(apktool_path):
+    """
+    :param apktool_path: where apktool.jar resides
+    :return: the command that starts an apktool server JVM
+    :rtype: list
+    """
+    classpath = os.pathsep.join([apktool_path, compile_server()])
+    command = ["java", "-cp", classpath, SERVER_CLASS]
+    version = java_version()
+    if version is not None and 12 <= version <= 23:
+        # lets the server trap apktool's calls to System.exit (see ApktoolServer.java); from Java 18 it is needed
+        command[1:1] = ["-Djava.security.manager=allow"]
+    return command
+
+
+class ApktoolServer(object):
+    """
+    A single apktool JVM, talking through its stdin/stdout
+    """
+
+    def __init__(self, command, start_timeout=120, request_timeout=600):
+        """
+        constructor for ApktoolServer object
+
+        :param command: command line that starts the server
+        :param start_timeout: seconds to wait for the server to be ready
+        :param request_timeout: seconds to wait for the response to a request, e.g. for an apk to be decoded
+        """
+        self.command = command
+        self.start_timeout = start_timeout
+        self.request_timeout = request_timeout
+        self._process = None
+        self._responses = None
+        self._output = []
+        self.last_used = 0
+
+    def start(self):
+        try:
+            self._process = subprocess.Popen(self.command, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                             stderr=subprocess.PIPE, universal_newlines=True, bufsize=1)
+        except OSError as e:
+            raise ApktoolServerError("Unable to start apktool server: {0}".format(e))
+        self._responses = queue.Queue()
+        self._output = []
+        threading.Thread(target=self._read_responses, args=(self._process.stdout, self._responses),
+                         daemon=True).start()
+        threading.Thread(target=self._read_output, args=(self._process.stderr, self._output), daemon=True).start()
+        response = self._response(self.start_timeout)
+        if response != "READY":
+            self.stop()
+            raise ApktoolServerError("Apktool server failed to start: {0}".format(response))
+        self.last_used = time.time()
+
+    @staticmethod
+    def _read_responses(stream, responses):
+        for line in stream:
+            responses.put(line.rstrip("\n"))
+        responses.put(None)  # the server exited
+
+    @staticmethod
+    def _read_output(stream, output):
+        # keeps the stderr pipe flowing; the lines are returned with the response of the current request
+        for line in stream:
+            output.append(line)
+
+    def _response(self, timeout):
+        try:
+            return self._responses.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def _request(self, fields, timeout):
+        if not self.is_alive():
+            raise ApktoolServerError("Apktool server is not running")
+        del self._output[:]
+        try:
+            self._process.stdin.write("\t".join(fields) + "\n")
+            self._process.stdin.flush()
+        except (OSError, ValueError) as e:
+            raise ApktoolServerError("Unable to send request to apktool server: {0}".format(e))
+        response = self._response(timeout)
+        self.last_used = time.time()
+        if response is None:
+            # either timed out or died; in both cases the server can't be trusted anymore
+            self.stop()
+            raise ApktoolServerError("Apktool server did not respond to {0}; output: {1}".format(
+                fields[0], "".join(self._output)))
+        return response
+
+    def is_alive(self):
+        return self._process is not None and self._process.poll() is None
+
+    def ping(self, timeout=10):
+        """
+        :return: True if the server answers within the timeout
+        :rtype: bool
+        """
+        try:
+            return self._request(["PING"], timeout) == "PONG"
+        except ApktoolServerError:
+            return False
+
+    def decode(self, apk_path, output_path, options=()):
+        """
+        Decodes an apk
+
+        :param apk_path: path of the apk to be decoded
+        :param output_path: decoded apk folder
+        :param options: additional apktool decode options
+        :return: what apktool printed while decoding
+        :rtype: str
+        """
+        response = self._request(["DECODE", apk_path, output_path] + list(options), self.request_timeout)
+        output = "".join(self._output)
+        if response != "OK":
+            raise ApktoolServerError("{0}\n{1}".format(response, output))
+        return output
+
+    def stop(self):
+        if self._process is None:
+            return
+        if self._process.poll() is None:
+            try:
+                self._process.stdin.write("QUIT\n")
+                self._process.stdin.flush()
+                self._process.wait(timeout=5)
+            except (OSError, ValueError, subprocess.TimeoutExpired):
+                self._process.kill()
+                self._process.wait()
+        self._process = None
+
+
+class ApktoolServerPool(object):
+    """
+    A fixed number of apktool servers shared by the threads of a process.
+    Servers are started lazily, health-checked when they have been idle for a while and restarted if they die.
+    """
+
+    def __init__(self, command, size=1, health_check_interval=60, max_start_failures=3, **server_args):
+        """
+        constructor for ApktoolServerPool object
+
+        :param command: command line that starts a server
+        :param size: number of servers
+        :param health_check_interval: a server idle for more than this many seconds is pinged before being used
+        :param max_start_failures: after this many consecutive failed starts the pool gives up (see broken)
+        :param server_args: additional arguments for ApktoolServer
+        """
+        self.health_check_interval = health_check_interval
+        self.max_start_failures = max_start_failures
+        self.broken = False
+        self._start_failures = 0
+        self._lock = threading.Lock()
+        self._servers = queue.Queue()
+        for _ in range(max(1, size)):
+            self._servers.put(ApktoolServer(command, **server_args))
+
+    def _ensure_running(self, server):
+        if server.is_alive() and (time.time() - server.last_used < self.health_check_interval or server.ping()):
+            return
+        if server.is_alive():
+            logging.warning("Apktool server is not responding; restarting it")
+        server.stop()
+        try:
+            server.start()
+        except ApktoolServerError:
+            with self._lock:
+                self._start_failures += 1
+                if self._start_failures >= self.max_start_failures:
+                    self.broken = True
+            raise
+        with self._lock:
+            self._start_failures = 0
+
+    def decode(self, apk_path, output_path, options=()):
+        """
+        Decodes an apk with the first available server; see ApktoolServer.decode
+        """
+        if self.broken:
+            raise ApktoolServerError("Apktool server pool is disabled after {0} failed starts".format(
+                self.max_start_failures))
+        server = self._servers.get()
+        try:
+            self._ensure_running(server)
+            return server.decode(apk_path, output_path, options)
+        finally:
+            self._servers.put(server)
+
+    def stop(self):
+        while not self._servers.empty():
+            self._servers.get().stop()
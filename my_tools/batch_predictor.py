@@ -0,0 +1,108 @@
+"""
+Gathers the classification requests of several threads (e.g. the apks going through the pipeline) into larger
+batches, so that the fixed cost of each predict call is paid once for many apks.
+"""
+import queue
+import threading
+import time
+
+import numpy as np
+
+_CLOSE = object()  # sentinel telling the batching thread to stop
+
+
+class _Request(object):
+    def __init__(self, features):
+        self.features = features
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class BatchPredictor(object):
+    def __init__(self, predict, max_batch_size=8192, max_wait=0.02):
+        """
+        :param predict: called with a 2D array of features, one row for each sample; returns a prediction for each row
+        :param max_batch_size: maximum number of rows predicted at once; a single larger request is predicted alone
+        :param max_wait: seconds the first request of a batch waits for other requests to join it
+        """
+        self._predict = predict
+        self._max_batch_size = max_batch_size
+        self._max_wait = max_wait
+        self._requests = queue.Queue()
+        self._pending = None  # a request taken from the queue that didn't fit in the previous batch
+        self._batches = 0
+        self._rows = 0
+        self._thread = threading.Thread(target=self._work, name="batch-predictor", daemon=True)
+        self._thread.start()
+
+    def predict(self, features):
+        """
+        Predicts the features along with the ones of the other callers; blocks until the prediction is done
+
+        :param features: 2D array-like, one row for each sample
+        :return: the predictions, in the same order as the rows
+        :rtype: numpy.ndarray
+        """
+        request = _Request(np.asarray(features))
+        self._requests.put(request)
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def get_stats(self):
+        """
+        :return: the number of predict calls made and the number of rows predicted
+        :rtype: tuple
+        """
+        return self._batches, self._rows
+
+    def close(self):
+        """
+        Stops the batching thread, after the requests already made have been predicted
+        """
+        self._requests.put(_CLOSE)
+        self._thread.join()
+
+    def _next_batch(self):
+        first = self._pending if self._pending is not None else self._requests.get()
+        self._pending = None
+        if first is _CLOSE:
+            return None
+        batch = [first]
+        rows = len(first.features)
+        deadline = time.monotonic() + self._max_wait
+        while rows < self._max_batch_size:
+            try:
+                request = self._requests.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            if request is _CLOSE or rows + len(request.features) > self._max_batch_size:
+                self._pending = request
+                break
+            batch.append(request)
+            rows += len(request.features)
+        return batch
+
+    def _work(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                break
+            try:
+                if len(batch) == 1:
+                    predictions = self._predict(batch[0].features)
+                else:
+                    predictions = self._predict(np.concatenate([request.features for request in batch]))
+                self._batches += 1
+                self._rows += len(predictions)
+                start = 0
+                for request in batch:
+                    request.result = predictions[start:start + len(request.features)]
+                    start += len(request.features)
+            except Exception as e:
+                for request in batch:
+                    request.error = e
+            for request in batch:
+                request.done.set()
@@ -0,0 +1,267 @@
+"""
+Writes rows into columnar files, buffering them and writing a row group at a time, so that the consumers can load
+whole columns instead of parsing a json object for each row.
+
+The files are Parquet files (requires pyarrow) or, as a fallback, gzipped files with a json object for each row
+group, holding the values of each column in a list; in both formats the columns with many repeated values are
+dictionary encoded. Every process writes its own files; a file is written with a .part suffix, removed when the
+file is complete (when it is older than file_max_age, or the writer is closed), so only complete files end with
+the extension of their format.
+"""
+import gzip
+import json
+import os
+import sys
+import threading
+import time
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+FORMATS = {"parquet": ".parquet", "json": ".columns.jsonl.gz"}
+PART_SUFFIX = ".part"
+PARQUET_COMPRESSION = "zstd"
+
+# types of the columns
+TYPE_STRING = "string"
+TYPE_INT = "int"
+TYPE_BOOL = "bool"
+TYPE_STRING_LIST = "string_list"
+
+
+def _arrow_type(column_type):
+    return {TYPE_STRING: pyarrow.string(), TYPE_INT: pyarrow.int64(), TYPE_BOOL: pyarrow.bool_(),
+            TYPE_STRING_LIST: pyarrow.list_(pyarrow.string())}[column_type]
+
+
+def _dictionary_encode(values):
+    """
+    :return: the distinct values, in order of appearance, and the index of each value among them
+    :rtype: tuple
+    """
+    positions = {}
+    dictionary = []
+    indices = []
+    for value in values:
+        position = positions.get(value)
+        if position is None:
+            position = positions[value] = len(dictionary)
+            dictionary.append(value)
+        indices.append(position)
+    return dictionary, indices
+
+
+class ColumnarWriter(object):
+    def __init__(self, folder, prefix, columns, file_format="parquet", row_group_size=65536, file_max_age=3600):
+        """
+        :param folder: where the files are written; created when the first file is
+        :param prefix: prefix of the names of the files
+        :param columns: (name, type, dictionary encoded) of each column, e.g. ("package", TYPE_STRING, True)
+        :param file_format: parquet (requires pyarrow) or json
+        :param row_group_size: number of rows written together, as a row group
+        :param file_max_age: a file is completed when it is this many seconds old
+        """
+        if file_format not in FORMATS:
+            raise ValueError("Unknown columnar format: {0}".format(file_format))
+        if file_format == "parquet" and pyarrow is None:
+            raise ImportError("parquet format needs the pyarrow package")
+        self.folder = folder
+        self.prefix = prefix
+        self.columns = columns
+        self.file_format = file_format
+        self.row_group_size = row_group_size
+        self.file_max_age = file_max_age
+        self._values = {name: [] for name, _, _ in columns}
+        self._rows = 0
+        self._first_row_time = None
+        self._lock = threading.Lock()
+        self._count = 0
+        self._file = None
+        # waiting for the current file to be complete, and ready to be called; see when_complete
+        self._callbacks = []
+        self._ready = []
+        if file_format == "parquet":
+            self._schema = pyarrow.schema([(name, _arrow_type(column_type)) for name, column_type, _ in columns])
+
+    def write(self, rows):
+        """
+        Buffers the rows, writing a row group when row_group_size rows are waiting
+
+        :param rows: a dict for each row, with the value of each column (missing columns are null, others ignored)
+        """
+        with self._lock:
+            for row in rows:
+                for name, values in self._values.items():
+                    values.append(row.get(name))
+            if rows and self._first_row_time is None:
+                self._first_row_time = time.monotonic()
+            self._rows += len(rows)
+            while self._rows >= self.row_group_size:
+                self._write_row_group(self.row_group_size)
+            self._complete_if_old()
+        self._run_ready()
+
+    def when_complete(self, callback):
+        """
+        Calls callback once the rows written so far are in a complete file: a Parquet file can't be read before
+        its footer is written
+
+        :param callback: function without arguments; it may be called by another thread
+        """
+        with self._lock:
+            if self._rows or self._file is not None:
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def flush(self, max_wait=None):
+        """
+        Writes the rows waiting as a row group, and completes the current file (with all the rows waiting) if it
+        is older than file_max_age
+
+        :param max_wait: write the rows only if the oldest one has been waiting for this many seconds; None means
+        always
+        """
+        with self._lock:
+            if self._rows and (max_wait is None or time.monotonic() - self._first_row_time >= max_wait):
+                self._write_row_group(self._rows)
+            self._complete_if_old()
+        self._run_ready()
+
+    def close(self):
+        """
+        Writes the rows waiting and completes the current file, if any
+        """
+        with self._lock:
+            if self._rows:
+                self._write_row_group(self._rows)
+            if self._file is not None:
+                self._complete()
+        self._run_ready()
+
+    def _write_row_group(self, size):
+        group = {}
+        for name, values in self._values.items():
+            group[name] = values[:size]
+            del values[:size]
+        self._rows -= size
+        self._first_row_time = time.monotonic() if self._rows else None
+        if self._file is None:
+            self._open()
+        if self.file_format == "parquet":
+            table = pyarrow.Table.from_pydict(group, schema=self._schema)
+            self._file.write_table(table, row_group_size=size)
+        else:
+            columns = {}
+            for name, _, dictionary_encoded in self.columns:
+                if dictionary_encoded:
+                    dictionary, indices = _dictionary_encode(group[name])
+                    columns[name] = {"dictionary": dictionary, "indices": indices}
+                else:
+                    columns[name] = group[name]
+            self._file.write((json.dumps({"rows": size, "columns": columns}) + "\n").encode('utf-8'))
+
+    def _complete_if_old(self):
+        if self._file is not None and time.time() - self._created >= self.file_max_age:
+            self._complete()
+
+    def _open(self):
+        self._count += 1
+        self._created = time.time()
+        name = "{0}-{1}-{2}-{3}{4}".format(self.prefix, time.strftime("%Y%m%d%H%M%S"), os.getpid(), self._count,
+                                           FORMATS[self.file_format])
+        self._path = os.path.join(self.folder, name)
+        os.makedirs(self.folder, exist_ok=True)
+        if self.file_format == "parquet":
+            self._file = pyarrow.parquet.ParquetWriter(
+                self._path + PART_SUFFIX, self._schema, compression=PARQUET_COMPRESSION,
+                use_dictionary=[name for name, _, dictionary_encoded in self.columns if dictionary_encoded])
+        else:
+            self._file = gzip.open(self._path + PART_SUFFIX, 'wb')
+
+    def _complete(self):
+        # the rows still waiting go into the file too, so that every callback waiting for it can be called
+        if self._rows:
+            self._write_row_group(self._rows)
+        self._file.close()
+        self._file = None
+        os.rename(self._path + PART_SUFFIX, self._path)
+        self._ready += self._callbacks
+        self._callbacks = []
+
+    def _run_ready(self):
+        # outside of the lock, the callbacks may take a while
+        with self._lock:
+            ready = self._ready
+            self._ready = []
+        for callback in ready:
+            callback()
+
+
+def iter_row_groups(path):
+    """
+    :param path: path of a complete file, in any of the formats
+    :return: the row groups of the file, as the list of the values of each column, by name
+    :rtype: generator of dict
+    """
+    if path.endswith(FORMATS["parquet"]):
+        if pyarrow is None:
+            raise ImportError("parquet format needs the pyarrow package")
+        parquet_file = pyarrow.parquet.ParquetFile(path)
+        for i in range(parquet_file.num_row_groups):
+            yield parquet_file.read_row_group(i).to_pydict()
+    else:
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                group = {}
+                for name, values in json.loads(line)["columns"].items():
+                    if isinstance(values, dict):
+                        values = [values["dictionary"][index] for index in values["indices"]]
+                    group[name] = values
+                yield group
+
+
+def list_files(folder):
+    """
+    :param folder: folder of the files
+    :return: the paths of the complete files, in any of the formats, oldest first
+    :rtype: list
+    """
+    if not os.path.isdir(folder):
+        return []
+    paths = [os.path.join(folder, name) for name in os.listdir(folder)
+             if any(name.endswith(extension) for extension in FORMATS.values())]
+    return sorted(paths, key=os.path.getmtime)
+
+
+def iter_rows(folder):
+    """
+    :param folder: folder of the files
+    :return: the rows of all the complete files, as dicts
+    :rtype: generator of dict
+    """
+    for path in list_files(folder):
+        for group in iter_row_groups(path):
+            names = list(group)
+            for values in zip(*(group[name] for name in names)):
+                yield dict(zip(names, values))
+
+
+def main(argv):
+    if len(argv) == 2:
+        for path in list_files(argv[1]):
+            groups = list(iter_row_groups(path))
+            rows = sum(len(next(iter(group.values()), [])) for group in groups)
+            print("{0}: {1} row groups, {2} rows".format(os.path.basename(path), len(groups), rows))
+    elif len(argv) == 3 and argv[1] == "--rows":
+        for row in iter_rows(argv[2]):
+            print(json.dumps(row))
+    else:
+        print("Usage: python {0} [--rows] path/to/columnar/folder".format(argv[0]))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,755 @@
+"""
+A partial reader for dex files that finds the same strings SmaliParser finds in the smali code produced by
+apktool (baksmali), without disassembling the dex files to text first.
+
+Only what SmaliParser looks at is decoded: for every class, the smali lines that matter to SmaliParser
+(class, static field values, methods, const-string, aput-object, iput-object, sput-object, invoke, .local ...)
+are rebuilt from the dex structures and fed to the same state machine (see smali_parser.parse_lines), while
+every other instruction or directive is replaced by a comment line, that has the same effect on the parser.
+"""
+import bisect
+import decimal
+import logging
+import mmap
+import os
+import re
+import struct
+import sys
+import zipfile
+
+from my_tools.smali_parser import parse_lines
+
+DEX_FILE_PATTERN = re.compile(r"^classes(\d*)\.dex$")
+# any line that SmaliParser doesn't recognize resets its state, exactly like the lines it replaces
+RESET = "#"
+
+# size, in 16-bit code units, of every instruction; payloads (opcode 0x00 with a non-zero identifier) apart
+_INSTRUCTION_SIZES = [1] * 256
+for _first, _last, _size in ((0x02, 0x02, 2), (0x03, 0x03, 3), (0x05, 0x05, 2), (0x06, 0x06, 3), (0x08, 0x08, 2),
+                             (0x09, 0x09, 3), (0x13, 0x13, 2), (0x14, 0x14, 3), (0x15, 0x16, 2), (0x17, 0x17, 3),
+                             (0x18, 0x18, 5), (0x19, 0x1a, 2), (0x1b, 0x1b, 3), (0x1c, 0x1c, 2), (0x1f, 0x20, 2),
+                             (0x22, 0x23, 2), (0x24, 0x26, 3), (0x29, 0x29, 2), (0x2a, 0x2c, 3), (0x2d, 0x3d, 2),
+                             (0x44, 0x6d, 2), (0x6e, 0x72, 3), (0x74, 0x78, 3), (0x90, 0xaf, 2), (0xd0, 0xe2, 2),
+                             (0xfa, 0xfb, 4), (0xfc, 0xfd, 3), (0xfe, 0xff, 2)):
+    for _opcode in range(_first, _last + 1):
+        _INSTRUCTION_SIZES[_opcode] = _size
+
+_INVOKE_KINDS = {0x6e: "virtual", 0x6f: "super", 0x70: "direct", 0x71: "static", 0x72: "interface"}
+
+# how baksmali escapes strings: printable ascii as is (but quotes and backslash), \n \r \t, anything else as \uXXXX
+_NEEDS_ESCAPE = re.compile(r"[^\x20-\x7e]|['\"\\\\]")
+_ESCAPES = {c: "\\u{0:04x}".format(c) for c in range(0x80)}
+_ESCAPES.update({c: chr(c) for c in range(0x20, 0x7f)})
+_ESCAPES.update({ord("'"): "\\'", ord('"'): '\\"', ord("\\"): "\\\\", ord("\n"): "\\n", ord("\r"): "\\r",
+                 ord("\t"): "\\t"})
+
+# encoded_value types
+_VALUE_BYTE = 0x00
+_VALUE_SHORT = 0x02
+_VALUE_CHAR = 0x03
+_VALUE_INT = 0x04
+_VALUE_LONG = 0x06
+_VALUE_FLOAT = 0x10
+_VALUE_DOUBLE = 0x11
+_VALUE_METHOD_TYPE = 0x15
+_VALUE_METHOD_HANDLE = 0x16
+_VALUE_STRING = 0x17
+_VALUE_TYPE = 0x18
+_VALUE_FIELD = 0x19
+_VALUE_METHOD = 0x1a
+_VALUE_ENUM = 0x1b
+_VALUE_ARRAY = 0x1c
+_VALUE_ANNOTATION = 0x1d
+_VALUE_NULL = 0x1e
+_VALUE_BOOLEAN = 0x1f
+
+
+class DexFormatError(Exception):
+    def __init__(self, value):
+        self.value = value
+
+    def __str__(self):
+        return repr(self.value)
+
+
+def escape_string(value):
+    """
+    :param value: a string, as a sequence of UTF-16 code units (i.e. surrogate pairs are kept as two characters)
+    :return: the string as baksmali writes it, without quotes
+    :rtype: str
+    """
+    if not _NEEDS_ESCAPE.search(value):
+        return value
+    return "".join(_ESCAPES[ord(c)] if ord(c) < 0x80 else "\\u{0:04x}".format(ord(c)) for c in value)
+
+
+def _read_uleb128(data, offset):
+    result = 0
+    shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        result |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return result, offset
+        shift += 7
+
+
+def _read_sleb128(data, offset):
+    result = 0
+    shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        result |= (byte & 0x7f) << shift
+        shift += 7
+        if byte < 0x80:
+            if byte & 0x40:
+                result -= 1 << shift
+            return result, offset
+
+
+def _decode_mutf8(raw):
+    """
+    Decodes the MUTF-8 string data of a dex file into UTF-16 code units, one character each
+    """
+    try:
+        return raw.decode("ascii")
+    except UnicodeDecodeError:
+        pass
+    units = []
+    i = 0
+    size = len(raw)
+    while i < size:
+        byte = raw[i]
+        if byte < 0x80:
+            units.append(byte)
+            i += 1
+        elif byte & 0xe0 == 0xc0 and i + 1 < size:
+            units.append(((byte & 0x1f) << 6) | (raw[i + 1] & 0x3f))
+            i += 2
+        elif byte & 0xf0 == 0xe0 and i + 2 < size:
+            units.append(((byte & 0x0f) << 12) | ((raw[i + 1] & 0x3f) << 6) | (raw[i + 2] & 0x3f))
+            i += 3
+        else:
+            raise DexFormatError("Invalid MUTF-8 string data: {0!r}".format(raw))
+    return "".join(map(chr, units))
+
+
+def _format_hex(value, suffix=""):
+    if value < 0:
+        return "-0x{0:x}{1}".format(-value, suffix)
+    return "0x{0:x}{1}".format(value, suffix)
+
+
+def _format_java_floating(value, shortest):
+    """
+    Formats a float as Java's Float.toString/Double.toString do
+
+    :param value: the number
+    :param shortest: the shortest decimal representation that identifies the number
+    """
+    if value != value:
+        return "NaN"
+    if value in (float("inf"), float("-inf")):
+        return "Infinity" if value > 0 else "-Infinity"
+    sign, digits, exponent = decimal.Decimal(shortest).as_tuple()
+    digits = list(digits)
+    while len(digits) > 1 and digits[-1] == 0:
+        digits.pop()
+        exponent += 1
+    scientific_exponent = len(digits) + exponent - 1
+    prefix = "-" if sign else ""
+    if -3 <= scientific_exponent < 7:
+        plain = format(decimal.Decimal((0, digits, exponent)), "f")
+        if "." not in plain:
+            plain += ".0"
+        return prefix + plain
+    mantissa = "".join(map(str, digits[1:])) or "0"
+    return "{0}{1}.{2}E{3}".format(prefix, digits[0], mantissa, scientific_exponent)
+
+
+def _shortest_float32(value):
+    for precision in range(1, 10):
+        candidate = "{0:.{1}g}".format(value, precision)
+        if struct.unpack("<f", struct.pack("<f", float(candidate)))[0] == value:
+            return candidate
+    return repr(value)
+
+
+class DexParser(object):
+    """
+    Reads the strings of the classes contained in a dex file, see
+    https://source.android.com/devices/tech/dalvik/dex-format
+    """
+
+    def __init__(self, data, offset=0):
+        """
+        constructor for DexParser object
+
+        :param data: a buffer containing the dex file, e.g. bytes or mmap
+        :param offset: where the dex file starts in data (e.g. for a dex stored uncompressed in a memory-mapped apk)
+        """
+        self._data = data
+        self._base = offset
+        if len(data) < offset + 0x70 or bytes(data[offset:offset + 4]) != b"dex\n":
+            raise DexFormatError("Not a dex file")
+        (endian_tag,) = struct.unpack_from("<I", data, offset + 0x28)
+        if endian_tag != 0x12345678:
+            raise DexFormatError("Unsupported endianness")
+        (self._string_ids_size, self._string_ids_off,
+         self._type_ids_size, self._type_ids_off,
+         self._proto_ids_size, self._proto_ids_off,
+         self._field_ids_size, self._field_ids_off,
+         self._method_ids_size, self._method_ids_off,
+         self._class_defs_size, self._class_defs_off) = struct.unpack_from("<12I", data, offset + 0x38)
+        self._strings = {}
+        self._escaped_strings = {}
+        self._types = {}
+        self._fields = {}
+        self._methods = {}
+        self._protos = {}
+
+    def _unpack(self, fmt, offset):
+        return struct.unpack_from(fmt, self._data, self._base + offset)
+
+    def _uleb128(self, offset):
+        value, position = _read_uleb128(self._data, self._base + offset)
+        return value, position - self._base
+
+    def _sleb128(self, offset):
+        value, position = _read_sleb128(self._data, self._base + offset)
+        return value, position - self._base
+
+    def get_string(self, index):
+        """
+        :param index: index in the string_ids list
+        :return: the string, with UTF-16 surrogates kept as separate characters
+        :rtype: str
+        """
+        string = self._strings.get(index)
+        if string is None:
+            if index >= self._string_ids_size:
+                raise DexFormatError("String index out of range: {0}".format(index))
+            (string_data_off,) = self._unpack("<I", self._string_ids_off + index * 4)
+            _, start = self._uleb128(string_data_off)
+            start += self._base
+            end = self._data.find(b"\0", start)
+            if end < 0:
+                raise DexFormatError("Unterminated string data at {0}".format(string_data_off))
+            string = _decode_mutf8(bytes(self._data[start:end]))
+            self._strings[index] = string
+        return string
+
+    def _escaped_string(self, index):
+        string = self._escaped_strings.get(index)
+        if string is None:
+            string = escape_string(self.get_string(index))
+            self._escaped_strings[index] = string
+        return string
+
+    def get_type(self, index):
+        """
+        :param index: index in the type_ids list
+        :return: the type descriptor, e.g. Ljava/lang/String;
+        :rtype: str
+        """
+        descriptor = self._types.get(index)
+        if descriptor is None:
+            if index >= self._type_ids_size:
+                raise DexFormatError("Type index out of range: {0}".format(index))
+            descriptor = self.get_string(self._unpack("<I", self._type_ids_off + index * 4)[0])
+            self._types[index] = descriptor
+        return descriptor
+
+    def _get_proto(self, index):
+        proto = self._protos.get(index)
+        if proto is None:
+            _, return_type_idx, parameters_off = self._unpack("<3I", self._proto_ids_off + index * 12)
+            parameters = ""
+            if parameters_off:
+                (size,) = self._unpack("<I", parameters_off)
+                parameters = "".join(self.get_type(t) for t in self._unpack("<{0}H".format(size), parameters_off + 4))
+            proto = "({0}){1}".format(parameters, self.get_type(return_type_idx))
+            self._protos[index] = proto
+        return proto
+
+    def get_field(self, index):
+        """
+        :param index: index in the field_ids list
+        :return: the field reference, as written by baksmali, e.g. Lcom/example/A;->name:Ljava/lang/String;
+        :rtype: str
+        """
+        field = self._fields.get(index)
+        if field is None:
+            class_idx, type_idx, name_idx = self._unpack("<2HI", self._field_ids_off + index * 8)
+            field = "{0}->{1}:{2}".format(self.get_type(class_idx), self.get_string(name_idx), self.get_type(type_idx))
+            self._fields[index] = field
+        return field
+
+    def _field_name_and_type(self, index):
+        _, type_idx, name_idx = self._unpack("<2HI", self._field_ids_off + index * 8)
+        return self.get_string(name_idx), self.get_type(type_idx)
+
+    def get_method(self, index):
+        """
+        :param index: index in the method_ids list
+        :return: the method reference, as written by baksmali, e.g. Lcom/example/A;->name(I)V
+        :rtype: str
+        """
+        method = self._methods.get(index)
+        if method is None:
+            class_idx, proto_idx, name_idx = self._unpack("<2HI", self._method_ids_off + index * 8)
+            method = "{0}->{1}{2}".format(self.get_type(class_idx), self.get_string(name_idx),
+                                          self._get_proto(proto_idx))
+            self._methods[index] = method
+        return method
+
+    def get_class_descriptors(self):
+        """
+        :return: the descriptors of the classes defined in the dex file, in order
+        :rtype: list of str
+        """
+        return [self.get_type(self._unpack("<I", self._class_defs_off + i * 32)[0])
+                for i in range(self._class_defs_size)]
+
+    def get_strings(self, class_prefix=""):
+        """
+        Extracts the strings of the classes defined in the dex file
+
+        :param class_prefix: only the classes whose descriptor starts with this prefix are considered,
+                             e.g. Lcom/example/
+        :return: the strings, as SmaliParser would have found them in the smali code of the same classes
+        :rtype: list of SmaliString
+        """
+        strings = []
+        for index, descriptor in enumerate(self.get_class_descriptors()):
+            if descriptor.startswith(class_prefix):
+                strings += parse_lines(self.get_class_lines(index))
+        return strings
+
+    def get_class_lines(self, index):
+        """
+        :param index: index in the class_defs list
+        :return: the smali lines of the class that matter to SmaliParser
+        :rtype: list of str
+        """
+        class_idx, _, _, _, _, _, class_data_off, static_values_off = self._unpack(
+            "<8I", self._class_defs_off + index * 32)
+        lines = [".class {0}".format(self.get_type(class_idx))]
+        if not class_data_off:
+            return lines
+        static_fields_size, offset = self._uleb128(class_data_off)
+        instance_fields_size, offset = self._uleb128(offset)
+        direct_methods_size, offset = self._uleb128(offset)
+        virtual_methods_size, offset = self._uleb128(offset)
+
+        static_fields = []
+        field_idx = 0
+        for _ in range(static_fields_size):
+            field_idx_diff, offset = self._uleb128(offset)
+            _, offset = self._uleb128(offset)
+            field_idx += field_idx_diff
+            static_fields.append(field_idx)
+        for _ in range(instance_fields_size):
+            _, offset = self._uleb128(offset)
+            _, offset = self._uleb128(offset)
+
+        if static_values_off:
+            # only fields with a non-default initial value get a "= value" in the smali code
+            size, value_offset = self._uleb128(static_values_off)
+            for field_idx in static_fields[:size]:
+                value, value_offset = self._read_value(value_offset)
+                if value is not None:
+                    name, field_type = self._field_name_and_type(field_idx)
+                    lines.append(".field {0}:{1} = {2}".format(name, field_type, value))
+
+        for methods_size in (direct_methods_size, virtual_methods_size):
+            method_idx = 0
+            for _ in range(methods_size):
+                method_idx_diff, offset = self._uleb128(offset)
+                _, offset = self._uleb128(offset)
+                code_off, offset = self._uleb128(offset)
+                method_idx += method_idx_diff
+                if code_off:
+                    self._add_method_lines(lines, method_idx, code_off)
+        return lines
+
+    def _read_value(self, offset):
+        """
+        Reads an encoded_value
+
+        :return: the value as baksmali writes it in a field declaration (None for default values, that baksmali
+                 omits) and the offset of the next value
+        """
+        (header,) = self._unpack("<B", offset)
+        offset += 1
+        value_type = header & 0x1f
+        value_arg = header >> 5
+        if value_type == _VALUE_NULL:
+            return None, offset
+        if value_type == _VALUE_BOOLEAN:
+            return ("true" if value_arg else None), offset
+        if value_type == _VALUE_ARRAY:
+            size, offset = self._uleb128(offset)
+            for _ in range(size):
+                _, offset = self._read_value(offset)
+            # baksmali writes arrays on several lines; nothing useful for SmaliParser
+            return None, offset
+        if value_type == _VALUE_ANNOTATION:
+            _, offset = self._uleb128(offset)
+            size, offset = self._uleb128(offset)
+            for _ in range(size):
+                _, offset = self._uleb128(offset)
+                _, offset = self._read_value(offset)
+            return None, offset
+
+        size = value_arg + 1
+        raw = bytes(self._data[self._base + offset:self._base + offset + size])
+        offset += size
+        if value_type in (_VALUE_FLOAT, _VALUE_DOUBLE):
+            # right-zero-extended
+            width = 4 if value_type == _VALUE_FLOAT else 8
+            raw = b"\0" * (width - size) + raw
+            number = struct.unpack("<f" if width == 4 else "<d", raw)[0]
+            if number == 0:
+                return None, offset
+            if width == 4:
+                return _format_java_floating(number, _shortest_float32(number)) + "f", offset
+            return _format_java_floating(number, repr(number)), offset
+
+        signed = value_type in (_VALUE_BYTE, _VALUE_SHORT, _VALUE_INT, _VALUE_LONG)
+        number = int.from_bytes(raw, "little", signed=signed)
+        if value_type in (_VALUE_BYTE, _VALUE_SHORT, _VALUE_CHAR, _VALUE_INT, _VALUE_LONG) and number == 0:
+            return None, offset
+        if value_type == _VALUE_BYTE:
+            return _format_hex(number, "t"), offset
+        if value_type == _VALUE_SHORT:
+            return _format_hex(number, "s"), offset
+        if value_type == _VALUE_CHAR:
+            return "'{0}'".format(escape_string(chr(number))), offset
+        if value_type == _VALUE_INT:
+            return _format_hex(number), offset
+        if value_type == _VALUE_LONG:
+            return _format_hex(number, "L"), offset
+        if value_type == _VALUE_STRING:
+            return '"{0}"'.format(self._escaped_string(number)), offset
+        if value_type == _VALUE_TYPE:
+            return self.get_type(number), offset
+        if value_type == _VALUE_FIELD:
+            return self.get_field(number), offset
+        if value_type == _VALUE_ENUM:
+            return ".enum {0}".format(self.get_field(number)), offset
+        if value_type == _VALUE_METHOD:
+            return self.get_method(number), offset
+        if value_type == _VALUE_METHOD_TYPE:
+            return self._get_proto(number), offset
+        if value_type == _VALUE_METHOD_HANDLE:
+            return None, offset
+        raise DexFormatError("Unknown encoded value type 0x{0:x}".format(value_type))
+
+    def _add_method_lines(self, lines, method_idx, code_off):
+        registers_size, ins_size, _, tries_size, debug_info_off, insns_size = self._unpack("<4H2I", code_off)
+        insns_off = code_off + 16
+        start = self._base + insns_off
+        # quick check on the low byte of each code unit: most methods don't load any string
+        opcodes = bytes(self._data[start:start + insns_size * 2:2])
+        if b"\x1a" not in opcodes and b"\x1b" not in opcodes:
+            return
+        insns = self._unpack("<{0}H".format(insns_size), insns_off)
+        first_parameter = registers_size - ins_size
+
+        def register(number):
+            if number >= first_parameter:
+                return "p{0}".format(number - first_parameter)
+            return "v{0}".format(number)
+
+        # (address, order, line); the order of the items at the same address follows baksmali:
+        # debug directives, labels, the instruction itself, the end of try blocks
+        items = []
+        labels = set()
+        addresses = []
+        address = 0
+        while address < insns_size:
+            unit = insns[address]
+            opcode = unit & 0xff
+            addresses.append(address)
+            if opcode == 0x00 and unit >> 8:
+                items.append((address, 100, RESET))
+                address += self._payload_size(insns, address)
+                continue
+            size = _INSTRUCTION_SIZES[opcode]
+            if address + size > insns_size:
+                raise DexFormatError("Truncated instruction in {0}".format(self.get_method(method_idx)))
+            items.append((address, 100, self._instruction_line(insns, address, opcode, register)))
+            labels.update(self._branch_targets(insns, address, opcode))
+            address += size
+
+        if tries_size:
+            tries_off = insns_off + insns_size * 2 + (insns_size % 2) * 2
+            handlers_off = tries_off + tries_size * 8
+            for i in range(tries_size):
+                start_addr, insn_count, handler_off = self._unpack("<I2H", tries_off + i * 8)
+                labels.add(start_addr)
+                labels.update(self._catch_handlers(handlers_off + handler_off))
+                last = bisect.bisect_left(addresses, start_addr + insn_count) - 1
+                if last >= 0 and addresses[last] >= start_addr:
+                    items.append((addresses[last], 101, RESET))
+        for label in labels:
+            items.append((label, 0, RESET))
+        if debug_info_off:
+            items += self._debug_items(debug_info_off, register)
+        items.sort(key=lambda item: (item[0], item[1]))
+
+        lines.append(".method {0}".format(self.get_method(method_idx).split("->", 1)[1]))
+        for _, _, line in items:
+            if line is RESET and lines[-1] is RESET:
+                continue
+            lines.append(line)
+        lines.append(".end method")
+
+    @staticmethod
+    def _payload_size(insns, address):
+        identifier = insns[address] >> 8
+        size = insns[address + 1] if address + 1 < len(insns) else 0
+        if identifier == 0x01:  # packed-switch-payload
+            return 4 + size * 2
+        if identifier == 0x02:  # sparse-switch-payload
+            return 2 + size * 4
+        if identifier == 0x03:  # fill-array-data-payload
+            element_width = size
+            elements = insns[address + 2] | (insns[address + 3] << 16)
+            return 4 + (elements * element_width + 1) // 2
+        return 1
+
+    @staticmethod
+    def _signed32(low, high):
+        value = low | (high << 16)
+        return value - (1 << 32) if value & 0x80000000 else value
+
+    def _branch_targets(self, insns, address, opcode):
+        if opcode == 0x28:  # goto
+            offset = insns[address] >> 8
+            return [address + (offset - 0x100 if offset & 0x80 else offset)]
+        if opcode == 0x29 or 0x32 <= opcode <= 0x3d:  # goto/16, if-*
+            offset = insns[address + 1]
+            return [address + (offset - 0x10000 if offset & 0x8000 else offset)]
+        if opcode == 0x2a:  # goto/32
+            return [address + self._signed32(insns[address + 1], insns[address + 2])]
+        if opcode in (0x26, 0x2b, 0x2c):  # fill-array-data, packed-switch, sparse-switch
+            payload = address + self._signed32(insns[address + 1], insns[address + 2])
+            targets = [payload]
+            if opcode != 0x26 and 0 <= payload < len(insns) - 1:
+                size = insns[payload + 1]
+                first = payload + (4 if opcode == 0x2b else 2 + size * 2)
+                for i in range(size):
+                    if first + i * 2 + 1 < len(insns):
+                        targets.append(address + self._signed32(insns[first + i * 2], insns[first + i * 2 + 1]))
+            return targets
+        return []
+
+    def _catch_handlers(self, offset):
+        size, offset = self._sleb128(offset)
+        addresses = []
+        for _ in range(abs(size)):
+            _, offset = self._uleb128(offset)
+            address, offset = self._uleb128(offset)
+            addresses.append(address)
+        if size <= 0:
+            address, offset = self._uleb128(offset)
+            addresses.append(address)
+        return addresses
+
+    def _instruction_line(self, insns, address, opcode, register):
+        unit = insns[address]
+        if opcode == 0x1a:
+            return 'const-string {0}, "{1}"'.format(register(unit >> 8), self._escaped_string(insns[address + 1]))
+        if opcode == 0x1b:
+            return 'const-string/jumbo {0}, "{1}"'.format(
+                register(unit >> 8), self._escaped_string(insns[address + 1] | (insns[address + 2] << 16)))
+        if opcode == 0x12:
+            value = unit >> 12
+            return "const/4 {0}, {1}".format(register((unit >> 8) & 0xf), _format_hex(value - 16 if value & 8 else value))
+        if opcode == 0x23:
+            return "new-array {0}, {1}, {2}".format(register((unit >> 8) & 0xf), register(unit >> 12),
+                                                   self.get_type(insns[address + 1]))
+        if opcode == 0x26:
+            return "fill-array-data {0}, :array_{1:x}".format(
+                register(unit >> 8), address + self._signed32(insns[address + 1], insns[address + 2]))
+        if opcode == 0x4d:
+            return "aput-object {0}, {1}, {2}".format(register(unit >> 8), register(insns[address + 1] & 0xff),
+                                                     register(insns[address + 1] >> 8))
+        if opcode == 0x5b:
+            return "iput-object {0}, {1}, {2}".format(register((unit >> 8) & 0xf), register(unit >> 12),
+                                                     self.get_field(insns[address + 1]))
+        if opcode == 0x69:
+            return "sput-object {0}, {1}".format(register(unit >> 8), self.get_field(insns[address + 1]))
+        if 0x6e <= opcode <= 0x72 or opcode == 0xfa:
+            count = unit >> 12
+            arguments = insns[address + 2]
+            registers = [arguments & 0xf, (arguments >> 4) & 0xf, (arguments >> 8) & 0xf, arguments >> 12,
+                         (unit >> 8) & 0xf][:count]
+            return self._invoke_line(opcode, ", ".join(map(register, registers)), insns, address)
+        if 0x74 <= opcode <= 0x78 or opcode == 0xfb:
+            count = unit >> 8
+            first = insns[address + 2]
+            registers = "{0} .. {1}".format(register(first), register(first + count - 1)) if count else ""
+            return self._invoke_line(opcode, registers, insns, address)
+        # includes invoke-custom: baksmali writes its call site in a form that SmaliParser can't make sense of
+        return RESET
+
+    def _invoke_line(self, opcode, registers, insns, address):
+        if opcode in (0xfa, 0xfb):
+            return "invoke-polymorphic{0} {{{1}}}, {2}, {3}".format(
+                "/range" if opcode == 0xfb else "", registers, self.get_method(insns[address + 1]),
+                self._get_proto(insns[address + 3]))
+        if opcode >= 0x74:
+            kind = _INVOKE_KINDS[opcode - 6] + "/range"
+        else:
+            kind = _INVOKE_KINDS[opcode]
+        return "invoke-{0} {{{1}}}, {2}".format(kind, registers, self.get_method(insns[address + 1]))
+
+    def _debug_items(self, offset, register):
+        items = []
+        _, offset = self._uleb128(offset)  # line_start
+        parameters_size, offset = self._uleb128(offset)
+        for _ in range(parameters_size):
+            _, offset = self._uleb128(offset)
+        address = 0
+        while True:
+            (opcode,) = self._unpack("<B", offset)
+            offset += 1
+            if opcode == 0x00:  # DBG_END_SEQUENCE
+                break
+            elif opcode == 0x01:  # DBG_ADVANCE_PC
+                address_diff, offset = self._uleb128(offset)
+                address += address_diff
+            elif opcode == 0x02:  # DBG_ADVANCE_LINE
+                _, offset = self._sleb128(offset)
+            elif opcode in (0x03, 0x04):  # DBG_START_LOCAL, DBG_START_LOCAL_EXTENDED
+                number, offset = self._uleb128(offset)
+                name_idx, offset = self._uleb128(offset)
+                type_idx, offset = self._uleb128(offset)
+                signature_idx = 0
+                if opcode == 0x04:
+                    signature_idx, offset = self._uleb128(offset)
+                items.append((address, -1, self._local_line(register(number), name_idx - 1, type_idx - 1,
+                                                            signature_idx - 1)))
+            elif opcode in (0x05, 0x06):  # DBG_END_LOCAL, DBG_RESTART_LOCAL
+                _, offset = self._uleb128(offset)
+                items.append((address, -1, RESET))
+            elif opcode in (0x07, 0x08):  # DBG_SET_PROLOGUE_END, DBG_SET_EPILOGUE_BEGIN
+                items.append((address, -4, RESET))
+            elif opcode == 0x09:  # DBG_SET_FILE
+                _, offset = self._uleb128(offset)
+                items.append((address, -3, RESET))
+            else:  # special opcodes only add a .line, which SmaliParser ignores
+                address += (opcode - 0x0a) // 15
+        return items
+
+    def _local_line(self, register_name, name_idx, type_idx, signature_idx):
+        line = ".local {0}".format(register_name)
+        if name_idx < 0 and type_idx < 0 and signature_idx < 0:
+            return line
+        line += ', "{0}"'.format(self._escaped_string(name_idx)) if name_idx >= 0 else ", null"
+        line += ":{0}".format(self.get_type(type_idx) if type_idx >= 0 else "V")
+        if signature_idx >= 0:
+            line += ', "{0}"'.format(self._escaped_string(signature_idx))
+        return line
+
+
+def _dex_file_order(name):
+    number = DEX_FILE_PATTERN.match(os.path.basename(name)).group(1)
+    return int(number) if number else 1
+
+
+def _open_dex(path, name, data, offset=0):
+    """
+    :return: a DexParser for the dex file, or None (and the error is logged) if its header is malformed
+    :rtype: DexParser
+    """
+    try:
+        return DexParser(data, offset)
+    except (DexFormatError, struct.error, IndexError) as e:
+        logging.error("Unable to parse {0} in {1}: {2}".format(name, path, e))
+        return None
+
+
+def iter_dex_files(path):
+    """
+    Opens the dex files (classes.dex, classes2.dex, ...) of an apk, or of a folder where apktool decoded an apk
+    without disassembling the code (apktool d -s); the files that aren't valid dex files are logged and skipped
+
+    :param path: path of an apk or of a folder
+    :return: generator of (file name, DexParser) tuples; the parsers can only be used until the next one is yielded
+    """
+    if os.path.isdir(path):
+        names = sorted((name for name in os.listdir(path) if DEX_FILE_PATTERN.match(name)), key=_dex_file_order)
+        for name in names:
+            with open(os.path.join(path, name), "rb") as f:
+                try:
+                    data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                except ValueError:  # empty file
+                    logging.error("Empty dex file {0}".format(os.path.join(path, name)))
+                    continue
+                with data:
+                    parser = _open_dex(path, name, data)
+                    if parser is not None:
+                        yield name, parser
+        return
+    with zipfile.ZipFile(path) as apk, open(path, "rb") as f:
+        infos = sorted((info for info in apk.infolist() if DEX_FILE_PATTERN.match(info.filename)),
+                       key=lambda i: _dex_file_order(i.filename))
+        if not infos:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            for info in infos:
+                if info.compress_type == zipfile.ZIP_STORED:
+                    # the dex file can be read in place, right after its local file header
+                    name_length, extra_length = struct.unpack_from("<2H", data, info.header_offset + 26)
+                    parser = _open_dex(path, info.filename, data, info.header_offset + 30 + name_length + extra_length)
+                else:
+                    parser = _open_dex(path, info.filename, apk.read(info))
+                if parser is not None:
+                    yield info.filename, parser
+
+
+def get_dex_strings(path, class_prefix=""):
+    """
+    Extracts the strings of the classes contained in the dex files of an apk
+
+    :param path: path of an apk or of a folder containing its dex files (see iter_dex_files)
+    :param class_prefix: only the classes whose descriptor starts with this prefix are considered
+    :return: the strings found and whether at least one class matched the prefix
+    :rtype: (list of SmaliString, bool)
+    """
+    strings = []
+    class_found = False
+    for name, parser in iter_dex_files(path):
+        try:
+            for index, descriptor in enumerate(parser.get_class_descriptors()):
+                if descriptor.startswith(class_prefix):
+                    class_found = True
+                    strings += parse_lines(parser.get_class_lines(index))
+        except (DexFormatError, struct.error, IndexError) as e:
+            logging.error("Unable to parse {0} in {1}: {2}".format(name, path, e))
+    return strings, class_found
+
+
+def main(argv):
+    if len(argv) < 2:
+        print("Usage: python {0} path/to/apk/or/classes.dex [class descriptor prefix]".format(argv[0]))
+        return
+    logging.basicConfig(level=logging.INFO)
+    prefix = argv[2] if len(argv) > 2 else ""
+    if os.path.isfile(argv[1]) and not zipfile.is_zipfile(argv[1]):
+        with open(argv[1], "rb") as f:
+            strings = DexParser(f.read()).get_strings(prefix)
+    else:
+        strings, _ = get_dex_strings(argv[1], prefix)
+    for s in strings:
+        print("{0}".format(s))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
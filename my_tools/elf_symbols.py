@@ -0,0 +1,90 @@
+"""
+Finds the symbol (e.g. the global const char[] or the function) that holds each string found in a native library,
+using the symbol tables of the ELF file (.dynsym, whose names are in .dynstr, and .symtab if not stripped).
+"""
+import bisect
+import sys
+
+from elftools.elf.elffile import ELFFile
+from elftools.elf.sections import SymbolTableSection
+
+from my_tools.strings_tool import strings_with_offsets
+
+SYMBOL_TABLES = [".dynsym", ".symtab"]
+SYMBOL_TYPES = {"STT_OBJECT", "STT_FUNC", "STT_TLS"}
+
+
+class SymbolIndex(object):
+    def __init__(self, elffile):
+        """
+        :param elffile: ELFFile whose symbol tables are read
+        """
+        ranges = {}
+        for table in SYMBOL_TABLES:
+            section = elffile.get_section_by_name(table)
+            if not isinstance(section, SymbolTableSection):
+                continue
+            for symbol in section.iter_symbols():
+                if symbol['st_info']['type'] not in SYMBOL_TYPES or not symbol['st_size'] or not symbol.name:
+                    continue
+                # the same symbol is usually found in both the tables
+                ranges.setdefault(symbol['st_value'], (symbol['st_value'] + symbol['st_size'], symbol.name))
+        self._starts = sorted(ranges)
+        self._ranges = [ranges[start] for start in self._starts]
+
+    def __len__(self):
+        return len(self._starts)
+
+    def lookup(self, address):
+        """
+        :param address: virtual address
+        :return: the name of the symbol whose data contains the address, or None
+        :rtype: str
+        """
+        i = bisect.bisect_right(self._starts, address) - 1
+        if i < 0:
+            return None
+        end, name = self._ranges[i]
+        return name if address < end else None
+
+
+def strings_with_symbols(file_name, sections, min_length=4):
+    """
+    Finds the strings in some sections of an ELF file, along with the symbol that holds each of them
+
+    :param file_name: path of the ELF file
+    :param sections: names of the sections to be searched
+    :param min_length: minimum length of the strings
+    :return: (string, symbol name or None) tuples
+    :rtype: generator of tuple
+    """
+    with open(file_name, 'rb') as f:
+        elffile = ELFFile(f)
+        index = SymbolIndex(elffile)
+        # file offset -> virtual address, for each section searched
+        mapping = []
+        for name in sections:
+            section = elffile.get_section_by_name(name)
+            if section:
+                mapping.append((section['sh_offset'], section['sh_offset'] + section['sh_size'], section['sh_addr']))
+    for offset, string in strings_with_offsets(file_name, sections, min_length):
+        symbol = None
+        if len(index):
+            for start, end, address in mapping:
+                if start <= offset < end:
+                    # a section without address (e.g. .comment) isn't loaded in memory, no symbol can refer to it
+                    symbol = index.lookup(address + offset - start) if address else None
+                    break
+        yield string, symbol
+
+
+def main(argv):
+    if len(argv) < 2:
+        print("Usage: python {0} path/to/lib.so [section ...]".format(argv[0]))
+        return
+    for string, symbol in strings_with_symbols(argv[1], argv[2:] or [".rodata"]):
+        print("{0}\t{1}".format(symbol or "-", string))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,36 @@
+"""
+Content hashes of files, used as keys of the persistent caches
+"""
+import hashlib
+import sys
+
+BLOCK_SIZE = 1024 * 1024
+
+
+def file_sha256(file_name, block_size=BLOCK_SIZE):
+    """
+    :param file_name: path of the file
+    :param block_size: how many bytes are read at a time
+    :return: the SHA-256 of the content of the file, as an hex string
+    :rtype: str
+    """
+    digest = hashlib.sha256()
+    with open(file_name, 'rb') as f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def main(argv):
+    if len(argv) < 2:
+        print("Usage: python {0} path/to/file [path/to/file ...]".format(argv[0]))
+        return
+    for file_name in argv[1:]:
+        print("{0}  {1}".format(file_sha256(file_name), file_name))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
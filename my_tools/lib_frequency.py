@@ -0,0 +1,98 @@
+"""
+Records in how many different packages each native library (identified by the SHA-256 of its content) was found.
+A library found in a lot of different apps is a third party one (a game engine, an ad SDK, ...), whatever its file
+name, and is not worth searching for the API keys of a specific app.
+
+The records are kept in a SQLite database that several processes can share.
+"""
+import sqlite3
+import sys
+from contextlib import closing
+
+# seconds a process waits for another one holding the lock of the database
+LOCK_TIMEOUT = 60
+
+
+class LibFrequencyTable(object):
+    def __init__(self, path):
+        """
+        :param path: path of the SQLite database; created if it doesn't exist
+        """
+        self._path = path
+        with closing(self._connect()) as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            with db:
+                db.execute("CREATE TABLE IF NOT EXISTS lib_packages ("
+                           "digest TEXT NOT NULL, "
+                           "package TEXT NOT NULL, "
+                           "name TEXT NOT NULL, "
+                           "PRIMARY KEY (digest, package, name))")
+
+    def _connect(self):
+        # a new connection for each operation: connections can't be shared by threads, nor survive a fork
+        return sqlite3.connect(self._path, timeout=LOCK_TIMEOUT)
+
+    def record(self, digest, package, name):
+        """
+        Records that a package contains a library
+
+        :param digest: SHA-256 of the library (see file_hash.file_sha256)
+        :param package: name of the package (e.g. com.example.myapp)
+        :param name: file name of the library (e.g. libexample.so)
+        :return: the number of different packages the library was found in, this one included
+        :rtype: int
+        """
+        with closing(self._connect()) as db:
+            with db:
+                db.execute("INSERT OR IGNORE INTO lib_packages (digest, package, name) VALUES (?, ?, ?)",
+                           (digest, package, name))
+                return db.execute("SELECT COUNT(DISTINCT package) FROM lib_packages WHERE digest = ?",
+                                  (digest,)).fetchone()[0]
+
+    def get_common_libs(self, threshold):
+        """
+        :param threshold: minimum number of different packages
+        :return: the libraries found in at least threshold different packages, as (name, number of packages)
+                 tuples, the most common first; a library found with different names is listed once for each name
+        :rtype: list of tuple
+        """
+        with closing(self._connect()) as db:
+            return db.execute(
+                "SELECT l.name, c.packages FROM "
+                "(SELECT digest, COUNT(DISTINCT package) AS packages FROM lib_packages GROUP BY digest "
+                " HAVING COUNT(DISTINCT package) >= ?) c "
+                "JOIN (SELECT DISTINCT digest, name FROM lib_packages) l ON l.digest = c.digest "
+                "ORDER BY c.packages DESC, l.name", (threshold,)).fetchall()
+
+
+def export_blacklist(table, threshold, blacklist_file):
+    """
+    Writes the names of the libraries found in at least threshold different packages, in the same format as
+    lib_blacklist.txt (one name for each line)
+
+    :param table: LibFrequencyTable
+    :param threshold: minimum number of different packages
+    :param blacklist_file: path of the file to be written
+    :return: the number of names written
+    :rtype: int
+    """
+    names = []
+    for name, _ in table.get_common_libs(threshold):
+        if name not in names:
+            names.append(name)
+    with open(blacklist_file, 'w', encoding='utf-8') as f:
+        for name in names:
+            f.write(name + "\n")
+    return len(names)
+
+
+def main(argv):
+    if len(argv) != 3:
+        print("Usage: python {0} path/to/lib_frequency.sqlite threshold".format(argv[0]))
+        return
+    for name, packages in LibFrequencyTable(argv[1]).get_common_libs(int(argv[2])):
+        print("{0} {1}".format(packages, name))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
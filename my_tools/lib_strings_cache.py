@@ -0,0 +1,125 @@
+"""
+Persistent cache of the strings found in native libraries, so that the same binary (e.g. a game engine or an ad
+SDK shipped by thousands of apps) is scanned only once.
+
+The cache is a SQLite database that several processes can share; the entries are keyed by the SHA-256 of the
+library and by the ELF sections searched, and the least recently used ones are evicted when the cache grows
+over its maximum size.
+"""
+import json
+import logging
+import sqlite3
+import sys
+import time
+from contextlib import closing
+
+# seconds a process waits for another one holding the lock of the database
+LOCK_TIMEOUT = 60
+# when evicting, the cache is shrunk to this fraction of its maximum size, so that it isn't done at every insert
+EVICTION_TARGET = 0.9
+
+
+class LibStringsCache(object):
+    def __init__(self, path, max_size):
+        """
+        :param path: path of the SQLite database; created if it doesn't exist
+        :param max_size: maximum size (in bytes) of the cached strings
+        """
+        self._path = path
+        self._max_size = max_size
+        with closing(self._connect()) as db:
+            # WAL lets processes read while another one is writing
+            db.execute("PRAGMA journal_mode=WAL")
+            with db:
+                db.execute("CREATE TABLE IF NOT EXISTS lib_strings ("
+                           "digest TEXT NOT NULL, "
+                           "sections TEXT NOT NULL, "
+                           "strings TEXT NOT NULL, "
+                           "size INTEGER NOT NULL, "
+                           "last_used REAL NOT NULL, "
+                           "PRIMARY KEY (digest, sections))")
+                db.execute("CREATE INDEX IF NOT EXISTS lib_strings_last_used ON lib_strings (last_used)")
+
+    def _connect(self):
+        # a new connection for each operation: connections can't be shared by threads, nor survive a fork
+        return sqlite3.connect(self._path, timeout=LOCK_TIMEOUT)
+
+    @staticmethod
+    def _sections_key(sections):
+        return json.dumps(list(sections) if sections else [])
+
+    def get(self, digest, sections):
+        """
+        :param digest: SHA-256 of the library (see file_hash.file_sha256)
+        :param sections: the ELF sections that were searched
+        :return: the cached strings, or None if the library isn't in the cache
+        :rtype: list of str
+        """
+        key = (digest, self._sections_key(sections))
+        with closing(self._connect()) as db:
+            row = db.execute("SELECT strings FROM lib_strings WHERE digest = ? AND sections = ?", key).fetchone()
+            if row is None:
+                return None
+            with db:
+                db.execute("UPDATE lib_strings SET last_used = ? WHERE digest = ? AND sections = ?",
+                           (time.time(),) + key)
+        return json.loads(row[0])
+
+    def put(self, digest, sections, values):
+        """
+        Adds the strings of a library to the cache, evicting the least recently used libraries if needed
+
+        :param digest: SHA-256 of the library (see file_hash.file_sha256)
+        :param sections: the ELF sections that were searched
+        :param values: the strings found
+        """
+        data = json.dumps(list(values))
+        size = len(data.encode('utf-8'))
+        if size > self._max_size:
+            logging.debug("Strings of library {0} too big to be cached".format(digest))
+            return
+        with closing(self._connect()) as db:
+            with db:
+                db.execute("INSERT OR REPLACE INTO lib_strings (digest, sections, strings, size, last_used) "
+                           "VALUES (?, ?, ?, ?, ?)", (digest, self._sections_key(sections), data, size, time.time()))
+                self._evict(db)
+
+    def _evict(self, db):
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM lib_strings").fetchone()[0]
+        if total <= self._max_size:
+            return
+        target = self._max_size * EVICTION_TARGET
+        evicted = []
+        for digest, sections, size in db.execute(
+                "SELECT digest, sections, size FROM lib_strings ORDER BY last_used").fetchall():
+            if total <= target:
+                break
+            evicted.append((digest, sections))
+            total -= size
+        db.executemany("DELETE FROM lib_strings WHERE digest = ? AND sections = ?", evicted)
+        logging.debug("Evicted {0} libraries from the strings cache".format(len(evicted)))
+
+    def get_stats(self):
+        """
+        :return: the number of libraries in the cache and the size of their strings
+        :rtype: tuple
+        """
+        with closing(self._connect()) as db:
+            return db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM lib_strings").fetchone()
+
+    def clear(self):
+        with closing(self._connect()) as db:
+            with db:
+                db.execute("DELETE FROM lib_strings")
+
+
+def main(argv):
+    if len(argv) != 2:
+        print("Usage: python {0} path/to/cache.sqlite".format(argv[0]))
+        return
+    count, size = LibStringsCache(argv[1], sys.maxsize).get_stats()
+    print("{0} libraries, {1} bytes of strings".format(count, size))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -1,5 +1,57 @@
 import collections
 import functools
+import threading
+
+
+class LRUCache(object):
+    """
+    A thread-safe dict that keeps at most max_size items, evicting the least recently used ones, and counts its
+    hits and misses
+    """
+
+    def __init__(self, max_size=None):
+        """
+        :param max_size: maximum number of items; None means no limit
+        """
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._items = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._items[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._items.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            if self.max_size is not None and len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def get_stats(self):
+        """
+        :return: the number of hits, the number of misses and the number of items
+        :rtype: tuple
+        """
+        return self.hits, self.misses, len(self._items)
 
 
 class Memoized(object):
@@ -8,24 +60,27 @@ class Memoized(object):
 
     Decorator. Caches a function's return value each time it is called.
     If called later with the same arguments, the cached value is returned
-    (not reevaluated).
+    (not reevaluated). With max_size, only the most recently used values are kept.
     """
 
-    def __init__(self, func):
+    _MISSING = object()
+
+    def __init__(self, func, max_size=None):
         self.func = func
-        self.cache = {}
+        self.cache = LRUCache(max_size)
+        functools.update_wrapper(self, func)
 
     def __call__(self, *args):
-        if not isinstance(args, collections.Hashable):
+        try:
+            value = self.cache.get(args, self._MISSING)
+        except TypeError:
             # uncacheable. a list, for instance.
             # better to not cache than blow up.
             return self.func(*args)
-        if args in self.cache:
-            return self.cache[args]
-        else:
+        if value is self._MISSING:
             value = self.func(*args)
-            self.cache[args] = value
-            return value
+            self.cache.put(args, value)
+        return value
 
     def __repr__(self):
         """Return the function's docstring."""
@@ -34,3 +89,12 @@ class Memoized(object):
     def __get__(self, obj, objtype):
         """Support instance methods."""
         return functools.partial(self.__call__, obj)
+
+
+def memoized(max_size=None):
+    """
+    Same as Memoized, keeping at most max_size values
+
+    :param max_size: maximum number of values cached; None means no limit
+    """
+    return functools.partial(Memoized, max_size=max_size)
@@ -0,0 +1,203 @@
+"""
+Writes jsonlines records into compressed segment files, rotated by size and age, along with an index that tells,
+for each segment, where the records of each package are.
+
+The records of each package are compressed as an independent gzip member (or zstd frame), so a reader can seek to
+the offset of a package and decompress just its records; the concatenation of the members is still a valid
+compressed file, readable by zcat/zstdcat. Every process writes its own segments, and appends a line to the shared
+index (index.jsonl) when a segment is complete; the segments not in the index are still being written.
+"""
+import datetime
+import io
+import json
+import os
+import sys
+import threading
+import time
+import zlib
+
+from flufl.lock import Lock
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+INDEX_NAME = "index.jsonl"
+LOCK_PREFIX = ".lock"
+COMPRESSIONS = {"gzip": ".jsonl.gz", "zstd": ".jsonl.zst"}
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+
+
+def _compress(compression, data):
+    if compression == "zstd":
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)  # with gzip header and trailer
+    return compressor.compress(data) + compressor.flush()
+
+
+def _decompress(compression, data):
+    if compression == "zstd":
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    return zlib.decompress(data, 16 + zlib.MAX_WBITS)
+
+
+class SegmentWriter(object):
+    def __init__(self, folder, prefix, compression="gzip", segment_size=256 * 1024 * 1024, segment_age=3600):
+        """
+        :param folder: where segments and index are written; created if it doesn't exist
+        :param prefix: prefix of the names of the segments
+        :param compression: gzip or zstd (if the zstandard package is installed)
+        :param segment_size: a segment is completed when it holds this many (uncompressed) bytes
+        :param segment_age: a segment is completed when it is this many seconds old
+        """
+        if compression not in COMPRESSIONS:
+            raise ValueError("Unknown compression: {0}".format(compression))
+        if compression == "zstd" and zstandard is None:
+            raise ImportError("zstd compression needs the zstandard package")
+        self.folder = folder
+        self.prefix = prefix
+        self.compression = compression
+        self.segment_size = segment_size
+        self.segment_age = segment_age
+        self._index_lock = Lock(os.path.join(folder, INDEX_NAME) + LOCK_PREFIX,
+                                lifetime=datetime.timedelta(seconds=600))
+        self._lock = threading.Lock()
+        self._count = 0
+        self._file = None
+        # waiting for the current segment to be complete, and ready to be called; see when_complete
+        self._callbacks = []
+        self._ready = []
+        os.makedirs(folder, exist_ok=True)
+
+    def write(self, package, records):
+        """
+        Appends the records of a package to the current segment, as a single compressed member
+
+        :param package: name of the package (e.g. com.example.myapp)
+        :param records: jsonlines records (str), without newlines
+        """
+        if not records:
+            return
+        data = "".join(record + "\n" for record in records).encode('utf-8')
+        member = _compress(self.compression, data)
+        with self._lock:
+            if self._file is None:
+                self._open()
+            offset = self._file.tell()
+            self._file.write(member)
+            self._packages.append([package, offset, len(member), len(records)])
+            self._size += len(data)
+            if self._size >= self.segment_size or time.time() - self._created >= self.segment_age:
+                self._complete()
+        self._run_ready()
+
+    def when_complete(self, callback):
+        """
+        Calls callback once the records written so far are in a complete segment, i.e. one listed in the index
+
+        :param callback: function without arguments; it may be called by another thread
+        """
+        with self._lock:
+            if self._file is not None:
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def flush(self):
+        """
+        Completes the current segment if it is older than segment_age, e.g. when no records are being written
+        """
+        with self._lock:
+            if self._file is not None and time.time() - self._created >= self.segment_age:
+                self._complete()
+        self._run_ready()
+
+    def close(self):
+        """
+        Completes the current segment, if any
+        """
+        with self._lock:
+            if self._file is not None:
+                self._complete()
+        self._run_ready()
+
+    def _open(self):
+        self._count += 1
+        self._created = time.time()
+        self._name = "{0}-{1}-{2}-{3}{4}".format(self.prefix, time.strftime("%Y%m%d%H%M%S"), os.getpid(),
+                                                 self._count, COMPRESSIONS[self.compression])
+        self._file = open(os.path.join(self.folder, self._name), 'wb')
+        self._packages = []
+        self._size = 0
+
+    def _complete(self):
+        self._file.close()
+        self._file = None
+        entry = {"segment": self._name, "compression": self.compression, "size": self._size,
+                 "packages": self._packages}
+        self._index_lock.lock()
+        try:
+            with open(os.path.join(self.folder, INDEX_NAME), 'a') as f:
+                f.write(json.dumps(entry) + "\n")
+        finally:
+            self._index_lock.unlock()
+        self._ready += self._callbacks
+        self._callbacks = []
+
+    def _run_ready(self):
+        # outside of the lock, the callbacks may take a while
+        with self._lock:
+            ready = self._ready
+            self._ready = []
+        for callback in ready:
+            callback()
+
+
+def read_index(folder):
+    """
+    :param folder: folder of the segments
+    :return: the index entries of the completed segments, oldest first
+    :rtype: list of dict
+    """
+    path = os.path.join(folder, INDEX_NAME)
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def iter_package_records(folder, package):
+    """
+    Reads the records of a package, decompressing only the parts of the segments that hold them
+
+    :param folder: folder of the segments
+    :param package: name of the package (e.g. com.example.myapp)
+    :return: the records, parsed
+    :rtype: generator of dict
+    """
+    for entry in read_index(folder):
+        with open(os.path.join(folder, entry["segment"]), 'rb') as f:
+            for name, offset, length, _ in entry["packages"]:
+                if name != package:
+                    continue
+                f.seek(offset)
+                data = _decompress(entry["compression"], f.read(length))
+                for line in io.StringIO(data.decode('utf-8')):
+                    yield json.loads(line)
+
+
+def main(argv):
+    if len(argv) == 2:
+        for entry in read_index(argv[1]):
+            print("{0}: {1} packages, {2} bytes".format(entry["segment"], len(entry["packages"]), entry["size"]))
+    elif len(argv) == 3:
+        for record in iter_package_records(argv[1], argv[2]):
+            print(json.dumps(record))
+    else:
+        print("Usage: python {0} path/to/segments/folder [package]".format(argv[0]))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -1,10 +1,54 @@
-import codecs
+import collections
+import io
+import itertools
 import logging
+import mmap
 import re
 import sys
+import threading
 
 from my_model.smali_string import SmaliString
 
+# what a line does to the state of the parser, depending on its first token
+_KIND_NONE = 0  # nothing, e.g. .line
+_KIND_RESET_STRING = 1  # ends the current const-string, but not the current array, e.g. const/4, new-array
+_KIND_RESET = 2  # ends both, e.g. most instructions, labels, comments
+_KIND_OTHER = 3  # needs the generic logic (_parse_line), e.g. .class, .field, .method
+_KIND_CONST_STRING = 4
+_KIND_APUT_OBJECT = 5
+_KIND_METHOD = 6
+_KIND_LOCALS = 7
+# the kinds from here on assign the pending strings to a variable or a method; keep them last
+_KIND_INVOKE = 8
+_KIND_IPUT_OBJECT = 9
+_KIND_SPUT_OBJECT = 10
+_KIND_LOCAL = 11
+_FAST_TOKEN_KINDS = {
+    'const-string': _KIND_CONST_STRING,
+    'const-string/jumbo': _KIND_CONST_STRING,
+    'aput-object': _KIND_APUT_OBJECT,
+    'iput-object': _KIND_IPUT_OBJECT,
+    'sput-object': _KIND_SPUT_OBJECT,
+    '.local': _KIND_LOCAL,
+    '.method': _KIND_METHOD,
+    '.locals': _KIND_LOCALS,
+}
+# tokens seen so far and their kind; bounded, since some tokens (e.g. array data) are almost unique
+MAX_CACHED_TOKENS = 10000
+_token_kinds = {}
+# smali files are read this many characters at a time
+READ_BLOCK_SIZE = 64 * 1024
+# the characters str.splitlines splits on (\r\n aside)
+_LINE_ENDS = frozenset("\n\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029")
+
+# problems met by the parser in this process (e.g. a string outside of any class), by kind; each problem is
+# logged (at DEBUG level) only when tracing, while SmaliParser logs a summary for each file
+diagnostics = collections.Counter()
+# whether the parser logs what it finds, line by line; set when a file starts, see iter_lines_strings
+_trace = False
+# the problems of the file being parsed by the current thread
+_parsing = threading.local()
+
 
 class SmaliParser(object):
     """
@@ -28,180 +72,496 @@ class SmaliParser(object):
         self._smali_file = smali_file
 
     def get_strings(self):
-        strings = []
-        with codecs.open(self._smali_file, 'r', encoding='utf8') as f:
-            current_class = None
-            current_method = None
+        return list(self.iter_strings())
+
+    def might_have_strings(self):
+        """
+        Looks for the instructions that strings come from (const-string, .field with a value) in the raw bytes of
+        the file, without parsing it; if there are none, get_strings would find nothing
+
+        :return: False if the file surely has no strings
+        :rtype: bool
+        """
+        with open(self._smali_file, 'rb') as f:
+            try:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # empty file
+                return False
+            try:
+                if data.find(b"const-string") >= 0:
+                    return True
+                # a superset of the fields with a value: the value comes after a '='
+                start = data.find(b".field")
+                while start >= 0:
+                    end = data.find(b"\n", start)
+                    if end < 0:
+                        end = len(data)
+                    if data.find(b"=", start, end) >= 0:
+                        return True
+                    start = data.find(b".field", end)
+                return False
+            finally:
+                data.close()
+
+    def iter_strings(self):
+        """
+        Same as get_strings, as a generator. The file is read a block at a time, so its lines are never all in
+        memory, but the strings are yielded once the whole file is parsed (see iter_lines_strings): the memory used
+        grows with the number of strings in the file
+
+        :rtype: generator of SmaliString
+        """
+        _parsing.problems = problems = collections.Counter()
+        try:
+            # newline='' keeps the line endings as they are, as the strings found at the end of a line keep the \r
+            with io.open(self._smali_file, 'r', encoding='utf8', newline='') as f:
+                for smali_string in iter_lines_strings(iter_file_lines(f)):
+                    yield smali_string
+        finally:
+            _parsing.problems = None
+        if problems:
+            logging.warning("Problems parsing {0}: {1}".format(self._smali_file, ", ".join(
+                "{0} (x{1})".format(problem, count) for problem, count in sorted(problems.items()))))
+
+
+def iter_strings_from_files(smali_files, prescan=False, skipped_files=None):
+    """
+    Parses several smali files, one after the other (e.g. a chunk of files given to a worker process)
+
+    :param smali_files: paths of the smali files
+    :param prescan: if True, the files that surely have no strings (see SmaliParser.might_have_strings) are not
+                    parsed
+    :param skipped_files: if not None, the files skipped by the prescan are appended to this list
+    :return: the strings found, in the same order as the files
+    :rtype: generator of SmaliString
+    """
+    for smali_file in smali_files:
+        parser = SmaliParser(smali_file)
+        if prescan and not parser.might_have_strings():
+            if skipped_files is not None:
+                skipped_files.append(smali_file)
+            continue
+        for smali_string in parser.iter_strings():
+            yield smali_string
+
+
+def iter_file_lines(f, block_size=READ_BLOCK_SIZE):
+    """
+    Reads the lines of a text file a block at a time. The lines are split exactly as str.splitlines(True)
+    would split the whole content of the file, e.g. a lone \r ends a line too.
+
+    :param f: file opened in text mode, with newline=''
+    :param block_size: how many characters are read at a time
+    :rtype: iterator of str
+    """
+    return itertools.chain.from_iterable(_iter_file_line_blocks(f, block_size))
+
+
+def _iter_file_line_blocks(f, block_size):
+    """
+    :return: the lines of the file, a list of lines for each block read
+    :rtype: generator of list of str
+    """
+    # pieces of a line that spans more than one block, joined once the line is complete
+    pieces = []
+    while True:
+        block = f.read(block_size)
+        if not block:
+            break
+        if pieces and pieces[-1][-1] == "\r" and block[0] != "\n":
+            yield ["".join(pieces)]
+            pieces = []
+        lines = block.splitlines(True)
+        last = lines.pop()
+        if lines and pieces:
+            pieces.append(lines[0])
+            lines[0] = "".join(pieces)
+            pieces = []
+        # a \r at the end of the block could be followed by the \n at the start of the next one
+        if last[-1] in _LINE_ENDS and last[-1] != "\r":
+            pieces.append(last)
+            lines.append("".join(pieces))
+            pieces = []
+        else:
+            pieces.append(last)
+        yield lines
+    if pieces:
+        yield ["".join(pieces)]
+
+
+def parse_lines(lines):
+    """
+    Extracts the strings from the lines of a smali file; the lines don't need to come from a file on disk
+    (e.g. see dex_parser)
+
+    :param lines: the lines of a single smali class
+    :return: the strings found
+    :rtype: list of SmaliString
+    """
+    return list(iter_lines_strings(lines))
+
+
+def iter_lines_strings(lines):
+    """
+    Same as parse_lines, but the lines are consumed one at a time. The strings are yielded when the lines are
+    over: a run of aput-object lines on the last string found makes the array being parsed grow backwards over
+    any of the strings before it, so any string can still be renamed by the assignment that follows
+
+    Each line is classified once, by its first token (see _classify_token), and most lines only change the
+    state of the parser without being matched against any regex. Lines that need the whole parsing logic
+    (.class, .field, .method, unusual forms of the instructions) go through _parse_line.
+
+    :param lines: the lines of a single smali class; any iterable, e.g. a generator reading a file
+    :rtype: generator of SmaliString
+    """
+    global _trace
+    _trace = logging.getLogger().isEnabledFor(logging.DEBUG)
+    strings = []
+    current_class = None
+    current_method = None
+    current_const_string = None
+    # indicates how many elements (starting from the last element f the list)
+    # are part of the array currently being parsed
+    # e.g. 3 means that the latest 3 elements in the 'strings' list are part of the same array
+    # that is still being parsed
+    current_array_reverse_index = 0
+
+    token_kinds = _token_kinds
+    for l in filter(None, map(str.lstrip, lines)):
+        token = l.partition(' ')[0]
+        kind = token_kinds.get(token)
+        if kind is None:
+            if l[0] == ':':
+                # label, not cached since label names are almost unique
+                kind = _KIND_RESET
+            else:
+                kind = _classify_token(token)
+                if len(token_kinds) < MAX_CACHED_TOKENS:
+                    token_kinds[token] = kind
+
+        if kind == _KIND_RESET:
             current_const_string = None
-            # indicates how many elements (starting from the last element f the list)
-            # are part of the array currently being parsed
-            # e.g. 3 means that the latest 3 elements in the 'strings' list are part of the same array
-            # that is still being parsed
             current_array_reverse_index = 0
-            current_call_index = 0
-
-            for l in f.readlines():
-                l = l.lstrip()
-
-                if not l:
-                    continue
-
-                if not l.startswith(('.line', '.local', 'iput-object', 'sput-object', 'invoke')):
-                    current_const_string = None
-                    if not l.startswith(('const/4', 'const-string', 'aput-object', 'new-array', 'fill-array-data')):
-                        current_array_reverse_index = 0
-
-                if l.startswith('.class'):
-                    match_class = is_class(l)
-                    if match_class:
-                        current_class = extract_class(match_class)
-
-                elif l.startswith('.field'):
-                    match_class_property = is_class_property(l)
-                    if match_class_property:
-                        field = extract_class_property(match_class_property)
-                        if not field:
-                            logging.warning("Unable to extract class property from " + l)
-                        elif field['value'] and field['value'] != 'null':  # we don't want empty strings or variables
-                            if not current_class:
-                                logging.warning("Cannot retrieve class information for local var! String: {0}".format(
-                                    current_const_string))
-                                cls = ""
-                            else:
-                                cls = current_class['name']
-                            smali_string = SmaliString(SmaliString.TYPE_STATIC_VAR, cls, "", field['property_name'],
-                                                       field['value'])
-                            strings.append(smali_string)
-                        current_const_string = None
-                        current_array_reverse_index = 0
-
-                elif l.startswith('const-string'):
-                    match_const_string = is_const_string_jumbo(l)
-                    if not match_const_string:
-                        match_const_string = is_const_string(l)
-                    if match_const_string:
-                        current_const_string = extract_const_string(match_const_string)
-                        if type(current_const_string) == list:
-                            for c in current_const_string:
-                                current_array_reverse_index += 1
-                                push_smali_string(strings, current_class, current_method, c)
-                                strings[-1].in_array = True
-                            current_const_string = None
-                        elif not current_const_string:
-                            logging.warning("Unable to extract current const string from " + l)
-                        else:
-                            push_smali_string(strings, current_class, current_method, current_const_string)
+
+        elif kind >= _KIND_INVOKE:
+            if l == token:
+                current_class, current_method, current_const_string, current_array_reverse_index = _parse_line(
+                    l, strings, current_class, current_method, current_const_string, current_array_reverse_index)
+            elif (current_const_string and not current_array_reverse_index) or \
+                    (not current_const_string and current_array_reverse_index and strings):
+                current_const_string, current_array_reverse_index = _assign_strings(
+                    kind, l, strings, current_const_string, current_array_reverse_index)
+            else:
+                current_const_string = None
+                current_array_reverse_index = 0
+
+        elif kind == _KIND_NONE:
+            pass
+
+        elif kind == _KIND_RESET_STRING:
+            current_const_string = None
+
+        elif kind == _KIND_CONST_STRING:
+            match = None
+            if l == token:
+                pass
+            elif token == 'const-string/jumbo':
+                match = regex_const_string_jumbo_line.match(l)
+            elif 'const-string/jumbo' not in l:
+                match = regex_const_string_line.match(l)
+            if not match:
+                current_class, current_method, current_const_string, current_array_reverse_index = _parse_line(
+                    l, strings, current_class, current_method, current_const_string, current_array_reverse_index)
+                continue
+            name, value = match.groups()
+            if ", " not in value:
+                if current_class and current_method:
+                    strings.append(SmaliString(SmaliString.TYPE_LOCAL_VAR, current_class['name'],
+                                               current_method['name'], name, value))
+                else:
+                    push_smali_string(strings, current_class, current_method, {'name': name, 'value': value})
+                current_const_string = True
+            else:
+                # see extract_const_string
+                for val in value.split(", "):
+                    current_array_reverse_index += 1
+                    if current_class and current_method:
+                        strings.append(SmaliString(SmaliString.TYPE_LOCAL_VAR, current_class['name'],
+                                                   current_method['name'], name, val, in_array=True))
                     else:
-                        logging.warning("unmatchable const-string: {0}".format(l))
-
-                elif l.startswith('.method'):
-                    match_class_method = is_class_method(l)
-                    if match_class_method:
-                        m = extract_class_method(match_class_method)
-                        if not m:
-                            logging.warning("Unable to extract class method from " + l)
-                        else:
-                            current_method = m
-                        current_call_index = 0
-
-                elif l.startswith('invoke'):
-                    match_method_call = is_method_call(l)
-                    if match_method_call:
-                        m = extract_method_call(match_method_call)
-                        if not m:
-                            logging.warning("Unable to extract method call from " + l)
-                        else:
-                            # Add calling method (src)
-                            m['src'] = current_method['name']
-
-                            # Add call index
-                            m['index'] = current_call_index
-                            current_call_index += 1
-
-                            if current_const_string and not current_array_reverse_index:
-                                strings[-1].parameter_of = m['to_class'] + "." + m['to_method']
-                                strings[-1].string_type = SmaliString.TYPE_METHOD_PARAMETER
-                            elif not current_const_string and current_array_reverse_index and len(strings) > 0:
-                                end_index = max(-1, len(strings) - current_array_reverse_index - 1)
-                                for i in range(len(strings) - 1, end_index, -1):
-                                    strings[i].parameter_of = m['to_class'] + "." + m['to_method']
-                                    strings[i].string_type = SmaliString.TYPE_METHOD_PARAMETER
-                            current_const_string = None
-                            current_array_reverse_index = 0
-
-                elif l.startswith('aput-object'):
-                    match_aput_object = is_aput_object(l)
-                    if match_aput_object:
-                        aput_info = extract_aput_object(match_aput_object)
-                        if not aput_info:
-                            logging.warning("Unable to extract aput object from " + l)
-                        elif strings and strings[-1].name == aput_info['reference']:
-                            strings[-1].in_array = True
-                            current_array_reverse_index += 1
-                            current_const_string = None
-                        else:
-                            current_array_reverse_index = 0
-
-                elif l.startswith('iput-object'):
-                    match_iput_object = is_iput_object(l)
-                    if match_iput_object:
-                        iput_info = extract_iput_object(match_iput_object)
-                        if not iput_info:
-                            logging.warning("Unable to extract iput object from " + l)
-                        elif current_const_string and not current_array_reverse_index:
-                            strings[-1].name = iput_info['variable_name']
-                            strings[-1].string_type = SmaliString.TYPE_INSTANCE_VAR
-                        elif not current_const_string and current_array_reverse_index and len(strings) > 0:
-                            end_index = max(-1, len(strings) - current_array_reverse_index - 1)
-                            for i in range(len(strings) - 1, end_index, -1):
-                                strings[i].name = iput_info['variable_name']
-                                strings[i].string_type = SmaliString.TYPE_INSTANCE_VAR
-                        else:
-                            pass
-                            # logging.warning("Encountered iput-object in an unexpected position in line " + l)
-                        current_const_string = None
-                        current_array_reverse_index = 0
-
-                elif l.startswith('sput-object'):
-                    match_sput_object = is_sput_object(l)
-                    if match_sput_object:
-                        sput_info = extract_sput_object(match_sput_object)
-                        if not sput_info:
-                            logging.warning("Unable to extract spunt object from " + l)
-                        elif current_const_string and not current_array_reverse_index:
-                            strings[-1].name = sput_info['variable_name']
-                            strings[-1].string_type = SmaliString.TYPE_STATIC_VAR
-                        elif not current_const_string and current_array_reverse_index and len(strings) > 0:
-                            end_index = max(-1, len(strings) - current_array_reverse_index - 1)
-                            for i in range(len(strings) - 1, end_index, -1):
-                                strings[i].name = sput_info['variable_name']
-                                strings[i].string_type = SmaliString.TYPE_STATIC_VAR
-                        else:
-                            pass
-                            # logging.warning("Encountered sput-object in an unexpected position in line " + l)
-                        current_const_string = None
-                        current_array_reverse_index = 0
-
-                elif l.startswith('.local'):
-                    match_local = is_local_debug_info(l)
-                    if match_local:
-                        local_debug_info = extract_local_debug_info(match_local)
-                        if not local_debug_info:
-                            logging.warning("Unable to extract local debug info from " + l)
-                        elif current_const_string and not current_array_reverse_index:
-                            strings[-1].name = local_debug_info['variable_name']
-                        elif not current_const_string and current_array_reverse_index and len(strings) > 0:
-                            end_index = max(-1, len(strings) - current_array_reverse_index - 1)
-                            for i in range(len(strings) - 1, end_index, -1):
-                                strings[i].name = local_debug_info['variable_name']
-                        else:
-                            pass
-                            # logging.warning("Encountered .local in an unexpected position in line " + l)
-                        current_const_string = None
-                        current_array_reverse_index = 0
-
-        f.close()
-        return strings
+                        push_smali_string(strings, current_class, current_method, {'name': name, 'value': val})
+                        strings[-1].in_array = True
+                current_const_string = None
+
+        elif kind == _KIND_APUT_OBJECT:
+            match = regex_aput_object_line.match(l) if l != token else None
+            if not match:
+                current_class, current_method, current_const_string, current_array_reverse_index = _parse_line(
+                    l, strings, current_class, current_method, current_const_string, current_array_reverse_index)
+                continue
+            current_const_string = None
+            if strings and strings[-1].name == match.group('reference'):
+                strings[-1].in_array = True
+                current_array_reverse_index += 1
+            else:
+                current_array_reverse_index = 0
+
+        elif kind == _KIND_OTHER or l == token:
+            current_class, current_method, current_const_string, current_array_reverse_index = _parse_line(
+                l, strings, current_class, current_method, current_const_string, current_array_reverse_index)
+
+        elif kind == _KIND_METHOD:
+            current_const_string = None
+            current_array_reverse_index = 0
+            match = regex_method.search(l)
+            if match:
+                current_method = extract_class_method(match.group('method')) or current_method
+
+        elif kind == _KIND_LOCALS:
+            # .locals is just a .local without a match, unless the line goes on with something else
+            if l.find('local', 2) >= 0:
+                current_class, current_method, current_const_string, current_array_reverse_index = _parse_line(
+                    l, strings, current_class, current_method, current_const_string, current_array_reverse_index)
+
+    for smali_string in strings:
+        yield smali_string
+
+
+def _classify_token(token):
+    """
+    :param token: the first token of a smali line
+    :return: what the line does to the state of the parser, one of the _KIND_* values
+    :rtype: int
+    """
+    if token in _FAST_TOKEN_KINDS:
+        return _FAST_TOKEN_KINDS[token]
+    if regex_invoke_token.match(token):
+        return _KIND_INVOKE
+    if token.startswith(('.class', '.field', 'const-string', '.method', 'invoke', 'aput-object', 'iput-object',
+                         'sput-object', '.local')):
+        return _KIND_OTHER
+    if token.startswith(('.line', '.local', 'iput-object', 'sput-object', 'invoke')):
+        return _KIND_NONE
+    if token.startswith(('const/4', 'const-string', 'aput-object', 'new-array', 'fill-array-data')):
+        return _KIND_RESET_STRING
+    return _KIND_RESET
+
+
+def _assign_strings(kind, l, strings, current_const_string, current_array_reverse_index):
+    """
+    Handles an invoke, iput-object, sput-object or .local line that comes right after a const-string (or the
+    const-strings of an array), i.e. the line that tells which variable or method the strings belong to
+
+    :return: the new current_const_string, current_array_reverse_index
+    """
+    regex, group = _ASSIGNMENT_REGEXES[kind]
+    match = regex.search(l)
+    data = match.group(group) if match else None
+    if not data:
+        return current_const_string, current_array_reverse_index
+
+    if kind == _KIND_INVOKE:
+        m = extract_method_call(data)
+        attributes = {'parameter_of': m['to_class'] + "." + m['to_method'],
+                      'string_type': SmaliString.TYPE_METHOD_PARAMETER}
+    elif kind == _KIND_IPUT_OBJECT:
+        iput_info = extract_iput_object(data)
+        if not iput_info:
+            report_problem("Unable to extract iput object", l)
+            return None, 0
+        attributes = {'name': iput_info['variable_name'], 'string_type': SmaliString.TYPE_INSTANCE_VAR}
+    elif kind == _KIND_SPUT_OBJECT:
+        sput_info = extract_sput_object(data)
+        if not sput_info:
+            report_problem("Unable to extract spunt object", l)
+            return None, 0
+        attributes = {'name': sput_info['variable_name'], 'string_type': SmaliString.TYPE_STATIC_VAR}
+    else:
+        local_debug_info = extract_local_debug_info(data)
+        if not local_debug_info:
+            report_problem("Unable to extract local debug info", l)
+            return None, 0
+        attributes = {'name': local_debug_info['variable_name']}
+
+    if current_const_string and not current_array_reverse_index:
+        assigned = strings[-1:]
+    else:
+        assigned = strings[max(0, len(strings) - current_array_reverse_index):]
+    for smali_string in assigned:
+        for key, value in attributes.items():
+            setattr(smali_string, key, value)
+    return None, 0
+
+
+def _parse_line(l, strings, current_class, current_method, current_const_string, current_array_reverse_index):
+    """
+    Parses a single (left stripped) smali line, updating the strings list
+
+    :return: the new state of the parser: current_class, current_method, current_const_string,
+             current_array_reverse_index
+    """
+    if not l.startswith(('.line', '.local', 'iput-object', 'sput-object', 'invoke')):
+        current_const_string = None
+        if not l.startswith(('const/4', 'const-string', 'aput-object', 'new-array', 'fill-array-data')):
+            current_array_reverse_index = 0
+
+    if l.startswith('.class'):
+        match_class = is_class(l)
+        if match_class:
+            current_class = extract_class(match_class)
+
+    elif l.startswith('.field'):
+        match_class_property = is_class_property(l)
+        if match_class_property:
+            field = extract_class_property(match_class_property)
+            if not field:
+                report_problem("Unable to extract class property", l)
+            elif field['value'] and field['value'] != 'null':  # we don't want empty strings or variables
+                if not current_class:
+                    report_problem("Cannot retrieve class information for local var", field)
+                    cls = ""
+                else:
+                    cls = current_class['name']
+                smali_string = SmaliString(SmaliString.TYPE_STATIC_VAR, cls, "", field['property_name'],
+                                           field['value'])
+                strings.append(smali_string)
+            current_const_string = None
+            current_array_reverse_index = 0
+
+    elif l.startswith('const-string'):
+        match_const_string = is_const_string_jumbo(l)
+        if not match_const_string:
+            match_const_string = is_const_string(l)
+        if match_const_string:
+            current_const_string = extract_const_string(match_const_string)
+            if type(current_const_string) == list:
+                for c in current_const_string:
+                    current_array_reverse_index += 1
+                    push_smali_string(strings, current_class, current_method, c)
+                    strings[-1].in_array = True
+                current_const_string = None
+            elif not current_const_string:
+                report_problem("Unable to extract current const string", l)
+            else:
+                push_smali_string(strings, current_class, current_method, current_const_string)
+        else:
+            report_problem("Unmatchable const-string", l)
+
+    elif l.startswith('.method'):
+        match_class_method = is_class_method(l)
+        if match_class_method:
+            m = extract_class_method(match_class_method)
+            if not m:
+                report_problem("Unable to extract class method", l)
+            else:
+                current_method = m
+
+    elif l.startswith('invoke'):
+        match_method_call = is_method_call(l)
+        if match_method_call:
+            m = extract_method_call(match_method_call)
+            if not m:
+                report_problem("Unable to extract method call", l)
+            else:
+                if current_const_string and not current_array_reverse_index:
+                    strings[-1].parameter_of = m['to_class'] + "." + m['to_method']
+                    strings[-1].string_type = SmaliString.TYPE_METHOD_PARAMETER
+                elif not current_const_string and current_array_reverse_index and len(strings) > 0:
+                    end_index = max(-1, len(strings) - current_array_reverse_index - 1)
+                    for i in range(len(strings) - 1, end_index, -1):
+                        strings[i].parameter_of = m['to_class'] + "." + m['to_method']
+                        strings[i].string_type = SmaliString.TYPE_METHOD_PARAMETER
+                current_const_string = None
+                current_array_reverse_index = 0
+
+    elif l.startswith('aput-object'):
+        match_aput_object = is_aput_object(l)
+        if match_aput_object:
+            aput_info = extract_aput_object(match_aput_object)
+            if not aput_info:
+                report_problem("Unable to extract aput object", l)
+            elif strings and strings[-1].name == aput_info['reference']:
+                strings[-1].in_array = True
+                current_array_reverse_index += 1
+                current_const_string = None
+            else:
+                current_array_reverse_index = 0
+
+    elif l.startswith('iput-object'):
+        match_iput_object = is_iput_object(l)
+        if match_iput_object:
+            iput_info = extract_iput_object(match_iput_object)
+            if not iput_info:
+                report_problem("Unable to extract iput object", l)
+            elif current_const_string and not current_array_reverse_index:
+                strings[-1].name = iput_info['variable_name']
+                strings[-1].string_type = SmaliString.TYPE_INSTANCE_VAR
+            elif not current_const_string and current_array_reverse_index and len(strings) > 0:
+                end_index = max(-1, len(strings) - current_array_reverse_index - 1)
+                for i in range(len(strings) - 1, end_index, -1):
+                    strings[i].name = iput_info['variable_name']
+                    strings[i].string_type = SmaliString.TYPE_INSTANCE_VAR
+            else:
+                pass
+                # logging.warning("Encountered iput-object in an unexpected position in line " + l)
+            current_const_string = None
+            current_array_reverse_index = 0
+
+    elif l.startswith('sput-object'):
+        match_sput_object = is_sput_object(l)
+        if match_sput_object:
+            sput_info = extract_sput_object(match_sput_object)
+            if not sput_info:
+                report_problem("Unable to extract spunt object", l)
+            elif current_const_string and not current_array_reverse_index:
+                strings[-1].name = sput_info['variable_name']
+                strings[-1].string_type = SmaliString.TYPE_STATIC_VAR
+            elif not current_const_string and current_array_reverse_index and len(strings) > 0:
+                end_index = max(-1, len(strings) - current_array_reverse_index - 1)
+                for i in range(len(strings) - 1, end_index, -1):
+                    strings[i].name = sput_info['variable_name']
+                    strings[i].string_type = SmaliString.TYPE_STATIC_VAR
+            else:
+                pass
+                # logging.warning("Encountered sput-object in an unexpected position in line " + l)
+            current_const_string = None
+            current_array_reverse_index = 0
+
+    elif l.startswith('.local'):
+        match_local = is_local_debug_info(l)
+        if match_local:
+            local_debug_info = extract_local_debug_info(match_local)
+            if not local_debug_info:
+                report_problem("Unable to extract local debug info", l)
+            elif current_const_string and not current_array_reverse_index:
+                strings[-1].name = local_debug_info['variable_name']
+            elif not current_const_string and current_array_reverse_index and len(strings) > 0:
+                end_index = max(-1, len(strings) - current_array_reverse_index - 1)
+                for i in range(len(strings) - 1, end_index, -1):
+                    strings[i].name = local_debug_info['variable_name']
+            else:
+                pass
+                # logging.warning("Encountered .local in an unexpected position in line " + l)
+            current_const_string = None
+            current_array_reverse_index = 0
+
+    return current_class, current_method, current_const_string, current_array_reverse_index
+
+
+def report_problem(problem, detail):
+    """
+    Counts a problem met while parsing, in diagnostics and in the summary of the file being parsed
+
+    :param problem: what went wrong, e.g. "Unable to extract iput object"; problems are counted by this text
+    :param detail: what the problem was met on, e.g. the line; logged only when tracing
+    """
+    diagnostics[problem] += 1
+    problems = getattr(_parsing, 'problems', None)
+    if problems is not None:
+        problems[problem] += 1
+    if _trace:
+        logging.debug("%s: %s", problem, detail)
 
 
 def push_smali_string(strings, current_class, current_method, current_const_string):
@@ -216,18 +576,16 @@ def push_smali_string(strings, current_class, current_method, current_const_stri
     :rtype: bool
     """
     if not current_const_string:
-        logging.debug("false")
         return False
 
     if not current_class:
-        logging.warning("Cannot retrieve class information for local var! String: {0}".format(current_const_string))
+        report_problem("Cannot retrieve class information for local var", current_const_string)
         cls = ""
     else:
         cls = current_class['name']
 
     if not current_method:
-        logging.warning(
-            "Cannot retrieve method information for local var! String: {0}".format(current_const_string))
+        report_problem("Cannot retrieve method information for local var", current_const_string)
         mthd = ""
     else:
         mthd = current_method['name']
@@ -268,6 +626,17 @@ regex_extract_iput_object = re.compile('(?P<ref>.*),\s+(?P<instance>.*),\s+(?P<p
                                        '(?P<name>[^:]*):(?P<type>[^;]*);*')
 regex_extract_sput_object = re.compile('(?P<ref>.*),\s+(?P<pkg>[^;]*);*->(?P<name>[^:]*):(?P<type>[^;]*);*')
 regex_extract_local = re.compile('(?P<var>.*),\s+"(?P<name>.*)":(?P<type>[^;]*);*(?P<signature>.*)')
+# the same as the is_* and extract_* regexes combined, for lines starting with the exact opcode
+regex_invoke_token = re.compile(r"invoke-\w")
+regex_const_string_line = re.compile(r'const-string\s+(?P<var>.*),\s+"(?P<value>.*)"')
+regex_const_string_jumbo_line = re.compile(r'const-string/jumbo\s+(?P<var>.*),\s+"(?P<value>.*)"')
+regex_aput_object_line = re.compile(r'aput-object\s+(?P<reference>.*),\s+(?P<array>.*),\s+(?P<index>.*)')
+_ASSIGNMENT_REGEXES = {
+    _KIND_INVOKE: (regex_invoke, 'invoke'),
+    _KIND_IPUT_OBJECT: (regex_ipub_object, 'iput'),
+    _KIND_SPUT_OBJECT: (regex_sput_object, 'sput'),
+    _KIND_LOCAL: (regex_local, 'local'),
+}
 
 
 def is_class(line):
@@ -280,7 +649,8 @@ def is_class(line):
     """
     match = regex_class.search(line)
     if match:
-        logging.debug("Found class: %s" % match.group('class'))
+        if _trace:
+            logging.debug("Found class: %s", match.group('class'))
         return match.group('class')
     else:
         return None
@@ -296,7 +666,8 @@ def is_class_property(line):
     """
     match = regex_property.search(line)
     if match:
-        logging.debug("Found property: %s" % match.group('property'))
+        if _trace:
+            logging.debug("Found property: %s", match.group('property'))
         return match.group('property')
     else:
         return None
@@ -312,7 +683,8 @@ def is_const_string(line):
     """
     match = regex_const_string.search(line)
     if match:
-        logging.debug("Found const-string: %s" % match.group('const'))
+        if _trace:
+            logging.debug("Found const-string: %s", match.group('const'))
         return match.group('const')
     else:
         return None
@@ -328,7 +700,8 @@ def is_const_string_jumbo(line):
     """
     match = regex_const_string_jumbo.search(line)
     if match:
-        logging.debug("Found const-string/jumbo: %s" % match.group('const'))
+        if _trace:
+            logging.debug("Found const-string/jumbo: %s", match.group('const'))
         return match.group('const')
     else:
         return None
@@ -344,7 +717,8 @@ def is_class_method(line):
     """
     match = regex_method.search(line)
     if match:
-        logging.debug("Found method: %s" % match.group('method'))
+        if _trace:
+            logging.debug("Found method: %s", match.group('method'))
         return match.group('method')
     else:
         return None
@@ -360,7 +734,8 @@ def is_method_call(line):
     """
     match = regex_invoke.search(line)
     if match:
-        logging.debug("Found invoke: %s" % match.group('invoke'))
+        if _trace:
+            logging.debug("Found invoke: %s", match.group('invoke'))
         return match.group('invoke')
     else:
         return None
@@ -376,7 +751,8 @@ def is_aput_object(line):
     """
     match = regex_aput_object.search(line)
     if match:
-        logging.debug("Found aput-object: %s" % match.group('aput'))
+        if _trace:
+            logging.debug("Found aput-object: %s", match.group('aput'))
         return match.group('aput')
     else:
         return None
@@ -392,7 +768,8 @@ def is_iput_object(line):
     """
     match = regex_ipub_object.search(line)
     if match:
-        logging.debug("Found iput-object: %s" % match.group('iput'))
+        if _trace:
+            logging.debug("Found iput-object: %s", match.group('iput'))
         return match.group('iput')
     else:
         return None
@@ -408,7 +785,8 @@ def is_sput_object(line):
     """
     match = regex_sput_object.search(line)
     if match:
-        logging.debug("Found sput-object: %s" % match.group('sput'))
+        if _trace:
+            logging.debug("Found sput-object: %s", match.group('sput'))
         return match.group('sput')
     else:
         return None
@@ -424,7 +802,8 @@ def is_local_debug_info(line):
     """
     match = regex_local.search(line)
     if match:
-        logging.debug("Found local debug info: %s" % match.group('local'))
+        if _trace:
+            logging.debug("Found local debug info: %s", match.group('local'))
         return match.group('local')
     else:
         return None
@@ -439,7 +818,8 @@ def extract_class(data):
     :rtype: dict
     """
     class_info = data.split(" ")
-    logging.debug("class_info: %s" % class_info[-1].split('/')[:-1])
+    if _trace:
+        logging.debug("class_info: %s", class_info[-1].split('/')[:-1])
     c = {
         # Last element is the class name
         'name': class_info[-1],
@@ -489,7 +869,7 @@ def extract_class_property(data):
         if dirty_value:
             match2 = regex_value.search(dirty_value)
             if not match2:
-                logging.warning("Unable to parse value for " + dirty_value)
+                report_problem("Unable to parse value", dirty_value)
             else:
                 value = match2.group('value')
                 if value.startswith('"') and value.endswith('"'):
@@ -4,11 +4,21 @@ A simple python3 implementation of Unix's strings utility, with some reverse-eng
 """
 import re
 import sys
-from mmap import ALLOCATIONGRANULARITY
 from mmap import mmap, ACCESS_READ
 
 from elftools.elf.elffile import ELFFile
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# the sections are scanned this many bytes at a time, bounding the memory used by the numpy masks
+SCAN_BLOCK_SIZE = 16 * 1024 * 1024
+
+# compiled patterns, by minimum length
+_patterns = {}
+
 
 def strings(file_name, sections=None, min_length=4):
     """
@@ -20,42 +30,130 @@ def strings(file_name, sections=None, min_length=4):
     :param min_length:
     :return:
     """
-    pattern = '([\x20-\x7E]{' + str(min_length) + '}[\x20-\x7E]*)'  # ASCII table from character space to tilde
-    pattern = pattern.encode()
-    regexp = re.compile(pattern)
+    for _, string in strings_with_offsets(file_name, sections, min_length):
+        yield string
+
+
+def strings_with_offsets(file_name, sections=None, min_length=4):
+    """
+    Same as strings, but yields the offset in the file of each string too
+
+    :return: (offset, string) tuples
+    :rtype: generator of tuple
+    """
     if not sections:
         with open(file_name, 'rb') as f, mmap(f.fileno(), 0, access=ACCESS_READ) as m:
-            for match in regexp.finditer(m):
-                yield str(match.group(0), 'utf-8')
+            for offset, string in scan(m, min_length):
+                yield offset, string
     else:
-        with open(file_name, 'rb') as f:
+        # the whole file is mapped once, and each section is scanned through a slice of the mapping
+        with open(file_name, 'rb') as f, mmap(f.fileno(), 0, access=ACCESS_READ) as m:
             elffile = ELFFile(f)
-            for section in sections:
-                try:
-                    sec = elffile.get_section_by_name(section)
-                except AttributeError:
-                    # section not found
-                    continue
-                # skip section if missing in elf file
-                if not sec:
-                    continue
-                offset = sec['sh_offset']
-                size = sec['sh_size']
-                if offset is None or size is None:
-                    continue
-                # round to allocation granularity for mmap
-                offset = max(offset - offset % ALLOCATIONGRANULARITY, 0)
-                with mmap(f.fileno(), size, access=ACCESS_READ, offset=offset) as m:
-                    for match in regexp.finditer(m):
-                        yield str(match.group(0), 'utf-8')
+            view = memoryview(m)
+            try:
+                for section in sections:
+                    try:
+                        sec = elffile.get_section_by_name(section)
+                    except AttributeError:
+                        # section not found
+                        continue
+                    # skip section if missing in elf file
+                    if not sec:
+                        continue
+                    # sections like .bss take no space in the file
+                    if sec['sh_type'] == 'SHT_NOBITS':
+                        continue
+                    offset = sec['sh_offset']
+                    size = sec['sh_size']
+                    if offset is None or size is None:
+                        continue
+                    found = scan(view[offset:offset + size], min_length)
+                    try:
+                        for string_offset, string in found:
+                            yield offset + string_offset, string
+                    finally:
+                        # the slice must be released before the mapping is closed
+                        found.close()
+            finally:
+                view.release()
+
+
+def scan_regex(data, min_length=4):
+    """
+    Finds the runs of printable ASCII characters in a buffer with a regular expression
+
+    :param data: bytes-like object, e.g. an mmap
+    :param min_length: minimum length of the strings
+    :return: (offset, string) tuples
+    :rtype: generator of tuple
+    """
+    regexp = _patterns.get(min_length)
+    if regexp is None:
+        pattern = '([\x20-\x7E]{' + str(min_length) + '}[\x20-\x7E]*)'  # ASCII table from character space to tilde
+        regexp = _patterns[min_length] = re.compile(pattern.encode())
+    for match in regexp.finditer(data):
+        yield match.start(), str(match.group(0), 'utf-8')
+
+
+def scan_numpy(data, min_length=4, block_size=SCAN_BLOCK_SIZE):
+    """
+    Finds the runs of printable ASCII characters in a buffer, exactly as scan_regex does: the printable bytes
+    are found with a vectorized mask, and only the runs at least min_length long are decoded
+
+    :param data: bytes-like object, e.g. an mmap
+    :param min_length: minimum length of the strings
+    :param block_size: how many bytes are masked at a time
+    :return: (offset, string) tuples
+    :rtype: generator of tuple
+    """
+    min_length = max(min_length, 1)
+    size = len(data)
+    # start of a run that goes on from the previous block; -1 if none
+    run_start = -1
+    for block_start in range(0, size, block_size):
+        starts, ends = _printable_runs(data, block_start, min(block_start + block_size, size), run_start >= 0)
+        if run_start >= 0:
+            if not len(ends):
+                # the whole block is part of the run
+                continue
+            if ends[0] - run_start >= min_length:
+                yield run_start, str(data[run_start:int(ends[0])], 'utf-8')
+            ends = ends[1:]
+            run_start = -1
+        if len(starts) > len(ends):
+            run_start = int(starts[-1])
+            starts = starts[:-1]
+        long_enough = ends - starts >= min_length
+        for start, end in zip(starts[long_enough].tolist(), ends[long_enough].tolist()):
+            yield start, str(data[start:end], 'utf-8')
+    if run_start >= 0 and size - run_start >= min_length:
+        yield run_start, str(data[run_start:size], 'utf-8')
+
+
+def _printable_runs(data, block_start, block_end, in_run):
+    """
+    :param in_run: whether the byte before the block is printable
+    :return: the offsets where the runs of printable bytes start and end in the block
+    :rtype: tuple
+    """
+    block = np.frombuffer(data, dtype=np.uint8, count=block_end - block_start, offset=block_start)
+    mask = np.empty(len(block) + 1, dtype=np.int8)
+    mask[0] = in_run
+    mask[1:] = (block >= 0x20) & (block <= 0x7E)
+    changes = np.diff(mask)
+    return np.flatnonzero(changes == 1) + block_start, np.flatnonzero(changes == -1) + block_start
+
+
+# the engine used by strings
+scan = scan_numpy if np is not None else scan_regex
 
 
 def main(argv):
     if len(argv) == 2:
-        for word in strings(sys.argv[1]):
+        for word in strings(argv[1]):
             print(word)
     elif len(argv) == 3:
-        for word in strings(sys.argv[1], None, sys.argv[2]):
+        for word in strings(argv[1], None, int(argv[2])):
             print(word)
     else:
         print("Usage: python {0} path/to/file [min_string_length]".format(argv[0]))
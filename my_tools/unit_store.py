@@ -0,0 +1,157 @@
+"""
+Persistent store of what was extracted from the units (smali files, strings.xml, native libraries) of the apks of
+each package, and of the verdicts of the classifier, so that a new version of an app only needs the units that
+changed since the previous versions to be analyzed.
+
+The store is a SQLite database that several processes can share; units are keyed by package, kind and SHA-256 of
+their content, verdicts by package and value. Entries not used for a while can be pruned.
+"""
+import pickle
+import sqlite3
+import sys
+import time
+from contextlib import closing
+
+# seconds a process waits for another one holding the lock of the database
+LOCK_TIMEOUT = 60
+# maximum number of parameters of a query (SQLite's default limit is 999)
+QUERY_CHUNK_SIZE = 500
+
+KIND_SMALI = "smali"
+KIND_STRINGS_XML = "strings.xml"
+KIND_NATIVE = "native"
+
+
+class UnitStore(object):
+    def __init__(self, path):
+        """
+        :param path: path of the SQLite database; created if it doesn't exist
+        """
+        self._path = path
+        with closing(self._connect()) as db:
+            # WAL lets processes read while another one is writing
+            db.execute("PRAGMA journal_mode=WAL")
+            with db:
+                db.execute("CREATE TABLE IF NOT EXISTS units ("
+                           "package TEXT NOT NULL, "
+                           "kind TEXT NOT NULL, "
+                           "digest TEXT NOT NULL, "
+                           "data BLOB NOT NULL, "
+                           "last_used REAL NOT NULL, "
+                           "PRIMARY KEY (package, kind, digest))")
+                db.execute("CREATE TABLE IF NOT EXISTS verdicts ("
+                           "package TEXT NOT NULL, "
+                           "value TEXT NOT NULL, "
+                           "prediction INTEGER NOT NULL, "
+                           "last_used REAL NOT NULL, "
+                           "PRIMARY KEY (package, value))")
+
+    def _connect(self):
+        # a new connection for each operation: connections can't be shared by threads, nor survive a fork
+        return sqlite3.connect(self._path, timeout=LOCK_TIMEOUT)
+
+    def get_units(self, package, kind, digests):
+        """
+        :param package: name of the package (e.g. com.example.myapp)
+        :param kind: kind of the units, e.g. KIND_SMALI
+        :param digests: SHA-256 of the units
+        :return: what was stored for the units already seen in the package, by digest
+        :rtype: dict
+        """
+        digests = list(set(digests))
+        found = {}
+        with closing(self._connect()) as db:
+            for i in range(0, len(digests), QUERY_CHUNK_SIZE):
+                chunk = digests[i:i + QUERY_CHUNK_SIZE]
+                rows = db.execute("SELECT digest, data FROM units WHERE package = ? AND kind = ? AND digest IN ({0})"
+                                  .format(", ".join("?" * len(chunk))), [package, kind] + chunk).fetchall()
+                for digest, data in rows:
+                    found[digest] = pickle.loads(data)
+            if found:
+                with db:
+                    db.executemany("UPDATE units SET last_used = ? WHERE package = ? AND kind = ? AND digest = ?",
+                                   [(time.time(), package, kind, digest) for digest in found])
+        return found
+
+    def put_units(self, package, kind, units):
+        """
+        :param package: name of the package (e.g. com.example.myapp)
+        :param kind: kind of the units, e.g. KIND_SMALI
+        :param units: what was extracted from each unit (any picklable object), by digest
+        """
+        now = time.time()
+        with closing(self._connect()) as db:
+            with db:
+                db.executemany("INSERT OR REPLACE INTO units (package, kind, digest, data, last_used) "
+                               "VALUES (?, ?, ?, ?, ?)",
+                               [(package, kind, digest, sqlite3.Binary(pickle.dumps(data, pickle.HIGHEST_PROTOCOL)),
+                                 now) for digest, data in units.items()])
+
+    def get_verdicts(self, package, values):
+        """
+        :param package: name of the package (e.g. com.example.myapp)
+        :param values: values of strings
+        :return: the predictions already made for the values in the package, by value
+        :rtype: dict
+        """
+        values = list(set(values))
+        found = {}
+        with closing(self._connect()) as db:
+            for i in range(0, len(values), QUERY_CHUNK_SIZE):
+                chunk = values[i:i + QUERY_CHUNK_SIZE]
+                rows = db.execute("SELECT value, prediction FROM verdicts WHERE package = ? AND value IN ({0})"
+                                  .format(", ".join("?" * len(chunk))), [package] + chunk).fetchall()
+                for value, prediction in rows:
+                    found[value] = bool(prediction)
+            if found:
+                with db:
+                    db.executemany("UPDATE verdicts SET last_used = ? WHERE package = ? AND value = ?",
+                                   [(time.time(), package, value) for value in found])
+        return found
+
+    def put_verdicts(self, package, verdicts):
+        """
+        :param package: name of the package (e.g. com.example.myapp)
+        :param verdicts: whether each value was predicted as an API key, by value
+        """
+        now = time.time()
+        with closing(self._connect()) as db:
+            with db:
+                db.executemany("INSERT OR REPLACE INTO verdicts (package, value, prediction, last_used) "
+                               "VALUES (?, ?, ?, ?)",
+                               [(package, value, int(bool(prediction)), now) for value, prediction in verdicts.items()])
+
+    def prune(self, max_age):
+        """
+        Forgets the units and verdicts not used in the last max_age seconds
+
+        :return: the number of units and of verdicts forgotten
+        :rtype: tuple
+        """
+        oldest = time.time() - max_age
+        with closing(self._connect()) as db:
+            with db:
+                units = db.execute("DELETE FROM units WHERE last_used < ?", (oldest,)).rowcount
+                verdicts = db.execute("DELETE FROM verdicts WHERE last_used < ?", (oldest,)).rowcount
+        return units, verdicts
+
+    def get_stats(self):
+        """
+        :return: the number of packages, of units and of verdicts in the store
+        :rtype: tuple
+        """
+        with closing(self._connect()) as db:
+            return (db.execute("SELECT COUNT(DISTINCT package) FROM units").fetchone()[0],
+                    db.execute("SELECT COUNT(*) FROM units").fetchone()[0],
+                    db.execute("SELECT COUNT(*) FROM verdicts").fetchone()[0])
+
+
+def main(argv):
+    if len(argv) != 2:
+        print("Usage: python {0} path/to/units.sqlite".format(argv[0]))
+        return
+    print("{0} packages, {1} units, {2} verdicts".format(*UnitStore(argv[1]).get_stats()))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,93 @@
+"""
+A minimal staged pipeline: each stage runs in its own pool of threads and stages are joined by bounded queues
+"""
+import logging
+import queue
+import threading
+
+_END = object()  # sentinel telling a stage worker that no more items will come
+
+
+class Stage(object):
+    """
+    A step of the pipeline
+    """
+
+    def __init__(self, name, function, workers=1):
+        """
+        constructor for Stage object
+
+        :param name: name of the stage, used for logging and thread names
+        :param function: called with an item; its return value is passed to the next stage, unless it is None
+        :param workers: number of threads running this stage
+        """
+        self.name = name
+        self.function = function
+        self.workers = max(1, workers)
+
+
+class Pipeline(object):
+    """
+    Runs items through a sequence of stages, so that different items can be in different stages at the same time.
+    Every queue between two stages holds at most queue_size items, so that put() blocks when the pipeline is full.
+    """
+
+    def __init__(self, stages, queue_size=1, on_error=None):
+        """
+        constructor for Pipeline object
+
+        :param stages: list of Stage objects, in order
+        :param queue_size: maximum number of items waiting in front of each stage
+        :param on_error: called with (stage, item, exception) when a stage raises an exception; the item is dropped
+        """
+        self.stages = stages
+        self.on_error = on_error
+        self._queues = [queue.Queue(maxsize=max(1, queue_size)) for _ in stages]
+        self._running = [stage.workers for stage in stages]
+        self._running_lock = threading.Lock()
+        self._threads = []
+        for index, stage in enumerate(stages):
+            for n in range(stage.workers):
+                thread = threading.Thread(target=self._work, args=(index,), name="{0}-{1}".format(stage.name, n))
+                thread.start()
+                self._threads.append(thread)
+
+    def put(self, item):
+        """
+        Feeds an item to the first stage; blocks while the first queue is full
+        """
+        self._queues[0].put(item)
+
+    def close(self):
+        """
+        Waits until every item already fed has gone through all the stages, then stops the threads
+        """
+        for _ in range(self.stages[0].workers):
+            self._queues[0].put(_END)
+        for thread in self._threads:
+            thread.join()
+
+    def _work(self, index):
+        stage = self.stages[index]
+        in_queue = self._queues[index]
+        out_queue = self._queues[index + 1] if index + 1 < len(self._queues) else None
+        while True:
+            item = in_queue.get()
+            if item is _END:
+                break
+            try:
+                result = stage.function(item)
+            except Exception as e:
+                logging.exception("Unexpected error in pipeline stage {0}".format(stage.name))
+                if self.on_error:
+                    self.on_error(stage, item, e)
+                continue
+            if result is not None and out_queue is not None:
+                out_queue.put(result)
+        with self._running_lock:
+            self._running[index] -= 1
+            last = self._running[index] == 0
+        if last and out_queue is not None:
+            # the last worker of this stage to stop tells the next stage to stop as well
+            for _ in range(self.stages[index + 1].workers):
+                out_queue.put(_END)
@@ -0,0 +1,47 @@
+"""
+Stand-in for ApktoolServer.java, speaking the same protocol without a JVM.
+"Decoding" creates the output folder with a marker file, after decoding the apks that are zip files as
+apktool_standin.py does; apks named crash.apk kill the server,
+apks named hang.apk never get a response and apks that don't exist fail.
+"""
+import os
+import sys
+import time
+import zipfile
+
+import apktool_standin
+
+
+def main():
+    protocol = sys.stdout
+    sys.stdout = sys.stderr
+    print("READY", file=protocol, flush=True)
+    for line in sys.stdin:
+        fields = line.rstrip("\n").split("\t")
+        if fields[0] == "PING":
+            print("PONG", file=protocol, flush=True)
+        elif fields[0] == "QUIT":
+            break
+        elif fields[0] == "DECODE" and len(fields) >= 3:
+            apk_path, output_path = fields[1], fields[2]
+            name = os.path.basename(apk_path)
+            print("I: Using stand-in to decode {0}".format(name), flush=True)
+            if name == "crash.apk":
+                sys.exit(1)
+            if name == "hang.apk":
+                time.sleep(60)
+            if not os.path.exists(apk_path):
+                print("ERROR\tbrut.directory.PathNotExist: {0}".format(apk_path), file=protocol, flush=True)
+                continue
+            if zipfile.is_zipfile(apk_path):
+                apktool_standin.decode(apk_path, output_path)
+            os.makedirs(output_path, exist_ok=True)
+            with open(os.path.join(output_path, "decoded.txt"), "w") as f:
+                f.write(" ".join(fields[3:]))
+            print("OK", file=protocol, flush=True)
+        else:
+            print("ERROR\tUnknown request", file=protocol, flush=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+Stand-in for "java -jar apktool.jar d apk -o output -f [options]", used by the tests of the analysis.
+The test apks (see analysis_fixture.build_apk) keep their smali files as json in classes.dex and their version as
+json in resources.arsc, the parts that a targeted decode keeps; "decoding" is extracting the apk and writing those
+back as smali files and apktool.yml. Each run is appended to the file in APKTOOL_STANDIN_LOG; apks whose name
+contains APKTOOL_STANDIN_FAIL fail.
+"""
+import json
+import os
+import shutil
+import sys
+import zipfile
+
+APKTOOL_YML = """!!brut.androlib.meta.MetaInfo
+apkFileName: {0}
+versionInfo:
+  versionCode: '{1}'
+  versionName: '{2}'
+"""
+
+
+def decode_extracted(folder, apk_name="app.apk"):
+    """
+    Turns the extracted files of a test apk into a decoded apk
+
+    :param folder: where the apk has been extracted
+    :param apk_name: name of the apk, written to apktool.yml
+    """
+    dex = os.path.join(folder, "classes.dex")
+    if os.path.exists(dex):
+        with open(dex) as f:
+            files = json.load(f)
+        os.remove(dex)
+        for path, content in files.items():
+            path = os.path.join(folder, path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w") as f:
+                f.write(content)
+    arsc = os.path.join(folder, "resources.arsc")
+    if os.path.exists(arsc):
+        with open(arsc) as f:
+            version = json.load(f)
+        os.remove(arsc)
+        with open(os.path.join(folder, "apktool.yml"), "w") as f:
+            f.write(APKTOOL_YML.format(apk_name, version["versionCode"], version["versionName"]))
+
+
+def decode(apk_path, output_path):
+    """
+    "Decodes" a test apk
+
+    :param apk_path: path of the apk
+    :param output_path: decoded apk folder, replaced if it exists
+    """
+    if os.path.exists(output_path):
+        shutil.rmtree(output_path)
+    with zipfile.ZipFile(apk_path) as apk:
+        apk.extractall(output_path)
+    decode_extracted(output_path, os.path.basename(apk_path))
+
+
+def main(argv):
+    # java -jar apktool.jar d apk -o output -f [options]
+    args = argv[argv.index("-jar") + 2:] if "-jar" in argv else argv[1:]
+    apk_path, output_path = args[1], args[args.index("-o") + 1]
+    if os.environ.get("APKTOOL_STANDIN_LOG"):
+        with open(os.environ["APKTOOL_STANDIN_LOG"], "a") as f:
+            f.write(" ".join(args) + "\n")
+    fail = os.environ.get("APKTOOL_STANDIN_FAIL")
+    if fail and fail in os.path.basename(apk_path):
+        print("brut.androlib.AndrolibException: stand-in failure", file=sys.stderr)
+        return 1
+    decode(apk_path, output_path)
+    print("I: Using stand-in to decode {0}".format(os.path.basename(apk_path)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
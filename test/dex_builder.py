@@ -0,0 +1,230 @@
+"""
+Builds small dex files for the tests, without the Android build tools.
+Only what DexParser reads is written (no map list, checksum or signature).
+"""
+import struct
+
+
+def uleb128(value):
+    out = bytearray()
+    while True:
+        byte = value & 0x7f
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+class Code(object):
+    """
+    The code of a method: body is a list of instructions (lists of 16-bit code units) and debug events, i.e.
+    ("prologue",) or ("local", register, name, type), placed at the address of the next instruction
+    """
+
+    def __init__(self, registers, ins, body):
+        self.registers = registers
+        self.ins = ins
+        self.body = body
+
+
+class DexBuilder(object):
+    def __init__(self):
+        self._strings = []
+        self._types = []
+        self._protos = []
+        self._fields = []
+        self._methods = []
+        self._classes = []
+
+    @staticmethod
+    def _index(items, item):
+        if item not in items:
+            items.append(item)
+        return items.index(item)
+
+    def string(self, value):
+        return self._index(self._strings, value)
+
+    def type(self, descriptor):
+        return self._index(self._types, self.string(descriptor))
+
+    def proto(self, return_type, parameters=()):
+        return self._index(self._protos, (self.string("V"), self.type(return_type),
+                                          tuple(self.type(p) for p in parameters)))
+
+    def field(self, cls, name, field_type):
+        return self._index(self._fields, (self.type(cls), self.type(field_type), self.string(name)))
+
+    def method(self, cls, name, return_type, parameters=()):
+        return self._index(self._methods, (self.type(cls), self.proto(return_type, parameters), self.string(name)))
+
+    def add_class(self, descriptor, static_fields=(), instance_fields=(), direct_methods=(), virtual_methods=(),
+                  static_values=()):
+        """
+        :param static_fields: field indexes
+        :param instance_fields: field indexes
+        :param direct_methods: (method index, Code or None) tuples
+        :param virtual_methods: (method index, Code or None) tuples
+        :param static_values: initial values of the first static fields, as ("string", str) or ("int", int)
+        """
+        for _, code in list(direct_methods) + list(virtual_methods):
+            for item in code.body if code else ():
+                if item[0] == "local":
+                    # the strings must all be known before build() lays out the file
+                    self.string(item[2])
+                    self.type(item[3])
+        self._classes.append((self.type(descriptor), static_fields, instance_fields, direct_methods,
+                              virtual_methods, [(kind, self.string(v) if kind == "string" else v)
+                                                for kind, v in static_values]))
+
+    def build(self):
+        data_off = 0x70 + 4 * len(self._strings) + 4 * len(self._types) + 12 * len(self._protos) + \
+                   8 * len(self._fields) + 8 * len(self._methods) + 32 * len(self._classes)
+        data = bytearray()
+
+        def place(item, alignment=1):
+            while (data_off + len(data)) % alignment:
+                data.append(0)
+            offset = data_off + len(data)
+            data.extend(item)
+            return offset
+
+        string_offsets = [place(uleb128(len(s.encode("utf-16-le")) // 2) + s.encode("utf-8") + b"\0")
+                          for s in self._strings]
+        proto_items = []
+        for shorty, return_type, parameters in self._protos:
+            parameters_off = 0
+            if parameters:
+                parameters_off = place(struct.pack("<I{0}H".format(len(parameters)), len(parameters), *parameters), 4)
+            proto_items.append(struct.pack("<3I", shorty, return_type, parameters_off))
+
+        class_items = []
+        for class_idx, static_fields, instance_fields, direct_methods, virtual_methods, values in self._classes:
+            class_data = uleb128(len(static_fields)) + uleb128(len(instance_fields)) + \
+                         uleb128(len(direct_methods)) + uleb128(len(virtual_methods))
+            for fields in (static_fields, instance_fields):
+                previous = 0
+                for field in fields:
+                    class_data += uleb128(field - previous) + uleb128(0)
+                    previous = field
+            for methods in (direct_methods, virtual_methods):
+                previous = 0
+                for method, code in methods:
+                    code_off = self._place_code(code, place) if code else 0
+                    class_data += uleb128(method - previous) + uleb128(0) + uleb128(code_off)
+                    previous = method
+            class_data_off = place(class_data)
+            static_values_off = 0
+            if values:
+                encoded = uleb128(len(values))
+                for kind, value in values:
+                    encoded += bytes([(3 << 5) | (0x17 if kind == "string" else 0x04)]) + struct.pack("<I", value)
+                static_values_off = place(encoded)
+            class_items.append(struct.pack("<8I", class_idx, 1, 0xffffffff, 0, 0xffffffff, 0, class_data_off,
+                                           static_values_off))
+
+        ids = b"".join(struct.pack("<I", o) for o in string_offsets)
+        ids += b"".join(struct.pack("<I", t) for t in self._types)
+        ids += b"".join(proto_items)
+        ids += b"".join(struct.pack("<2HI", *f) for f in self._fields)
+        ids += b"".join(struct.pack("<2HI", *m) for m in self._methods)
+        ids += b"".join(class_items)
+        offset = 0x70
+        sections = []
+        for count, size in ((len(self._strings), 4), (len(self._types), 4), (len(self._protos), 12),
+                            (len(self._fields), 8), (len(self._methods), 8), (len(self._classes), 32)):
+            sections += [count, offset if count else 0]
+            offset += count * size
+        file_size = data_off + len(data)
+        header = b"dex\n035\0" + struct.pack("<I", 0) + b"\0" * 20 + struct.pack(
+            "<6I", file_size, 0x70, 0x12345678, 0, 0, 0)
+        header += struct.pack("<12I", *sections) + struct.pack("<2I", len(data), data_off)
+        return header + ids + bytes(data)
+
+    def _place_code(self, code, place):
+        insns = []
+        debug = bytearray()
+        address = 0
+        for item in code.body:
+            if isinstance(item, tuple):
+                if len(insns) > address:
+                    debug += bytes([0x01]) + uleb128(len(insns) - address)
+                    address = len(insns)
+                if item[0] == "prologue":
+                    debug.append(0x07)
+                elif item[0] == "local":
+                    _, register, name, local_type = item
+                    debug += bytes([0x03]) + uleb128(register) + uleb128(self.string(name) + 1) + \
+                        uleb128(self.type(local_type) + 1)
+            else:
+                insns += item
+        debug_off = place(uleb128(1) + uleb128(0) + bytes(debug) + b"\0")
+        return place(struct.pack("<4H2I", code.registers, code.ins, 0, 0, debug_off, len(insns)) +
+                     struct.pack("<{0}H".format(len(insns)), *insns), 4)
+
+
+# instructions, as lists of code units
+def const_4(a, value):
+    return [0x12 | a << 8 | (value & 0xf) << 12]
+
+
+def const_string(a, string_idx):
+    return [0x1a | a << 8, string_idx]
+
+
+def const_string_jumbo(a, string_idx):
+    return [0x1b | a << 8, string_idx & 0xffff, string_idx >> 16]
+
+
+def const_class(a, type_idx):
+    return [0x1c | a << 8, type_idx]
+
+
+def move_result_object(a):
+    return [0x0c | a << 8]
+
+
+def return_void():
+    return [0x0e]
+
+
+def return_object(a):
+    return [0x11 | a << 8]
+
+
+def goto(offset):
+    return [0x28 | (offset & 0xff) << 8]
+
+
+def new_array(a, b, type_idx):
+    return [0x23 | a << 8 | b << 12, type_idx]
+
+
+def aput_object(a, b, c):
+    return [0x4d | a << 8, b | c << 8]
+
+
+def iget_object(a, b, field_idx):
+    return [0x54 | a << 8 | b << 12, field_idx]
+
+
+def iput_object(a, b, field_idx):
+    return [0x5b | a << 8 | b << 12, field_idx]
+
+
+def sput_object(a, field_idx):
+    return [0x69 | a << 8, field_idx]
+
+
+def invoke(opcode, method_idx, registers):
+    count = len(registers)
+    registers = list(registers) + [0] * (5 - count)
+    return [opcode | count << 12 | registers[4] << 8, method_idx,
+            registers[0] | registers[1] << 4 | registers[2] << 8 | registers[3] << 12]
+
+
+INVOKE_VIRTUAL = 0x6e
+INVOKE_DIRECT = 0x70
+INVOKE_STATIC = 0x71
@@ -0,0 +1,4 @@
+"""
+Stand-in for the api_key_detector package, used by the tests of the analysis (see test/analysis_fixture.py): it
+predicts as API keys the strings that look like Google API keys, e.g. AIzaSy...
+"""
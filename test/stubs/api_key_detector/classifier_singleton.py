@@ -0,0 +1,19 @@
+import threading
+
+import numpy as np
+
+
+class Classifier(object):
+    def __init__(self):
+        # number of strings classified, so that the tests can tell which ones were classified again
+        self.predicted = 0
+        self._lock = threading.Lock()
+
+    def predict(self, features):
+        features = np.asarray(features)
+        with self._lock:
+            self.predicted += len(features)
+        return (features[:, 0] > 0.5).astype(int)
+
+
+classifier = Classifier()
@@ -0,0 +1,4 @@
+def calculate_all_features(s):
+    if s is None or len(s) < 6:
+        return None
+    return float(s[1:4] == "Iza"), float(len(s)), float(len(set(s)))
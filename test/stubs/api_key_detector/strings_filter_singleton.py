@@ -0,0 +1,12 @@
+class StringsFilter(object):
+    def pre_filter(self, value):
+        return bool(value) and len(value) >= 6 and " " not in value
+
+    def pre_filter_mystring(self, mystring):
+        return self.pre_filter(mystring.value)
+
+    def post_filter_mystring(self, mystring):
+        return True
+
+
+s_filter = StringsFilter()
@@ -0,0 +1,215 @@
+import json
+import os
+import shutil
+import threading
+import time
+import unittest
+from unittest import mock
+
+from my_tools import columnar_writer
+from test.analysis_fixture import AnalysisTestCase, PACKAGE, SERVER_STANDIN_COMMAND, smali_class
+
+
+class AnalyzeApk(AnalysisTestCase):
+    """main.analyze_apk should decode and analyze an apk, whichever way it is decoded, and dump its API keys"""
+
+    def analyze(self, apk_path):
+        self.main.analyze_apk(apk_path, self.decoded_dir, self.analyzed_dir, "apktool.jar")
+
+    def assertAnalyzed(self, apk_path):
+        self.assertFalse(os.path.exists(apk_path))
+        self.assertTrue(os.path.exists(os.path.join(self.analyzed_dir, os.path.basename(apk_path))))
+        self.assertFalse(os.path.exists(os.path.join(self.decoded_dir, os.path.basename(apk_path))))
+
+    def test_subprocess(self):
+        apk_path = self.build_apk("app.apk")
+        expected = self.expected_apikeys(apk_path)
+        self.assertTrue(expected)
+        self.analyze(apk_path)
+        self.main.close_dump()
+        self.assertAnalyzed(apk_path)
+        self.assertEqual(self.dumped_apikeys(), expected)
+        self.assertEqual(len(self.apktool_runs()), 1)
+
+    def test_kept_until_written(self):
+        apk_path = self.build_apk("app.apk")
+        expected = self.expected_apikeys(apk_path)
+        self.analyze(apk_path)
+        # the records are still in memory: the apk stays where it is until they are written
+        self.assertTrue(os.path.exists(apk_path))
+        self.assertEqual(self.dumped_apikeys(), [])
+        self.main.close_dump()
+        self.assertAnalyzed(apk_path)
+        self.assertEqual(self.dumped_apikeys(), expected)
+
+    def test_columnar(self):
+        self.settings(dump_location="columnar", dump_all_strings=True,
+                      columnar={"apikeys_folder": os.path.join(self.tmp, "apikeys"),
+                                "strings_folder": os.path.join(self.tmp, "strings"), "format": "json",
+                                "file_max_age": 3600})
+        apk_path = self.build_apk("app.apk", version_code=7)
+        expected = self.expected_apikeys(apk_path)
+        self.analyze(apk_path)
+        # the rows are in a file that can't be read yet
+        self.assertTrue(os.path.exists(apk_path))
+        self.main.close_dump()
+        self.assertAnalyzed(apk_path)
+        apikeys = list(columnar_writer.iter_rows(os.path.join(self.tmp, "apikeys")))
+        self.assertEqual(sorted(json.loads(apikey)["value"] for apikey in expected),
+                         sorted(row["value"] for row in apikeys))
+        strings = list(columnar_writer.iter_rows(os.path.join(self.tmp, "strings")))
+        self.assertTrue(len(strings) > len(apikeys))
+        # the strings of each version can be told apart
+        for row in apikeys + strings:
+            self.assertEqual((PACKAGE, 7, "1.0"), (row["package"], row["versionCode"], row["versionName"]))
+
+    def test_server(self):
+        self.settings(apktool_server={"enabled": True})
+        apk_path = self.build_apk("app.apk")
+        expected = self.expected_apikeys(apk_path)
+        with mock.patch.object(self.apk_analyzer, "java_command", return_value=SERVER_STANDIN_COMMAND):
+            self.analyze(apk_path)
+        self.main.close_dump()
+        self.assertAnalyzed(apk_path)
+        self.assertEqual(self.dumped_apikeys(), expected)
+        self.assertEqual(self.apktool_runs(), [])
+
+    def test_server_fallback(self):
+        # the stand-in server dies while decoding crash.apk, which is then decoded by a new apktool process
+        self.settings(apktool_server={"enabled": True})
+        apk_path = self.build_apk("crash.apk")
+        expected = self.expected_apikeys(apk_path)
+        with mock.patch.object(self.apk_analyzer, "java_command", return_value=SERVER_STANDIN_COMMAND):
+            self.analyze(apk_path)
+        self.main.close_dump()
+        self.assertAnalyzed(apk_path)
+        self.assertEqual(self.dumped_apikeys(), expected)
+        self.assertEqual(len(self.apktool_runs()), 1)
+
+    def test_targeted(self):
+        self.settings(decode_mode="targeted")
+        apk_path = self.build_apk("app.apk")
+        expected = self.expected_apikeys(apk_path)
+        self.analyze(apk_path)
+        self.main.close_dump()
+        self.assertAnalyzed(apk_path)
+        self.assertEqual(self.dumped_apikeys(), expected)
+        runs = self.apktool_runs()
+        self.assertEqual(len(runs), 1)
+        self.assertIn(".trimmed.apk", runs[0])
+
+    def test_targeted_fallback(self):
+        # the trimmed apk fails to decode, the whole apk is decoded instead
+        self.settings(decode_mode="targeted")
+        os.environ["APKTOOL_STANDIN_FAIL"] = ".trimmed"
+        apk_path = self.build_apk("app.apk")
+        expected = self.expected_apikeys(apk_path)
+        self.analyze(apk_path)
+        self.main.close_dump()
+        self.assertAnalyzed(apk_path)
+        self.assertEqual(self.dumped_apikeys(), expected)
+        runs = self.apktool_runs()
+        self.assertEqual(len(runs), 2)
+        self.assertIn(".trimmed.apk", runs[0])
+        self.assertNotIn(".trimmed.apk", runs[1])
+
+    def test_decode_failure(self):
+        # nothing to dump, the apk is moved anyway
+        os.environ["APKTOOL_STANDIN_FAIL"] = "app"
+        apk_path = self.build_apk("app.apk")
+        self.analyze(apk_path)
+        self.assertAnalyzed(apk_path)
+        self.assertEqual(self.dumped_apikeys(), [])
+
+    def test_results_cache(self):
+        self.settings(apk_results_cache={"enabled": True})
+        apk_path = self.build_apk("app.apk")
+        copy_path = os.path.join(self.apks_dir, "copy.apk")
+        shutil.copyfile(apk_path, copy_path)
+        self.analyze(apk_path)
+        self.main.close_dump()
+        first = self.dumped_apikeys()
+        os.remove(self.dump_file)
+        # the identical apk is not decoded, its results are replayed
+        self.analyze(copy_path)
+        self.main.close_dump()
+        self.assertAnalyzed(copy_path)
+        self.assertEqual(len(self.apktool_runs()), 1)
+        self.assertTrue(first)
+        self.assertEqual(self.dumped_apikeys(), first)
+
+    def test_incremental(self):
+        self.settings(incremental={"enabled": True})
+        self.analyze(self.build_apk("app-1.apk", version_code=1))
+        # a new class, with a new API key and a new string that isn't
+        apk_path = self.build_apk("app-2.apk", version_code=2, smali=[smali_class(
+            "it/uniroma2/adidiego/apikeytestapp/NewKey", "AIzaSyNewKey_0123456789abcdefghijklmnopq",
+            ["new_string_value"])])
+        expected = self.expected_apikeys(apk_path)
+        self.main.close_dump()
+        os.remove(self.dump_file)
+        classifier = self.apk_analyzer.classifier
+        predicted = classifier.predicted
+        self.analyze(apk_path)
+        self.main.close_dump()
+        # only the values not seen in the first version are classified
+        self.assertEqual(classifier.predicted - predicted, 2)
+        self.assertTrue(any("AIzaSyNewKey" in apikey for apikey in expected))
+        self.assertEqual(self.dumped_apikeys(), expected)
+
+
+class MonitorApksFolder(AnalysisTestCase):
+    """main.monitor_apks_folder should analyze the apks, moving each one once its results are written"""
+
+    def monitor(self):
+        stop_event = threading.Event()
+        thread = threading.Thread(target=self.main.monitor_apks_folder,
+                                  args=(self.apks_dir, self.decoded_dir, self.analyzed_dir, "apktool.jar"),
+                                  kwargs={"stop_event": stop_event})
+        thread.start()
+        return stop_event, thread
+
+    def wait_analyzed(self, names, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if all(os.path.exists(os.path.join(self.analyzed_dir, name)) for name in names):
+                return True
+            time.sleep(0.1)
+        return False
+
+    def test_pipeline(self):
+        self.settings(pipeline={"enabled": True, "decode_workers": 2, "extract_workers": 2})
+        packages = ["com.example.app{0}".format(i) for i in range(3)]
+        expected = {}
+        for i, package in enumerate(packages):
+            apk_path = self.build_apk("app{0}.apk".format(i), package=package)
+            expected[package] = self.expected_apikeys(apk_path)
+        stop_event, thread = self.monitor()
+        try:
+            self.assertTrue(self.wait_analyzed(["app{0}.apk".format(i) for i in range(3)]))
+        finally:
+            stop_event.set()
+            thread.join()
+        for package in packages:
+            self.assertTrue(expected[package])
+            self.assertEqual(self.dumped_apikeys(package), expected[package])
+        self.assertEqual(len(self.apktool_runs()), 3)
+
+    def test_flush_when_idle(self):
+        # neither the size nor the age of the records would have them written
+        self.settings(jsonlines={"buffer_size": 1024 * 1024 * 1024, "flush_interval": 3600})
+        apk_path = self.build_apk("app.apk")
+        expected = self.expected_apikeys(apk_path)
+        stop_event, thread = self.monitor()
+        try:
+            self.assertTrue(self.wait_analyzed(["app.apk"]))
+            # written when there was nothing else to analyze, not when the monitoring stopped
+            self.assertEqual(self.dumped_apikeys(), expected)
+        finally:
+            stop_event.set()
+            thread.join()
+        self.assertEqual(self.dumped_apikeys(PACKAGE), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
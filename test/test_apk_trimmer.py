@@ -0,0 +1,57 @@
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+
+from my_tools.apk_trimmer import extract_native_libs, get_native_abis, write_trimmed_apk
+
+
+class TrimsApk(unittest.TestCase):
+    """apk_trimmer should keep only what the analysis needs"""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.apk = os.path.join(self.tmp, "app.apk")
+        with zipfile.ZipFile(self.apk, "w", zipfile.ZIP_DEFLATED) as apk:
+            apk.writestr("AndroidManifest.xml", b"manifest")
+            apk.writestr("resources.arsc", b"arsc")
+            apk.writestr("classes.dex", b"dex1")
+            apk.writestr("classes2.dex", b"dex2")
+            apk.writestr("res/layout/main.xml", b"layout")
+            apk.writestr("res/drawable/icon.png", b"png")
+            apk.writestr("res/drawable/button.9.png", b"9patch")
+            apk.writestr("assets/big.bin", b"asset")
+            apk.writestr("META-INF/CERT.RSA", b"cert")
+            apk.writestr("lib/armeabi-v7a/libfoo.so", b"foo-v7a")
+            apk.writestr("lib/arm64-v8a/libfoo.so", b"foo-arm64")
+            apk.writestr("lib/../../evil.so", b"evil")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_write_trimmed_apk(self):
+        trimmed = os.path.join(self.tmp, "trimmed.apk")
+        write_trimmed_apk(self.apk, trimmed)
+        with zipfile.ZipFile(trimmed) as apk:
+            self.assertEqual(sorted(apk.namelist()),
+                             ["AndroidManifest.xml", "classes.dex", "classes2.dex", "res/drawable/button.9.png",
+                              "res/drawable/icon.png", "res/layout/main.xml", "resources.arsc"])
+            self.assertEqual(apk.read("res/layout/main.xml"), b"layout")
+            self.assertEqual(apk.read("res/drawable/icon.png"), b"")
+
+    def test_write_trimmed_apk_without_dex(self):
+        trimmed = os.path.join(self.tmp, "trimmed.apk")
+        write_trimmed_apk(self.apk, trimmed, keep_dex=False)
+        with zipfile.ZipFile(trimmed) as apk:
+            self.assertNotIn("classes.dex", apk.namelist())
+            self.assertIn("AndroidManifest.xml", apk.namelist())
+
+    def test_extract_native_libs(self):
+        self.assertEqual(get_native_abis(self.apk), {"armeabi-v7a", "arm64-v8a", ".."})
+        output = os.path.join(self.tmp, "decoded")
+        extract_native_libs(self.apk, output, ["arm64-v8a", ".."])
+        with open(os.path.join(output, "lib", "arm64-v8a", "libfoo.so"), "rb") as f:
+            self.assertEqual(f.read(), b"foo-arm64")
+        self.assertFalse(os.path.exists(os.path.join(output, "lib", "armeabi-v7a")))
+        self.assertFalse(os.path.exists(os.path.join(self.tmp, "evil.so")))
@@ -0,0 +1,137 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from concurrent.futures import ProcessPoolExecutor
+
+from my_tools.apktool_server import ApktoolServer, ApktoolServerError, ApktoolServerPool, SERVER_CLASS, \
+    SERVER_SOURCE_DIR, compile_server, java_command, java_version
+
+__location__ = os.path.realpath(os.path.join(os.getcwd(), os.path.dirname(__file__)))
+
+STANDIN_COMMAND = [sys.executable, os.path.join(__location__, "apktool_server_standin.py")]
+# the tests with the real server need java, javac and apktool.jar; a real apk to decode can be given too
+APKTOOL_JAR = os.environ.get("APKTOOL_JAR", os.path.join(os.path.dirname(__location__), "apktool.jar"))
+TEST_APK = os.environ.get("APKTOOL_TEST_APK")
+HAS_JAVA = bool(shutil.which("java") and shutil.which("javac"))
+
+
+class ApktoolServerProtocol(unittest.TestCase):
+    """ApktoolServer should drive a server through its stdin/stdout protocol and survive its failures"""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.apk = os.path.join(self.tmp, "app.apk")
+        open(self.apk, "w").close()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_decode(self):
+        server = ApktoolServer(STANDIN_COMMAND)
+        server.start()
+        try:
+            self.assertTrue(server.ping())
+            output_path = os.path.join(self.tmp, "out")
+            output = server.decode(self.apk, output_path, ["-s"])
+            self.assertIn("Using stand-in to decode app.apk", output)
+            with open(os.path.join(output_path, "decoded.txt")) as f:
+                self.assertEqual(f.read(), "-s")
+        finally:
+            server.stop()
+        self.assertFalse(server.is_alive())
+
+    def test_decode_error_keeps_server_alive(self):
+        server = ApktoolServer(STANDIN_COMMAND)
+        server.start()
+        try:
+            with self.assertRaises(ApktoolServerError):
+                server.decode(os.path.join(self.tmp, "missing.apk"), os.path.join(self.tmp, "out"))
+            self.assertTrue(server.ping())
+        finally:
+            server.stop()
+
+    def test_hanging_decode_is_killed(self):
+        hang = os.path.join(self.tmp, "hang.apk")
+        open(hang, "w").close()
+        server = ApktoolServer(STANDIN_COMMAND, request_timeout=1)
+        server.start()
+        with self.assertRaises(ApktoolServerError):
+            server.decode(hang, os.path.join(self.tmp, "out"))
+        self.assertFalse(server.is_alive())
+
+    def test_pool_restarts_crashed_server(self):
+        crash = os.path.join(self.tmp, "crash.apk")
+        open(crash, "w").close()
+        pool = ApktoolServerPool(STANDIN_COMMAND, 1)
+        try:
+            with self.assertRaises(ApktoolServerError):
+                pool.decode(crash, os.path.join(self.tmp, "out"))
+            pool.decode(self.apk, os.path.join(self.tmp, "out"))
+            self.assertTrue(os.path.exists(os.path.join(self.tmp, "out", "decoded.txt")))
+        finally:
+            pool.stop()
+
+    def test_pool_gives_up_when_server_cannot_start(self):
+        pool = ApktoolServerPool([os.path.join(self.tmp, "missing-java")], 1, max_start_failures=2)
+        for _ in range(2):
+            with self.assertRaises(ApktoolServerError):
+                pool.decode(self.apk, os.path.join(self.tmp, "out"))
+        self.assertTrue(pool.broken)
+
+
+@unittest.skipUnless(HAS_JAVA, "java and javac are needed")
+class CompileServer(unittest.TestCase):
+    """Processes compiling the server at the same time should all end up with the complete class files"""
+
+    def test_concurrent_compile(self):
+        source_dir = tempfile.mkdtemp()
+        try:
+            shutil.copy(os.path.join(SERVER_SOURCE_DIR, SERVER_CLASS + ".java"), source_dir)
+            with ProcessPoolExecutor(4) as executor:
+                self.assertEqual([source_dir] * 4, list(executor.map(compile_server, [source_dir] * 4)))
+            names = os.listdir(source_dir)
+            self.assertIn(SERVER_CLASS + ".class", names)
+            self.assertFalse([name for name in names if name.startswith(".javac-")])
+        finally:
+            shutil.rmtree(source_dir)
+
+
+@unittest.skipUnless(HAS_JAVA and os.path.isfile(APKTOOL_JAR), "java, javac and apktool.jar (APKTOOL_JAR) are needed")
+class RealApktoolServer(unittest.TestCase):
+    """The real server should decode apks with apktool and survive the errors of apktool"""
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.server = ApktoolServer(java_command(APKTOOL_JAR))
+        self.server.start()
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.tmp)
+
+    def test_decode_errors(self):
+        if (java_version() or 0) >= 24:
+            self.skipTest("System.exit can't be trapped from Java 24")
+        # apktool's command line calls System.exit when the apk doesn't exist
+        with self.assertRaises(ApktoolServerError):
+            self.server.decode(os.path.join(self.tmp, "missing.apk"), os.path.join(self.tmp, "out"))
+        self.assertTrue(self.server.ping())
+        # and throws when the apk isn't a zip file
+        not_an_apk = os.path.join(self.tmp, "not_an_apk.apk")
+        with open(not_an_apk, "w") as f:
+            f.write("not a zip file")
+        with self.assertRaises(ApktoolServerError):
+            self.server.decode(not_an_apk, os.path.join(self.tmp, "out"))
+        self.assertTrue(self.server.ping())
+
+    @unittest.skipUnless(TEST_APK, "no apk to decode (APKTOOL_TEST_APK)")
+    def test_decode(self):
+        output_path = os.path.join(self.tmp, "out")
+        self.server.decode(TEST_APK, output_path, ["-s"])
+        self.assertTrue(os.path.isfile(os.path.join(output_path, "AndroidManifest.xml")))
+        # decoded twice by the same JVM
+        self.server.decode(TEST_APK, output_path, ["-s"])
+        self.assertTrue(os.path.isfile(os.path.join(output_path, "apktool.yml")))
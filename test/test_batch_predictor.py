@@ -0,0 +1,52 @@
+import threading
+import unittest
+
+import numpy as np
+
+from my_tools.batch_predictor import BatchPredictor
+
+
+class BatchPredictorTest(unittest.TestCase):
+    """BatchPredictor should predict the requests of different threads together, giving each its own results"""
+
+    def setUp(self):
+        self.calls = []
+
+    def predict(self, features):
+        self.calls.append(len(features))
+        if (features < 0).any():
+            raise ValueError("negative feature")
+        return features[:, 0] * 2
+
+    def test_concurrent_requests(self):
+        predictor = BatchPredictor(self.predict, max_batch_size=1000, max_wait=0.5)
+        results = {}
+        barrier = threading.Barrier(8)
+
+        def classify(n):
+            barrier.wait()
+            results[n] = predictor.predict(np.arange(n, n + 10).reshape(5, 2))
+
+        threads = [threading.Thread(target=classify, args=(n,)) for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        predictor.close()
+        for n in range(8):
+            self.assertEqual(list(np.arange(n, n + 10, 2) * 2), list(results[n]))
+        self.assertLess(len(self.calls), 8)
+        self.assertEqual((len(self.calls), 40), predictor.get_stats())
+
+    def test_max_batch_size(self):
+        predictor = BatchPredictor(self.predict, max_batch_size=4, max_wait=0)
+        self.assertEqual([2] * 6, list(predictor.predict(np.ones((6, 1)))))
+        predictor.close()
+        self.assertEqual([6], self.calls)
+
+    def test_error(self):
+        predictor = BatchPredictor(self.predict)
+        with self.assertRaises(ValueError):
+            predictor.predict(-np.ones((2, 1)))
+        self.assertEqual([4], list(predictor.predict(np.full((1, 1), 2))))
+        predictor.close()
@@ -0,0 +1,88 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from my_tools import columnar_writer
+from my_tools.columnar_writer import ColumnarWriter, iter_rows, list_files, TYPE_STRING, TYPE_INT, TYPE_BOOL, \
+    TYPE_STRING_LIST
+
+COLUMNS = [
+    ("package", TYPE_STRING, True),
+    ("versionCode", TYPE_INT, True),
+    ("value", TYPE_STRING, False),
+    ("in_array", TYPE_BOOL, False),
+    ("locations", TYPE_STRING_LIST, False),
+]
+
+
+class ColumnarWriterTest(unittest.TestCase):
+    """ColumnarWriter should write row groups that read back as the rows written"""
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def rows(self, n):
+        return [{"package": "com.example.app{0}".format(i % 3), "versionCode": i % 2, "value": "string {0}".format(i),
+                 "in_array": i % 4 == 0, "locations": ["arm64-v8a/libfoo.so"] if i % 5 == 0 else None,
+                 "ignored": i}
+                for i in range(n)]
+
+    def check_format(self, file_format):
+        writer = ColumnarWriter(self.folder, "strings", COLUMNS, file_format, row_group_size=10)
+        writer.write(self.rows(25))
+        # the rows of the first 2 groups are written, but the file isn't complete yet
+        self.assertEqual([], list_files(self.folder))
+        writer.write([{"value": "no package"}])
+        writer.close()
+        self.assertEqual(1, len(list_files(self.folder)))
+        expected = self.rows(25) + [{"value": "no package"}]
+        for row in expected:
+            row.pop("ignored", None)
+            for name, _, _ in COLUMNS:
+                row.setdefault(name, None)
+        self.assertEqual(expected, list(iter_rows(self.folder)))
+
+    def test_json(self):
+        self.check_format("json")
+
+    @unittest.skipIf(columnar_writer.pyarrow is None, "pyarrow is not installed")
+    def test_parquet(self):
+        self.check_format("parquet")
+
+    def test_flush(self):
+        writer = ColumnarWriter(self.folder, "strings", COLUMNS, "json", row_group_size=10, file_max_age=0)
+        writer.write(self.rows(3))
+        writer.flush(max_wait=3600)
+        self.assertEqual([], list_files(self.folder))
+        writer.flush()
+        self.assertEqual(1, len(list_files(self.folder)))
+        self.assertEqual(3, len(list(iter_rows(self.folder))))
+        self.assertFalse(any(name.endswith(columnar_writer.PART_SUFFIX) for name in os.listdir(self.folder)))
+        writer.close()
+
+
+    def test_when_complete(self):
+        writer = ColumnarWriter(self.folder, "strings", COLUMNS, "json", row_group_size=10, file_max_age=3600)
+        completed = []
+        writer.when_complete(lambda: completed.append("nothing written"))
+        writer.write(self.rows(15))
+        writer.when_complete(lambda: completed.append("rows"))
+        writer.flush(max_wait=0)
+        self.assertEqual(["nothing written"], completed)
+        writer.close()
+        self.assertEqual(["nothing written", "rows"], completed)
+        self.assertEqual(15, len(list(iter_rows(self.folder))))
+
+    def test_complete_with_rows_waiting(self):
+        writer = ColumnarWriter(self.folder, "strings", COLUMNS, "json", row_group_size=10, file_max_age=0)
+        completed = []
+        writer.write(self.rows(12))
+        writer.when_complete(lambda: completed.append("rows"))
+        # the 2 rows waiting go into the file that is completed
+        writer.flush(max_wait=3600)
+        self.assertEqual(["rows"], completed)
+        self.assertEqual(12, len(list(iter_rows(self.folder))))
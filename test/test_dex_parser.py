@@ -0,0 +1,172 @@
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+
+from my_tools.dex_parser import DexParser, get_dex_strings
+from my_tools.smali_parser import SmaliParser, parse_lines
+from test.dex_builder import Code, DexBuilder, INVOKE_DIRECT, INVOKE_STATIC, INVOKE_VIRTUAL, aput_object, \
+    const_4, const_class, const_string, const_string_jumbo, goto, iget_object, invoke, iput_object, \
+    move_result_object, new_array, return_object, return_void, sput_object
+
+__location__ = os.path.realpath(os.path.join(os.getcwd(), os.path.dirname(__file__)))
+
+JAVA_KEY = "Lit/uniroma2/adidiego/apikeytestapp/JavaKey;"
+STRING = "Ljava/lang/String;"
+STRING_ARRAY = "[Ljava/lang/String;"
+
+
+def build_java_key_dex():
+    """
+    :return: a dex file containing the same class as JavaKey.smali
+    """
+    b = DexBuilder()
+    key = "{0}IzaSyCuxR_sUTfFJZBDkIsauakeuqXaFxhbur4".format
+    static_fields = [b.field(JAVA_KEY, "API_KEY_FINAL_STATIC", STRING),
+                     b.field(JAVA_KEY, "API_KEY_FINAL_STATIC_ARRAY", STRING_ARRAY),
+                     b.field(JAVA_KEY, "apiKeyStatic", STRING),
+                     b.field(JAVA_KEY, "apiKeyStaticArray", STRING_ARRAY)]
+    instance_fields = [b.field(JAVA_KEY, "apiKeyPrivate", STRING),
+                       b.field(JAVA_KEY, "apiKeyPrivateArray", STRING_ARRAY),
+                       b.field(JAVA_KEY, "apiKeyPublic", STRING),
+                       b.field(JAVA_KEY, "apiKeyPublicArray", STRING_ARRAY)]
+    _, final_static_array, static, static_array = static_fields
+    private, private_array, public, public_array = instance_fields
+    clinit = b.method(JAVA_KEY, "<clinit>", "V")
+    init = b.method(JAVA_KEY, "<init>", "V")
+    virtual = [b.method(JAVA_KEY, name, return_type) for name, return_type in (
+        ("getGlobalPrivateKey", STRING), ("getGlobalPrivateKeyArray", STRING_ARRAY), ("getLocalKey", STRING),
+        ("getLocalKeyArray", STRING_ARRAY), ("getLocalReturnKey", STRING), ("getLocalReturnKeyArray", STRING_ARRAY),
+        ("printKey", "V"), ("printKeyArray", "V"))]
+    object_init = b.method("Ljava/lang/Object;", "<init>", "V")
+    get_simple_name = b.method("Ljava/lang/Class;", "getSimpleName", STRING)
+    log_d = b.method("Landroid/util/Log;", "d", "I", [STRING, STRING])
+    to_string = b.method("Ljava/util/Arrays;", "toString", STRING, ["[Ljava/lang/Object;"])
+    string_array = b.type(STRING_ARRAY)
+
+    def array(first, second, put):
+        # v0 = {first, second}; put v0
+        return [new_array(0, 4, string_array), const_string(1, b.string(first)), aput_object(1, 0, 2),
+                const_string(1, b.string(second)), aput_object(1, 0, 3), put(0)]
+
+    clinit_code = Code(5, 0, [("prologue",), const_4(4, 2), const_4(3, 1), const_4(2, 0),
+                              const_string(0, b.string(key("F"))), sput_object(0, static)] +
+                       array(key("T"), key("U"), lambda r: sput_object(r, static_array)) +
+                       array(key("V"), key("W"), lambda r: sput_object(r, final_static_array)) +
+                       [return_void()])
+    init_code = Code(6, 1, [("prologue",), const_4(4, 2), const_4(3, 1), const_4(2, 0),
+                            invoke(INVOKE_DIRECT, object_init, [5]),
+                            const_string(0, b.string(key("D"))), iput_object(0, 5, public)] +
+                     array(key("P"), key("Q"), lambda r: iput_object(r, 5, public_array)) +
+                     [const_string(0, b.string(key("E"))), iput_object(0, 5, private)] +
+                     array(key("R"), key("S"), lambda r: iput_object(r, 5, private_array)) +
+                     [return_void()])
+    virtual_code = [
+        Code(2, 1, [("prologue",), iget_object(0, 1, private), return_object(0)]),
+        Code(2, 1, [("prologue",), iget_object(0, 1, private_array), return_object(0)]),
+        Code(2, 1, [("prologue",), const_string(0, b.string(key("B"))),
+                    ("local", 0, "apiKeyLocal", STRING), return_object(0)]),
+        Code(4, 1, [("prologue",), const_4(1, 2), new_array(0, 1, string_array), const_4(1, 0),
+                    const_string(2, b.string(key("L"))), aput_object(2, 0, 1), const_4(1, 1),
+                    const_string(2, b.string(key("M"))), aput_object(2, 0, 1),
+                    ("local", 0, "apiKeyLocalArray", STRING_ARRAY), return_object(0)]),
+        Code(2, 1, [("prologue",), const_string(0, b.string(key("C"))), return_object(0)]),
+        Code(4, 1, [("prologue",), const_4(0, 1), new_array(0, 0, string_array), const_4(1, 0),
+                    const_string(2, b.string(key("N") + ", " + key("O"))), aput_object(2, 0, 1),
+                    return_object(0)]),
+        Code(3, 1, [("prologue",), const_class(0, b.type(JAVA_KEY)), invoke(INVOKE_VIRTUAL, get_simple_name, [0]),
+                    move_result_object(0), const_string(1, b.string(key("K"))),
+                    invoke(INVOKE_STATIC, log_d, [0, 1]), return_void()]),
+        Code(5, 1, [("prologue",), const_class(0, b.type(JAVA_KEY)), invoke(INVOKE_VIRTUAL, get_simple_name, [0]),
+                    move_result_object(0), const_4(1, 1), new_array(1, 1, string_array), const_4(2, 0),
+                    const_string(3, b.string(key("X") + ", " + key("Y"))), aput_object(3, 1, 2),
+                    invoke(INVOKE_STATIC, to_string, [1]), move_result_object(1),
+                    invoke(INVOKE_STATIC, log_d, [0, 1]), return_void()]),
+    ]
+    b.add_class(JAVA_KEY, static_fields, instance_fields, [(clinit, clinit_code), (init, init_code)],
+                list(zip(virtual, virtual_code)), static_values=[("string", key("G"))])
+    return b.build()
+
+
+class DexParserTest(unittest.TestCase):
+    """DexParser should find the same strings that SmaliParser finds in the smali code of the same class"""
+
+    def assertSameStrings(self, expected, actual):
+        self.assertEqual([s.__dict__ for s in expected], [s.__dict__ for s in actual])
+
+    def test_same_strings_as_smali(self):
+        expected = SmaliParser(os.path.join(__location__, "JavaKey.smali")).get_strings()
+        actual = DexParser(build_java_key_dex()).get_strings()
+        self.assertEqual(21, len(expected))
+        self.assertSameStrings(expected, actual)
+
+    def test_baksmali_details(self):
+        b = DexBuilder()
+        cls = "Lcom/example/Other;"
+        quote = b.field(cls, "QUOTE", STRING)
+        number = b.field(cls, "NUMBER", "I")
+        method = b.method(cls, "loop", "V")
+        code = Code(1, 0, [const_string_jumbo(0, b.string('café "quoted"\n')),
+                           # baksmali writes the .local before the label of the following goto
+                           ("local", 0, "named", STRING), sput_object(0, quote), goto(-2)])
+        b.add_class(cls, [quote, number], direct_methods=[(method, code)],
+                    static_values=[("string", "it's"), ("int", 42)])
+        smali = """
+            .class public Lcom/example/Other;
+            .field public static final QUOTE:Ljava/lang/String; = "it\\'s"
+            .field public static final NUMBER:I = 0x2a
+            .method public static loop()V
+                .registers 1
+                const-string/jumbo v0, "caf\\u00e9 \\"quoted\\"\\n"
+                .local v0, "named":Ljava/lang/String;
+                :goto_0
+                sput-object v0, Lcom/example/Other;->QUOTE:Ljava/lang/String;
+                goto :goto_0
+            .end method
+            """
+        expected = parse_lines(smali.splitlines())
+        self.assertEqual(["it\\'s", "0x2a", 'caf\\u00e9 \\"quoted\\"\\n'], [s.value for s in expected])
+        self.assertSameStrings(expected, DexParser(b.build()).get_strings())
+
+    def test_apk_and_class_prefix(self):
+        dex = build_java_key_dex()
+        folder = tempfile.mkdtemp()
+        try:
+            apk = os.path.join(folder, "test.apk")
+            with zipfile.ZipFile(apk, "w") as z:
+                z.writestr("classes.dex", dex, zipfile.ZIP_DEFLATED)
+                z.writestr("classes2.dex", dex, zipfile.ZIP_STORED)
+            strings, found = get_dex_strings(apk, "Lit/uniroma2/")
+            self.assertTrue(found)
+            self.assertEqual(42, len(strings))
+            strings, found = get_dex_strings(apk, "Lcom/example/")
+            self.assertFalse(found)
+            self.assertEqual([], strings)
+        finally:
+            shutil.rmtree(folder)
+
+    def test_corrupt_dex(self):
+        dex = build_java_key_dex()
+        # a truncated header, a wrong magic and a header cut after the magic
+        corrupt = [dex[:0x40], b"not a dex file" * 10, b"dex\n035\x00"]
+        folder = tempfile.mkdtemp()
+        try:
+            apk = os.path.join(folder, "test.apk")
+            with zipfile.ZipFile(apk, "w") as z:
+                z.writestr("classes.dex", corrupt[0], zipfile.ZIP_DEFLATED)
+                z.writestr("classes2.dex", dex, zipfile.ZIP_STORED)
+                z.writestr("classes3.dex", corrupt[1], zipfile.ZIP_STORED)
+            decoded = os.path.join(folder, "decoded")
+            os.mkdir(decoded)
+            for name, data in [("classes.dex", corrupt[2]), ("classes2.dex", dex), ("classes3.dex", corrupt[0])]:
+                with open(os.path.join(decoded, name), "wb") as f:
+                    f.write(data)
+            # the corrupt files are skipped, the strings of the valid one are still found
+            for path in (apk, decoded):
+                with self.assertLogs(level="ERROR"):
+                    strings, found = get_dex_strings(path, "Lit/uniroma2/")
+                self.assertTrue(found)
+                self.assertEqual(21, len(strings))
+        finally:
+            shutil.rmtree(folder)
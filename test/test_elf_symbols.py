@@ -0,0 +1,31 @@
+import sys
+import unittest
+
+from elftools.elf.elffile import ELFFile
+
+from my_tools.elf_symbols import SymbolIndex, strings_with_symbols
+from my_tools.strings_tool import strings
+
+with open(sys.executable, "rb") as executable:
+    IS_ELF = executable.read(4) == b"\x7fELF"
+
+
+@unittest.skipUnless(IS_ELF, "the interpreter is not an ELF file")
+class Symbols(unittest.TestCase):
+    """strings_with_symbols should find the same strings as strings, along with the symbols holding them"""
+
+    def test_lookup(self):
+        with open(sys.executable, "rb") as f:
+            elffile = ELFFile(f)
+            index = SymbolIndex(elffile)
+            symbol = next(s for s in elffile.get_section_by_name(".dynsym").iter_symbols()
+                          if s['st_info']['type'] == 'STT_OBJECT' and s['st_size'] > 1)
+        start, size = symbol['st_value'], symbol['st_size']
+        self.assertIsNotNone(index.lookup(start))
+        self.assertEqual(index.lookup(start), index.lookup(start + size - 1))
+        self.assertIsNone(index.lookup(0))
+
+    def test_strings_with_symbols(self):
+        sections = [".rodata", ".data", ".comment"]
+        found = list(strings_with_symbols(sys.executable, sections))
+        self.assertEqual(list(strings(sys.executable, sections)), [string for string, _ in found])
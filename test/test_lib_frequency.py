@@ -0,0 +1,35 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from my_tools.lib_frequency import LibFrequencyTable, export_blacklist
+
+
+class LibFrequencyTableTest(unittest.TestCase):
+    """LibFrequencyTable should count the different packages each library was found in"""
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.table = LibFrequencyTable(os.path.join(self.folder, "lib_frequency.sqlite"))
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_record(self):
+        self.assertEqual(1, self.table.record("a" * 64, "com.example.one", "libsdk.so"))
+        # another version of the same app
+        self.assertEqual(1, self.table.record("a" * 64, "com.example.one", "libsdk.so"))
+        self.assertEqual(2, self.table.record("a" * 64, "com.example.two", "librenamed.so"))
+        self.assertEqual(1, self.table.record("b" * 64, "com.example.two", "libapp.so"))
+
+    def test_export_blacklist(self):
+        for package in ("com.example.one", "com.example.two", "com.example.three"):
+            self.table.record("a" * 64, package, "libsdk.so")
+        self.table.record("a" * 64, "com.example.four", "librenamed.so")
+        self.table.record("b" * 64, "com.example.one", "libapp.so")
+        self.assertEqual([("librenamed.so", 4), ("libsdk.so", 4)], self.table.get_common_libs(2))
+        blacklist = os.path.join(self.folder, "blacklist.txt")
+        self.assertEqual(2, export_blacklist(self.table, 2, blacklist))
+        with open(blacklist) as f:
+            self.assertEqual("librenamed.so\nlibsdk.so\n", f.read())
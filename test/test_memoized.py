@@ -0,0 +1,46 @@
+import unittest
+
+from my_tools.memoized import LRUCache, Memoized, memoized
+
+
+class LRUCacheTest(unittest.TestCase):
+    """LRUCache should evict the least recently used items and count hits and misses"""
+
+    def test_eviction(self):
+        cache = LRUCache(2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        self.assertEqual(1, cache.get("a"))
+        cache.put("c", 3)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(1, cache.get("a"))
+        self.assertEqual(3, cache.get("c"))
+        self.assertEqual((3, 1, 2), cache.get_stats())
+
+
+class MemoizedTest(unittest.TestCase):
+    def test_memoized(self):
+        calls = []
+
+        @Memoized
+        def double(x):
+            calls.append(x)
+            return x * 2
+
+        self.assertEqual(4, double(2))
+        self.assertEqual(4, double(2))
+        self.assertEqual([2], calls)
+        # unhashable arguments are not cached
+        self.assertEqual([1, 1], double([1]))
+        self.assertEqual([1, 1], double([1]))
+        self.assertEqual([2, [1], [1]], calls)
+
+    def test_max_size(self):
+        @memoized(max_size=1)
+        def double(x):
+            return x * 2
+
+        double(1)
+        double(2)
+        double(1)
+        self.assertEqual((0, 3, 1), double.cache.get_stats())
@@ -0,0 +1,60 @@
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from my_tools.segment_writer import SegmentWriter, iter_package_records, read_index
+
+
+class SegmentWriterTest(unittest.TestCase):
+    """SegmentWriter should write compressed, rotated segments that can be read a package at a time"""
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def records(self, package, n):
+        return [json.dumps({"value": "{0} string {1}".format(package, i), "source": "TYPE_LIB_STRING"})
+                for i in range(n)]
+
+    def test_packages(self):
+        writer = SegmentWriter(self.folder, "all_strings", segment_size=1500)
+        for i in range(10):
+            writer.write("com.example.app{0}".format(i), self.records("app{0}".format(i), 10))
+        # no records, no member
+        writer.write("com.example.empty", [])
+        self.assertTrue(len(read_index(self.folder)) > 1)
+        writer.close()
+        index = read_index(self.folder)
+        self.assertEqual(10, sum(len(entry["packages"]) for entry in index))
+        self.assertEqual([json.loads(record) for record in self.records("app7", 10)],
+                         list(iter_package_records(self.folder, "com.example.app7")))
+        self.assertEqual([], list(iter_package_records(self.folder, "com.example.empty")))
+        # each segment is a regular gzip file
+        lines = []
+        for entry in index:
+            with gzip.open(os.path.join(self.folder, entry["segment"]), 'rt') as f:
+                lines += f.read().splitlines()
+        self.assertEqual(sum((self.records("app{0}".format(i), 10) for i in range(10)), []), lines)
+
+    def test_segment_age(self):
+        writer = SegmentWriter(self.folder, "all_strings", segment_age=0)
+        writer.write("com.example", self.records("a", 1))
+        writer.flush()
+        self.assertEqual(1, len(read_index(self.folder)))
+        writer.close()
+        self.assertEqual(1, len(read_index(self.folder)))
+
+    def test_when_complete(self):
+        writer = SegmentWriter(self.folder, "all_strings")
+        completed = []
+        writer.when_complete(lambda: completed.append("nothing written"))
+        writer.write("com.example", self.records("a", 1))
+        writer.when_complete(lambda: completed.append("com.example"))
+        self.assertEqual(["nothing written"], completed)
+        writer.close()
+        self.assertEqual(["nothing written", "com.example"], completed)
@@ -1,7 +1,12 @@
+import io
+import logging
 import os
+import shutil
+import tempfile
 import unittest
 
-from my_tools.smali_parser import SmaliParser
+import my_tools.smali_parser as smali_parser
+from my_tools.smali_parser import SmaliParser, iter_file_lines
 
 __location__ = os.path.realpath(os.path.join(os.getcwd(), os.path.dirname(__file__)))
 
@@ -195,3 +200,68 @@ class ContainsInstances(unittest.TestCase):
         self.assertTrue(contains_method_parameter)
         self.assertTrue(contains_method_parameter_array1)
         self.assertTrue(contains_method_parameter_array2)
+
+
+class StreamingParser(unittest.TestCase):
+    """Reading a smali file a block at a time should not change what SmaliParser finds"""
+
+    def test_iter_strings(self):
+        parser = SmaliParser(os.path.join(__location__, "JavaKey.smali"))
+        self.assertEqual([s.__dict__ for s in parser.get_strings()], [s.__dict__ for s in parser.iter_strings()])
+
+    def test_aput_object_run(self):
+        # each aput-object on the last string makes the array grow backwards, over strings found long before
+        for separator in (" ", "\t"):
+            lines = ['.class public La;', '.method public b()V', 'const-string v0, "a"', 'const-string v0, "b"',
+                     'const-string v0, "c"'] + ['aput-object{0}v0, v1, v2'.format(separator)] * 3 + \
+                    ['iput-object v0, p0, La;->f:I', '.end method']
+            strings = smali_parser.parse_lines(lines)
+            self.assertEqual(["a", "b", "c"], [s.value for s in strings])
+            self.assertEqual(["f", "f", "f"], [s.name for s in strings])
+            self.assertEqual(["TYPE_INSTANCE_VAR"] * 3, [getattr(s, "string_type", None) for s in strings])
+
+    def test_iter_file_lines(self):
+        text = 'const-string v0, "a"\r\n\r\n.line 1\rabc\x85\n\n' + "x" * 20 + "\r"
+        for block_size in range(1, 25):
+            lines = list(iter_file_lines(io.StringIO(text, newline=''), block_size))
+            self.assertEqual(text.splitlines(True), lines)
+
+    def test_problems_summary(self):
+        folder = tempfile.mkdtemp()
+        try:
+            smali_file = os.path.join(folder, "NoClass.smali")
+            with open(smali_file, "w") as f:
+                f.write('const-string v0, "a"\nconst-string v0, "b"\n')
+            before = smali_parser.diagnostics["Cannot retrieve class information for local var"]
+            with self.assertLogs(level=logging.WARNING) as logs:
+                strings = SmaliParser(smali_file).get_strings()
+            self.assertEqual(2, len(strings))
+            # a single line for the whole file, whatever the number of strings
+            self.assertEqual(1, len(logs.output))
+            self.assertIn("Cannot retrieve class information for local var (x2)", logs.output[0])
+            self.assertEqual(before + 2, smali_parser.diagnostics["Cannot retrieve class information for local var"])
+        finally:
+            shutil.rmtree(folder)
+
+
+class Prescan(unittest.TestCase):
+    """The prescan should skip only the smali files that can't contain any string"""
+
+    def test_prescan(self):
+        folder = tempfile.mkdtemp()
+        try:
+            logic = os.path.join(folder, "Logic.smali")
+            with open(logic, "w") as f:
+                f.write(".class public La/b;\n.field private c:I\n.method public d()V\n    return-void\n.end method\n")
+            empty = os.path.join(folder, "Empty.smali")
+            open(empty, "w").close()
+            java_key = os.path.join(__location__, "JavaKey.smali")
+            self.assertFalse(SmaliParser(logic).might_have_strings())
+            self.assertFalse(SmaliParser(empty).might_have_strings())
+            self.assertTrue(SmaliParser(java_key).might_have_strings())
+            skipped = []
+            strings = list(smali_parser.iter_strings_from_files([logic, java_key, empty], True, skipped))
+            self.assertEqual(len(SmaliParser(java_key).get_strings()), len(strings))
+            self.assertEqual([logic, empty], skipped)
+        finally:
+            shutil.rmtree(folder)
@@ -0,0 +1,42 @@
+import multiprocessing
+import os
+import unittest
+
+from test.analysis_fixture import AnalysisTestCase, smali_class
+
+
+class ParseSmaliFiles(AnalysisTestCase):
+    """parse_smali_files should find the same strings with a pool of processes, which are not forks of this one"""
+
+    def setUp(self):
+        super(ParseSmaliFiles, self).setUp()
+        self.filenames = []
+        for i in range(5):
+            path, content = smali_class("com/example/Keys{0}".format(i),
+                                        "AIzaSyKey{0}_0123456789abcdefghijkl".format(i),
+                                        ["value_{0}_{1}".format(i, j) for j in range(3)])
+            path = os.path.join(self.tmp, path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w") as f:
+                f.write(content)
+            self.filenames.append(path)
+
+    def parse(self):
+        return [[s.__dict__ for s in strings] for strings, _ in self.apk_analyzer.parse_smali_files(self.filenames)]
+
+    def test_same_strings(self):
+        self.settings(smali_parser={"workers": 1, "chunk_size": 2})
+        expected = self.parse()
+        self.assertEqual(sum(len(strings) for strings in expected), 20)
+        self.settings(smali_parser={"workers": 2})
+        self.assertEqual(self.parse(), expected)
+
+    @unittest.skipUnless("forkserver" in multiprocessing.get_all_start_methods(), "no fork server on this platform")
+    def test_not_forked(self):
+        self.settings(smali_parser={"workers": 2})
+        # the workers are children of the fork server: forking a process running other threads could deadlock
+        self.assertNotEqual(self.apk_analyzer.get_smali_executor().submit(os.getppid).result(), os.getpid())
+
+
+if __name__ == '__main__':
+    unittest.main()
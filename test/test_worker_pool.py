@@ -0,0 +1,138 @@
+import multiprocessing
+import os
+import shutil
+import signal
+import tempfile
+import threading
+import time
+import unittest
+
+from worker_pool import WorkerPool
+
+TIMEOUT = 30
+
+
+def _supervise(workers, target, folder, max_decoders=0):
+    # the supervisor has to be the main thread of its process, to handle the signals
+    WorkerPool(workers, target, (folder,), max_decoders).run(poll_interval=0.1)
+
+
+def _mark(folder, name):
+    open(os.path.join(folder, name), "w").close()
+
+
+def _idle_worker(folder, stop_event=None, decode_slots=None):
+    _mark(folder, "started-{0}".format(os.getpid()))
+    stop_event.wait()
+
+
+def _analyzing_worker(folder, stop_event=None, decode_slots=None):
+    # "analyzes" an apk at a time, until asked to stop
+    count = 0
+    while not stop_event.is_set():
+        _mark(folder, "analyzing-{0}-{1}".format(os.getpid(), count))
+        time.sleep(0.5)
+        _mark(folder, "analyzed-{0}-{1}".format(os.getpid(), count))
+        count += 1
+
+
+def _decoding_worker(folder, stop_event=None, decode_slots=None):
+    if not os.path.exists(os.path.join(folder, "crashed")):
+        # dies while two of its threads are decoding
+        decode_slots.__enter__()
+        decode_slots.__enter__()
+        _mark(folder, "crashed")
+        os._exit(1)
+
+    def decode():
+        # blocks forever if the slots of the dead worker weren't given back
+        with decode_slots:
+            with decode_slots:
+                _mark(folder, "decoded")
+
+    threading.Thread(target=decode, daemon=True).start()
+    stop_event.wait()
+
+
+@unittest.skipUnless("fork" in multiprocessing.get_all_start_methods(), "the test workers need fork")
+class WorkerPoolTest(unittest.TestCase):
+    """The supervisor should restart the workers that die, and let the running ones finish their apk on SIGTERM"""
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.supervisor = None
+
+    def tearDown(self):
+        if self.supervisor is not None and self.supervisor.is_alive():
+            self.supervisor.terminate()
+            self.supervisor.join()
+        for pid in self.pids("started-") + self.pids("analyzing-"):
+            if self.is_running(pid):
+                os.kill(pid, signal.SIGKILL)
+        shutil.rmtree(self.folder)
+
+    def supervise(self, workers, target, max_decoders=0):
+        self.supervisor = multiprocessing.get_context("fork").Process(
+            target=_supervise, args=(workers, target, self.folder, max_decoders))
+        self.supervisor.start()
+
+    def stop(self):
+        os.kill(self.supervisor.pid, signal.SIGTERM)
+        self.supervisor.join(TIMEOUT)
+        self.assertFalse(self.supervisor.is_alive())
+        self.assertEqual(0, self.supervisor.exitcode)
+
+    def pids(self, prefix):
+        return sorted(set(int(name[len(prefix):].split("-")[0]) for name in os.listdir(self.folder)
+                          if name.startswith(prefix)))
+
+    def wait_for(self, condition):
+        deadline = time.monotonic() + TIMEOUT
+        while not condition():
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.05)
+
+    @staticmethod
+    def is_running(pid):
+        try:
+            os.kill(pid, 0)
+        except OSError:
+            return False
+        # a zombie has stopped running, it is just waiting for its parent
+        try:
+            with open("/proc/{0}/stat".format(pid)) as f:
+                return f.read().rsplit(")", 1)[1].split()[0] != "Z"
+        except IOError:
+            return True
+
+    def test_restart(self):
+        self.supervise(2, _idle_worker)
+        self.wait_for(lambda: len(self.pids("started-")) == 2)
+        killed = self.pids("started-")[0]
+        os.kill(killed, signal.SIGKILL)
+        # a new worker takes its place
+        self.wait_for(lambda: len(self.pids("started-")) == 3)
+        self.stop()
+        for pid in self.pids("started-"):
+            self.assertFalse(self.is_running(pid))
+
+    def test_sigterm(self):
+        self.supervise(2, _analyzing_worker)
+        self.wait_for(lambda: len(self.pids("analyzing-")) == 2)
+        self.stop()
+        # the apks being analyzed when the signal came are complete, and no worker is left
+        analyzing = set(name[len("analyzing-"):] for name in os.listdir(self.folder) if name.startswith("analyzing-"))
+        analyzed = set(name[len("analyzed-"):] for name in os.listdir(self.folder) if name.startswith("analyzed-"))
+        self.assertEqual(analyzing, analyzed)
+        for pid in self.pids("analyzing-"):
+            self.assertFalse(self.is_running(pid))
+
+    def test_decode_slots_of_dead_worker(self):
+        # the dead worker held both slots, the restarted one needs both
+        self.supervise(1, _decoding_worker, max_decoders=2)
+        self.wait_for(lambda: os.path.exists(os.path.join(self.folder, "decoded")))
+        self.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,174 @@
+"""
+Supervisor for a pool of analysis worker processes
+"""
+import logging
+import multiprocessing
+import signal
+import time
+
+SHUTDOWN_TIMEOUT = 600  # seconds given to the workers to finish the apk they are analyzing
+
+
+class DecodeSlots(object):
+    """
+    Caps the number of apktool instances running at the same time across all the workers.
+
+    Each worker holds its own DecodeSlots view over a shared semaphore; the view counts the slots the worker is
+    currently holding (its pipeline threads may hold several), so that the supervisor can give them back if the
+    worker dies.
+    """
+
+    def __init__(self, semaphore, holders, index):
+        """
+        constructor for DecodeSlots object
+
+        :param semaphore: semaphore shared between all the workers
+        :param holders: shared array with the number of slots held by each worker
+        :param index: index of the worker this view belongs to
+        """
+        self._semaphore = semaphore
+        self._holders = holders
+        self._index = index
+
+    def __enter__(self):
+        self._semaphore.acquire()
+        with self._holders.get_lock():
+            self._holders[self._index] += 1
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        with self._holders.get_lock():
+            self._holders[self._index] -= 1
+        self._semaphore.release()
+        return False
+
+
+class StopEvent(object):
+    """
+    Flag asking the workers to stop, with the is_set/set/wait interface of multiprocessing.Event.
+
+    multiprocessing.Event.set() waits for every process sleeping in wait() to wake up, so it hangs forever if one of
+    them was killed while waiting; this one is a plain shared byte that wait() polls.
+    """
+
+    def __init__(self, poll_interval=0.1):
+        """
+        constructor for StopEvent object
+
+        :param poll_interval: seconds between two checks of the flag in wait()
+        """
+        self._flag = multiprocessing.RawValue('b', 0)
+        self.poll_interval = poll_interval
+
+    def is_set(self):
+        return bool(self._flag.value)
+
+    def set(self):
+        self._flag.value = 1
+
+    def wait(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.is_set():
+            if deadline is None:
+                time.sleep(self.poll_interval)
+                continue
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            time.sleep(min(self.poll_interval, remaining))
+        return self.is_set()
+
+
+def _worker_main(target, args, stop_event, decode_slots):
+    # the supervisor handles SIGTERM/Ctrl+C for the whole pool and asks the workers to stop through stop_event
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    target(*args, stop_event=stop_event, decode_slots=decode_slots)
+
+
+class WorkerPool(object):
+    """
+    Runs a fixed number of worker processes, restarting the ones that crash, until a stop is requested
+    """
+
+    def __init__(self, workers, target, args, max_decoders=0):
+        """
+        constructor for WorkerPool object
+
+        :param workers: number of worker processes
+        :param target: function run by each worker; it gets args plus the stop_event and decode_slots keyword
+                       arguments and should return as soon as possible once stop_event is set
+        :param args: positional arguments for target
+        :param max_decoders: maximum number of apktool instances running at the same time; 0 means no limit
+        """
+        self.workers = workers
+        self.target = target
+        self.args = args
+        self.stop_event = StopEvent()
+        self._stop_requested = False
+        self._semaphore = None
+        self._holders = None
+        if max_decoders > 0:
+            self._semaphore = multiprocessing.BoundedSemaphore(max_decoders)
+            self._holders = multiprocessing.Array('i', workers)
+        self._processes = [None] * workers
+
+    def _start_worker(self, index):
+        decode_slots = None
+        if self._semaphore is not None:
+            decode_slots = DecodeSlots(self._semaphore, self._holders, index)
+        process = multiprocessing.Process(target=_worker_main, name="worker-{0}".format(index),
+                                          args=(self.target, self.args, self.stop_event, decode_slots))
+        process.start()
+        self._processes[index] = process
+        logging.info("Started worker {0} (pid {1})".format(index, process.pid))
+
+    def _release_orphan_slots(self, index):
+        # a worker that dies while decoding would otherwise keep its slots forever
+        if self._holders is None:
+            return
+        with self._holders.get_lock():
+            held = self._holders[index]
+            self._holders[index] = 0
+        for _ in range(held):
+            self._semaphore.release()
+
+    def stop(self, signum=None, frame=None):
+        # only set a flag: this runs as a signal handler and stop_event's internal lock is not reentrant
+        self._stop_requested = True
+
+    def run(self, poll_interval=1):
+        """
+        Starts the workers and supervises them; blocks until SIGTERM/SIGINT is received or stop() is called
+        """
+        previous_handlers = {sig: signal.signal(sig, self.stop) for sig in (signal.SIGTERM, signal.SIGINT)}
+        try:
+            while not self._stop_requested:
+                for index, process in enumerate(self._processes):
+                    if process is not None and process.is_alive():
+                        continue
+                    if process is not None:
+                        process.join()
+                        logging.error("Worker {0} (pid {1}) died with exit code {2}; restarting it".format(
+                            index, process.pid, process.exitcode))
+                        self._release_orphan_slots(index)
+                    self._start_worker(index)
+                time.sleep(poll_interval)
+            self._shutdown()
+        finally:
+            for sig, handler in previous_handlers.items():
+                signal.signal(sig, handler)
+
+    def _shutdown(self, timeout=SHUTDOWN_TIMEOUT):
+        logging.info("Stopping workers...")
+        self.stop_event.set()
+        deadline = time.time() + timeout
+        for process in self._processes:
+            if process is not None:
+                process.join(max(0, deadline - time.time()))
+        for index, process in enumerate(self._processes):
+            if process is not None and process.is_alive():
+                logging.error("Worker {0} (pid {1}) did not stop in time; terminating it".format(index, process.pid))
+                process.terminate()
+                process.join()
+        logging.info("All workers stopped")